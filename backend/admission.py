@@ -0,0 +1,128 @@
+"""
+Admission control for expensive work.
+
+Each workload class (scoring, explanation, llm) gets a concurrency limit
+and a bounded wait queue. A request that finds both full is not queued behind
+everyone else: the caller either degrades (skip SHAP, templated remark) or
+answers 503 with Retry-After.
+
+Limits are read from the environment, e.g. ADMIT_SCORING_CONCURRENCY=8,
+ADMIT_SCORING_QUEUE=32, ADMIT_SCORING_TIMEOUT=2. Admin routes are bounded by
+their own workers instead (scheduler.py).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import metrics
+
+DEFAULT_LIMITS = {
+    # class: (concurrency, queue size, max queue wait in seconds)
+    "scoring": (8, 32, 2.0),
+    "explanation": (4, 4, 0.25),
+    "llm": (2, 2, 0.5),
+}
+RETRY_AFTER_S = int(os.getenv("ADMIT_RETRY_AFTER", "2"))
+
+
+class Overloaded(Exception):
+    def __init__(self, workload, retry_after=RETRY_AFTER_S):
+        super().__init__(f"{workload} capacity exhausted")
+        self.workload = workload
+        self.retry_after = retry_after
+
+
+class AdmissionClass:
+    def __init__(self, name, concurrency, queue_size, timeout):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot, waiting in the bounded queue if needed. False if rejected."""
+        start = time.perf_counter()
+        with self._cond:
+            if self.active < self.concurrency:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue_size:
+                return False
+            self.waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self.active < self.concurrency, self.timeout)
+                if admitted:
+                    self.active += 1
+            finally:
+                self.waiting -= 1
+        metrics.observe("admission_queue_wait", time.perf_counter() - start, workload=self.name)
+        return admitted
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def status(self):
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+        }
+
+
+class AdmissionController:
+    def __init__(self, limits=None):
+        self.classes = {}
+        for name, (concurrency, queue_size, timeout) in (limits or DEFAULT_LIMITS).items():
+            prefix = f"ADMIT_{name.upper()}_"
+            self.classes[name] = AdmissionClass(
+                name,
+                int(os.getenv(prefix + "CONCURRENCY", concurrency)),
+                int(os.getenv(prefix + "QUEUE", queue_size)),
+                float(os.getenv(prefix + "TIMEOUT", timeout)),
+            )
+
+    @contextmanager
+    def admit(self, workload):
+        """Run the block in a slot of `workload` or raise Overloaded."""
+        cls = self.classes[workload]
+        if not cls.acquire():
+            metrics.inc("admission_rejected", workload=workload)
+            raise Overloaded(workload)
+        metrics.inc("admission_admitted", workload=workload)
+        try:
+            yield
+        finally:
+            cls.release()
+
+    @contextmanager
+    def try_admit(self, workload):
+        """Like admit, but yields False instead of raising so the caller can degrade."""
+        cls = self.classes[workload]
+        admitted = cls.acquire()
+        metrics.inc("admission_admitted" if admitted else "admission_rejected", workload=workload)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                cls.release()
+
+    def status(self):
+        return {name: cls.status() for name, cls in self.classes.items()}
+
+
+def mark_degraded(result, reason):
+    """Flag a response as degraded and count it."""
+    result["degraded"] = True
+    result.setdefault("degraded_reasons", []).append(reason)
+    metrics.inc("degraded_responses", reason=reason)
+    return result
+
+
+admission = AdmissionController()
@@ -1,26 +1,49 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Optional
-import os
-import pymongo
-import joblib
-import pandas as pd
 from urllib.parse import unquote
 import subprocess
+import threading
 import json
+import os
 
 from dotenv import load_dotenv
 load_dotenv()
 
 # Custom modules
-from inference_utils import infer_user, pd_to_tier, aggregate_user_scores
-
-# MongoDB connection
-client = pymongo.MongoClient(os.getenv("MONGO_URI"))
-db = client["bharatscore"]
-users_coll = db["users"]
+from inference_utils import aggregate_user_scores
+from schemas import (
+    ProfileRequest, OnboardRequest, InputData, PsychometricScoreRequest,
+    ApplicationUpdateRequest, AIInsightRequest, WhatIfRequest, MarkReadRequest,
+)
+from bulk_ingest import BulkIngestor, BULK_FORMATS, BULK_MAX_BATCH_SIZE, aiter_lines
+from export_applications import EXPORT_FORMATS, build_export_query, iter_export
+
+from model_runtime import runtime
+from admission import admission, Overloaded, mark_degraded
+from inference_slots import inference_slots
+from scheduler import scheduler
+from metrics import metrics
+from remark_engine import REMARK_MODES, template_remark
+from path_explainer import EXPLAIN_MODES
+from whatif import SweepError, simulate
+import shap_summary
+import notifications as inbox
+import rollups
+import archive
+from insights import InsightPrecomputer, build_insight, insight_version
+from write_behind import WriteBehindBuffer
+from onboard_tracking import OnboardingTracker
+from cache import TTLCache
+from feature_store import FEATURES_FIELD
+from fast_json import FastJSONResponse
+from surrogate import CHANNEL_USER_TYPE, ChannelScorer
+from sketches import SketchSnapshotter, drift_report, load_merged, monitor, reference_sketches, snapshot
+
+# MongoDB connection (opened lazily on first use)
+from db import leases_coll, notifications_coll, portfolio_sims_coll, rollups_coll, shap_summaries_coll, sketches_coll, users_coll
 
 def ollama_generate(prompt: str, model: str = "mistral"):
     try:
@@ -83,33 +106,63 @@ def ensure_consistent_output(result: dict) -> dict:
         "loan_approval_probability": result.get("loan_approval_probability") or (1 - result.get("pd", 0)),
     }
 
-class SimpleInference:
-    def __init__(self, preprocessor, calibrated_clf):
-        self.pre = preprocessor
-        self.clf = calibrated_clf
-    
-    def predict_proba(self, X):
-        X_enc = self.pre.transform(X)
-        return self.clf.predict_proba(X_enc)
-    
-    def predict(self, X, thr=0.5):
-        return (self.predict_proba(X)[:,1] >= thr).astype(int)
-
-# Load model bundle
-try:
-    bundle = joblib.load("artifacts/bharatscore_pipeline_bundle.pkl")
-    inference = SimpleInference(bundle["preprocessor"], bundle["calibrated_clf"])
-    explainer = bundle["explainer"]
-    feature_names = bundle["feature_names"]
-    print("Models loaded successfully!")
-except Exception as e:
-    print(f"Error loading models: {e}")
-    import traceback
-    traceback.print_exc()
-    bundle = inference = explainer = feature_names = None
+# Model bundle is loaded and warmed up in the background at startup (see model_runtime.py);
+# AI insights for the pending queue are precomputed periodically (see insights.py)
+# model_output / prediction / ai_insight writes are coalesced off the request path (see write_behind.py)
+derived_writes = WriteBehindBuffer(users_coll)
+# Daily portfolio buckets, updated with the delta of every application change (see rollups.py)
+portfolio_rollups = rollups.RollupBuffer(rollups_coll)
+insight_precomputer = InsightPrecomputer(users_coll, runtime, on_update=portfolio_rollups.record,
+                                         overlay=derived_writes.overlay, lease_coll=leases_coll)
+# Score/feature distribution sketches are snapshotted to Mongo per worker (see sketches.py)
+sketch_snapshotter = SketchSnapshotter(sketches_coll, monitor)
+# New applications are scored for the drift sketches and live explanation summary off the request path
+onboard_tracker = OnboardingTracker(runtime)
+# Population explanation summary: live accumulation + periodic exact recompute (see shap_summary.py)
+summary_worker = shap_summary.SummaryWorker(shap_summaries_coll, users_coll, runtime, shap_summary.accumulator)
+# Profile / psychometric records for dashboard reads; writes below update them directly (see cache.py)
+profile_cache = TTLCache("profile")
+psychometric_cache = TTLCache("psychometric")
+# Lookup-table scorer for the USSD/SMS channel, fitted offline by surrogate.py --fit
+channel_scorer = ChannelScorer()
+
+def ensure_indexes():
+    try:
+        inbox.ensure_indexes(notifications_coll)
+        rollups.ensure_indexes(rollups_coll)
+    except Exception as e:
+        print(f"Could not create indexes: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    runtime.start()
+    derived_writes.start()
+    portfolio_rollups.start()
+    insight_precomputer.start()
+    onboard_tracker.start()
+    sketch_snapshotter.start()
+    summary_worker.start()
+    # Index creation waits on Mongo, so it must not hold up startup
+    threading.Thread(target=ensure_indexes, name="ensure-indexes", daemon=True).start()
+    yield
+    insight_precomputer.stop()
+    onboard_tracker.stop()
+    sketch_snapshotter.stop()
+    summary_worker.stop()
+    derived_writes.stop()
+    portfolio_rollups.stop()
 
 # FastAPI app
-app = FastAPI(title="Bharat Score API", version="2.0")
+app = FastAPI(title="Bharat Score API", version="2.0", lifespan=lifespan)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    metrics.inc("degraded_responses", reason=f"rejected_{exc.workload}")
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+        content={"detail": f"Service busy ({exc.workload}), please retry", "degraded": True},
+    )
 
 # CORS
 app.add_middleware(
@@ -120,63 +173,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# -------------------- MODELS --------------------
-class ProfileRequest(BaseModel):
-    clerk_user_id: str
-    name: str
-    gender: str
-    state: str
-    occupation: str
-
-class OnboardRequest(BaseModel):
-    clerk_user_id: str
-    user_type: str
-    region: str
-    sms_count: float
-    bill_on_time_ratio: float | None = None
-    recharge_freq: float
-    sim_tenure: float
-    location_stability: float
-    income_signal: float
-    coop_score: float
-    land_verified: int
-    age_group: str
-    loan_amount_requested: float
-    recharge_pattern: str
-    loan_category: str
-    psychometric_score: float
-    consent: bool = True
-
-class InputData(BaseModel):
-    user_type: str
-    region: str
-    sms_count: float
-    bill_on_time_ratio: float
-    recharge_freq: float
-    sim_tenure: float
-    location_stability: float
-    income_signal: float
-    coop_score: float
-    land_verified: int
-    age_group: str
-    loan_amount_requested: float
-    recharge_pattern: str
-    loan_category: str
-    psychometric_score: float
-
-class PsychometricScoreRequest(BaseModel):
-    clerk_user_id: str
-    psychometric_score: float
-
-class ApplicationUpdateRequest(BaseModel):
-    status: str
-    remarks: Optional[str] = ""
-    admin_notes: Optional[str] = ""
-
-class AIInsightRequest(BaseModel):
-    clerk_user_id: str
-    application_created: str
-
 # -------------------- HELPER FUNCTIONS --------------------
 def find_application_by_timestamp(clerk_user_id: str, timestamp_str: str):
     """Find application with flexible timestamp matching"""
@@ -203,7 +199,26 @@ def find_application_by_timestamp(clerk_user_id: str, timestamp_str: str):
     
     return None, None
 
-def generate_remark(application_data):
+# Remark source: "template" (rule engine), "llm" (Mistral via Ollama) or "llm_fallback"
+REMARK_MODE = os.getenv("REMARK_MODE", "llm")
+
+def generate_remark(application_data, mode=REMARK_MODE):
+    """Remark from the template engine, the LLM, or the LLM with a template fallback"""
+    if mode == "template":
+        return template_remark(application_data, feature_kb)
+    if mode == "llm_fallback":
+        try:
+            remark = llm_remark(application_data)
+        except Exception as e:
+            print(f"LLM remark failed, using template: {e}")
+            remark = None
+        if not remark or remark.startswith("Error:"):
+            metrics.inc("remark_llm_fallbacks")
+            return template_remark(application_data, feature_kb)
+        return remark
+    return llm_remark(application_data)
+
+def llm_remark(application_data):
     # Retrieve SHAP feature explanations with values
     explanations = retrieve_explanations(application_data.get("top_shap", []))
     explanations_text = "\n".join([f"- {e}" for e in explanations])
@@ -247,6 +262,49 @@ def generate_remark(application_data):
 
 
 
+# -------------------- ADMISSION CONTROL --------------------
+# Attribution mode for the high-traffic user endpoints (/predict, /users); admin views use
+# EXPLAIN_MODE (exact by default). See explain_report.py for the accuracy trade-off.
+USER_EXPLAIN_MODE = os.getenv("USER_EXPLAIN_MODE", "path")
+
+def score_applications(raws, top_k_shap=5, explain_mode=None, docs=None, track=True):
+    """
+    Score application dicts under admission control. Raises Overloaded (503) when the
+    scoring queue is full and drops SHAP (flagged as degraded) when explanations are saturated.
+    Pass the stored application documents as `docs` to score their encoded feature vectors
+    (never tracked, see score_documents); track=False keeps other re-scores out of monitoring.
+    """
+    def score(explain, mode):
+        if docs is not None:
+            return score_documents(docs, top_k_shap=top_k_shap, explain=explain, explain_mode=mode)
+        return [runtime.infer(raw, top_k_shap=top_k_shap, explain=explain, explain_mode=mode, track=track)
+                for raw in raws]
+
+    if (explain_mode or runtime.explain_mode) == "path" and runtime.path_explainer is not None:
+        # Path attributions cost about as much as the prediction: no explanation slot needed
+        with admission.admit("scoring"):
+            return score(True, "path")
+    with admission.admit("scoring"), admission.try_admit("explanation") as explain:
+        results = score(explain, "exact")
+    if not explain:
+        for result in results:
+            mark_degraded(result, "no_shap")
+    return results
+
+def score_documents(docs, **kwargs):
+    """
+    runtime.infer_encoded for stored applications: their float32 feature vectors are scored
+    without re-encoding `raw`. Vectors missing or from another preprocessor are re-encoded
+    and written back (see feature_store.py). Not tracked: a dashboard refresh must not add
+    the same application to the drift sketches and explanation summary again.
+    """
+    if not docs:
+        return []
+    X, refreshed = runtime.feature_store.matrix(docs)
+    for i, field in refreshed.items():
+        derived_writes.set(docs[i]["_id"], {FEATURES_FIELD: field})
+    return runtime.infer_encoded(X, [doc["raw"] for doc in docs], track=False, **kwargs)
+
 # -------------------- OUPUT NORMALIZED FUNCION  --------------------
 def normalize_model_output(app):
     """Extracts credit score, risk tier, and probability consistently from any application doc."""
@@ -262,6 +320,7 @@ def normalize_model_output(app):
 
 # Profile endpoints
 @app.post("/profile")
+@scheduler.route("interactive")
 def create_or_update_profile(req: ProfileRequest):
     doc = {
         "clerk_user_id": req.clerk_user_id,
@@ -275,18 +334,24 @@ def create_or_update_profile(req: ProfileRequest):
         "profile_updated_at": datetime.utcnow(),
     }
     users_coll.update_one({"clerk_user_id": req.clerk_user_id}, {"$set": doc}, upsert=True)
+    profile_cache.set(req.clerk_user_id, doc["profile"])
     return {"status": "stored", "clerk_user_id": req.clerk_user_id}
 
+def load_profile(clerk_user_id):
+    user = users_coll.find_one({"clerk_user_id": clerk_user_id}, {"_id": 0, "profile": 1})
+    return (user or {}).get("profile") or None
+
 @app.get("/profile")
+@scheduler.route("interactive")
 def get_profile(clerk_user_id: str):
-    proj = {"_id": 0, "profile": 1, "has_profile": 1, "clerk_user_id": 1}
-    user = users_coll.find_one({"clerk_user_id": clerk_user_id}, proj)
-    if user and user.get("profile"):
-        return {"profile": user["profile"], "has_profile": True}
+    profile = profile_cache.get_or_load(clerk_user_id, load_profile)
+    if profile:
+        return {"profile": profile, "has_profile": True}
     return {"profile": None, "has_profile": False}
 
 # Onboarding
 @app.post("/onboard")
+@scheduler.route("interactive")
 def onboard(req: OnboardRequest):
     if req.bill_on_time_ratio is None:
         req.bill_on_time_ratio = 0.0
@@ -296,48 +361,149 @@ def onboard(req: OnboardRequest):
         "created": datetime.utcnow(),
         "status": "received"
     }
+    if runtime.loaded:
+        # Encode once now so re-scoring skips the preprocessor (see feature_store.py)
+        try:
+            X = runtime.feature_store.encode([doc["raw"]])
+            doc[FEATURES_FIELD] = runtime.feature_store.field(X[0])
+        except Exception as e:
+            print(f"Feature encoding failed, storing application without a vector: {e}")
     inserted_id = users_coll.insert_one(doc).inserted_id
+    portfolio_rollups.record(None, doc)
+    onboard_tracker.add([doc])
     return {"mongo_id": str(inserted_id), "clerk_user_id": req.clerk_user_id, "status": "stored"}
 
+@app.post("/onboard/bulk")
+async def onboard_bulk(request: Request, format: str = "ndjson", batch_size: int = 500, score: bool = False):
+    """
+    Stream an NDJSON or CSV upload of OnboardRequest rows into the users collection.
+    Chunks are processed on the admin class (admitted once per upload); with score=true
+    each chunk is scored under scoring admission and stored unscored if that is saturated.
+    """
+    if format not in BULK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Allowed: {sorted(BULK_FORMATS)}")
+    if batch_size < 1 or batch_size > BULK_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"batch_size must be between 1 and {BULK_MAX_BATCH_SIZE}")
+
+    scorer = None
+    if score:
+        if not runtime.loaded:
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        def scorer(raws):
+            with admission.admit("scoring"):
+                # Tracked once inserted, like /onboard (see onboard_tracking.py)
+                return runtime.infer_batch(raws, track=False)
+    encoder = runtime.feature_store.fields if runtime.loaded else None
+
+    def on_insert(docs):
+        portfolio_rollups.record_many(docs)
+        onboard_tracker.add(docs)
+
+    ingestor = BulkIngestor(users_coll, fmt=format, batch_size=batch_size, scorer=scorer, encoder=encoder,
+                            on_insert=on_insert)
+    admitted = False
+    async for line in aiter_lines(request.stream()):
+        if ingestor.add_line(line):
+            await scheduler.call("admin", ingestor.flush, admitted=admitted)
+            admitted = True
+    return await scheduler.call("admin", ingestor.finish, admitted=admitted)
+
 # Prediction endpoints
+def check_explain_mode(explain_mode):
+    if explain_mode not in EXPLAIN_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid explain_mode. Allowed: {sorted(EXPLAIN_MODES)}")
+
 @app.post("/predict")
-def predict(data: InputData):
-    if inference is None:
+@scheduler.route("interactive")
+def predict(data: InputData, explain_mode: str = USER_EXPLAIN_MODE):
+    check_explain_mode(explain_mode)
+    if not runtime.loaded:
         return {"error": "Model not loaded"}
     try:
-        df = pd.DataFrame([data.dict()])
-        result = infer_user(df, inference, explainer, feature_names, top_k_shap=5)
+        result = score_applications([data.dict()], explain_mode=explain_mode)[0]
         result = ensure_consistent_output(result)
         return result
+    except Overloaded:
+        raise
     except Exception as e:
         import traceback
         return {"error": str(e), "details": traceback.format_exc()}
 
+# Statuses only an admin sets; re-scoring must not move an application out of them
+ADMIN_DECIDED_STATUSES = ["approved", "rejected", "issue"]
+
 @app.get("/predict/{user_id}")
-def predict_existing_user(user_id: str):
+@scheduler.route("interactive")
+def predict_existing_user(user_id: str, explain_mode: str = USER_EXPLAIN_MODE):
     from bson import ObjectId
-    if inference is None:
+    check_explain_mode(explain_mode)
+    if not runtime.loaded:
         return {"error": "Model not loaded"}
     user = users_coll.find_one({"_id": ObjectId(user_id)})
     if not user:
         return {"error": "User not found"}
     raw_data = user["raw"]
-    df = pd.DataFrame([raw_data])
-    result = infer_user(df, inference, explainer, feature_names, top_k_shap=5)
-    users_coll.update_one({"_id": ObjectId(user_id)}, {"$set": {"prediction": result, "status": "predicted"}})
+    result = score_applications([raw_data], explain_mode=explain_mode, docs=[user])[0]
+    derived_writes.set(user["_id"], {"prediction": result})
+    # status is shown to the user and set by admins: written now, and never over an admin decision
+    before = users_coll.find_one_and_update(
+        {"_id": user["_id"], "status": {"$nin": ADMIN_DECIDED_STATUSES}},
+        {"$set": {"status": "predicted"}},
+        projection={"status": 1},
+    )
+    if before is not None:
+        current = {**derived_writes.overlay(user), "status": before.get("status")}
+        portfolio_rollups.record(current, {**current, "status": "predicted"})
     return result
 
+@app.post("/predict/what-if", response_class=FastJSONResponse)
+@scheduler.route("interactive")
+def predict_what_if(req: WhatIfRequest):
+    """Score curves (and a grid) for one application with some inputs swept, in one batched pass"""
+    if not runtime.loaded:
+        return {"error": "Model not loaded"}
+    try:
+        with admission.admit("scoring"):
+            return FastJSONResponse(simulate(runtime, req.base.dict(), req.sweeps))
+    except SweepError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/ussd/score")
+@scheduler.route("interactive")
+def ussd_score(data: InputData):
+    """
+    Score and tier only, for USSD/SMS gateways. Feature-phone applicants are scored by the
+    surrogate lookup table; rows near a tier boundary, other user types, or a surrogate fitted
+    against a different bundle go to the full model (without SHAP).
+    """
+    raw = data.dict()
+    surrogate = channel_scorer.current(runtime.model_version)
+    if surrogate is not None and raw.get("user_type") == CHANNEL_USER_TYPE:
+        result, near_boundary = surrogate.score(raw)
+        if not near_boundary:
+            monitor.observe([raw], [result])
+            metrics.inc("surrogate_served", source="surrogate")
+            return {"score": result["alt_cibil_score"], "tier": result["tier"], "source": "surrogate"}
+    if not runtime.loaded:
+        return {"error": "Model not loaded"}
+    with admission.admit("scoring"):
+        result = runtime.infer(raw, explain=False)
+    metrics.inc("surrogate_served", source="model")
+    return {"score": result["alt_cibil_score"], "tier": result["tier"], "source": "model"}
+
 # Psychometric endpoints
 
 @app.post("/save-psychometric")
+@scheduler.route("interactive")
 def save_psychometric_score(req: PsychometricScoreRequest):
     score = req.psychometric_score
     if score < 0 or score > 1:
         raise HTTPException(status_code=400, detail="Score must be between 0 and 1")
     
-    user = users_coll.find_one({"clerk_user_id": req.clerk_user_id})
     now = datetime.utcnow()
-    
+    # Mongo keeps milliseconds; truncate so the cached value matches what a reload returns
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+
     # OPTION 1: Remove all restrictions - users can take test anytime
     # Simply save the score without any time checks
     users_coll.update_one(
@@ -345,12 +511,19 @@ def save_psychometric_score(req: PsychometricScoreRequest):
         {"$set": {"psychometric_score": score, "psychometric_taken_at": now}},
         upsert=True
     )
+    psychometric_cache.set(req.clerk_user_id, {"psychometric_score": score, "psychometric_taken_at": now})
     return {"status": "saved", "clerk_user_id": req.clerk_user_id, "score": score, "taken_at": now}
 
+def load_psychometric(clerk_user_id):
+    proj = {"_id": 0, "psychometric_score": 1, "psychometric_taken_at": 1}
+    user = users_coll.find_one({"clerk_user_id": clerk_user_id}, proj)
+    return user if user and "psychometric_score" in user else None
+
 @app.get("/psychometric-status")
+@scheduler.route("interactive")
 def psychometric_status(clerk_user_id: str):
-    user = users_coll.find_one({"clerk_user_id": clerk_user_id})
-    if not user or "psychometric_score" not in user:
+    user = psychometric_cache.get_or_load(clerk_user_id, load_psychometric)
+    if not user:
         return {"completed": False}
     
     return {
@@ -361,8 +534,9 @@ def psychometric_status(clerk_user_id: str):
 
 # User data endpoints
 @app.get("/users")
+@scheduler.route("interactive")
 def get_user_data(clerk_user_id: str):
-    apps_cursor = users_coll.find({"clerk_user_id": clerk_user_id}, {"_id": 0})
+    apps_cursor = users_coll.find({"clerk_user_id": clerk_user_id})
     applications = list(apps_cursor)
     if not applications:
         raise HTTPException(status_code=404, detail="No applications found")
@@ -375,7 +549,7 @@ def get_user_data(clerk_user_id: str):
         "loan_category", "psychometric_score",
     }
 
-    loan_results = []
+    scorable = []
     for app in applications:
         raw_data = app.get("raw")
         if not raw_data:
@@ -385,9 +559,12 @@ def get_user_data(clerk_user_id: str):
         if not REQUIRED_FIELDS.issubset(raw_data.keys()):
             print(f"Skipping app due to missing fields: {raw_data}")
             continue
+        scorable.append(app)
 
-        df = pd.DataFrame([raw_data])
-        result = infer_user(df, inference, explainer, feature_names, top_k_shap=5)
+    loan_results = []
+    results = score_applications([app["raw"] for app in scorable], explain_mode=USER_EXPLAIN_MODE, docs=scorable)
+    for app, result in zip(scorable, results):
+        raw_data = app["raw"]
         result = ensure_consistent_output(result)
 
         # Add extra metadata
@@ -410,7 +587,8 @@ def get_user_data(clerk_user_id: str):
     }
 
 # Admin endpoints
-@app.get("/admin/applications-summary")
+@app.get("/admin/applications-summary", response_class=FastJSONResponse)
+@scheduler.route("admin")
 def admin_applications_summary():
     pipeline = [
         {
@@ -454,16 +632,20 @@ def admin_applications_summary():
         })
 
     summary["applicants"] = applicants
-    return summary
+    return FastJSONResponse(summary)
 
-@app.get("/admin/applications/{clerk_user_id}")
+@app.get("/admin/applications/{clerk_user_id}", response_class=FastJSONResponse)
+@scheduler.route("admin")
 def admin_application_detail(clerk_user_id: str):
-    user_docs = list(users_coll.find({"clerk_user_id": clerk_user_id}))
+    hot_docs = [derived_writes.overlay(doc) for doc in users_coll.find({"clerk_user_id": clerk_user_id})]
+    user_docs = archive.merge_tiers(hot_docs, archive.archived_applications(clerk_user_id))
+    archived_ids = {doc["_id"] for doc in user_docs[len(hot_docs):]}
 
     if not user_docs:
         raise HTTPException(status_code=404, detail="No applications found for this user")
 
     profile = user_docs[0].get("profile", {})
+    latest_notifications = inbox.latest_by_application(notifications_coll, clerk_user_id)
     applications = []
 
     for app in user_docs:
@@ -475,13 +657,12 @@ def admin_application_detail(clerk_user_id: str):
         model_result = app.get("model_output")
         if not model_result:
             try:
-                df = pd.DataFrame([raw_data])
-                model_result = infer_user(df, inference, explainer, feature_names, top_k_shap=5)
-                # Save the model output
-                users_coll.update_one(
-                    {"_id": app["_id"]},
-                    {"$set": {"model_output": model_result}}
-                )
+                model_result = score_documents([app])[0]
+                model_result["ai_remark"] = template_remark(model_result, feature_kb)
+                # Save the model output (archived applications are read-only)
+                if app["_id"] not in archived_ids:
+                    derived_writes.set(app["_id"], {"model_output": model_result})
+                    portfolio_rollups.record(app, {**app, "model_output": model_result})
             except Exception as e:
                 model_result = {"error": str(e)}
                 
@@ -495,17 +676,42 @@ def admin_application_detail(clerk_user_id: str):
             "ai_insight": app.get("ai_insight", ""),
             "admin_remarks": app.get("admin_remarks", ""),
             "admin_notes": app.get("admin_notes", ""),
-            "user_notification": app.get("user_notification", {})
+            "user_notification": latest_notifications.get(str(app.get("created")), app.get("user_notification", {})),
+            "archived": app["_id"] in archived_ids,
         })
 
-    return {
+    return FastJSONResponse({
         "clerk_user_id": clerk_user_id,
         "profile": profile,
         "applications": applications
-    }
+    })
+
+@app.get("/admin/export")
+@scheduler.route("admin")
+def admin_export(format: str = "csv", start: datetime | None = None, end: datetime | None = None,
+                 status: str | None = None, tier: str | None = None, archived: bool = True):
+    """Stream applications with flattened raw inputs and model outputs as CSV or Parquet (hot, then archived)"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Allowed: {sorted(EXPORT_FORMATS)}")
+
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+    tiers = [t.strip() for t in tier.split(",") if t.strip()] if tier else None
+    query = build_export_query(start, end, statuses, tiers)
+
+    media_type = "text/csv" if format == "csv" else "application/vnd.apache.parquet"
+    filename = f"applications_{datetime.utcnow():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        # Each chunk is read and encoded on the admin workers, not the shared pool; admission
+        # applies to this call only, so a chunk is never rejected once the 200 is sent
+        scheduler.iterate("admin", iter_export(users_coll, format, query,
+                                               archive_root=archive.ARCHIVE_DIR if archived else None)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 # FIXED: Single application update endpoint with proper timestamp handling
 @app.patch("/admin/applications/{clerk_user_id}/{created_timestamp}")
+@scheduler.route("admin")
 def update_application_status(clerk_user_id: str, created_timestamp: str, update_req: ApplicationUpdateRequest):
     """Update application status with flexible timestamp matching"""
     
@@ -538,20 +744,6 @@ def update_application_status(clerk_user_id: str, created_timestamp: str, update
         "status_updated_by": "admin"
     }
     
-    # Generate status-specific message for user
-    status_messages = {
-        "approved": "Congratulations! Your loan application has been approved. Please visit the nearest branch for document verification and loan disbursement.",
-        "rejected": "Your loan application has been declined. Please contact our support team for more information.",
-        "issue": "Your application requires additional review. Our team will contact you shortly with next steps.",
-        "pending": "Your application is under review. We will update you on the progress soon."
-    }
-    
-    update_doc["user_notification"] = {
-        "message": status_messages.get(update_req.status, "Your application status has been updated."),
-        "timestamp": datetime.utcnow(),
-        "read": False
-    }
-
     # Update using the matched timestamp
     result = users_coll.update_one(
         {"clerk_user_id": clerk_user_id, "created": matched_timestamp},
@@ -560,6 +752,13 @@ def update_application_status(clerk_user_id: str, created_timestamp: str, update
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Failed to update application")
+    current = derived_writes.overlay(application)
+    portfolio_rollups.record(current, {**current, **update_doc})
+
+    # Status-specific message for the user, appended to their notification inbox
+    notification = inbox.publish(
+        notifications_coll, inbox.status_notification(application, update_req.status, update_req.remarks)
+    )
 
     return {
         "message": "Application updated successfully",
@@ -567,11 +766,17 @@ def update_application_status(clerk_user_id: str, created_timestamp: str, update
         "created": matched_timestamp,
         "new_status": update_req.status,
         "admin_remarks": update_req.remarks,
-        "user_notification": update_doc["user_notification"]
+        "user_notification": {
+            "id": str(notification["_id"]),
+            "message": notification["message"],
+            "timestamp": notification["timestamp"],
+            "read": False
+        }
     }
 
 @app.post("/admin/generate-insight")
-async def generate_ai_insight(req: AIInsightRequest):
+@scheduler.route("admin")
+def generate_ai_insight(req: AIInsightRequest):
     """Generate natural language AI insights for admin review"""
     
     # Find the specific application
@@ -582,78 +787,42 @@ async def generate_ai_insight(req: AIInsightRequest):
     
     if not app:
         raise HTTPException(status_code=404, detail="Application not found")
+    app = derived_writes.overlay(app)
     
     raw_data = app.get("raw")
     if not raw_data:
         raise HTTPException(status_code=400, detail="No application data found")
     
-    # Generate model prediction if not exists
+    # Serve the precomputed insight when it matches the current model
+    version = insight_version(runtime.model_version)
+    if app.get("ai_insight") and app.get("ai_insight_version") == version:
+        metrics.inc("insight_served", source="precomputed")
+        return {
+            "insight": app["ai_insight"],
+            "model_output": app.get("model_output"),
+            "generated_at": app.get("ai_insight_generated_at")
+        }
+
+    # Not precomputed yet: score inline
     try:
-        df = pd.DataFrame([raw_data])
-        model_result = infer_user(df, inference, explainer, feature_names, top_k_shap=5)
+        model_result = score_documents([app])[0]
     except Exception as e:
         return {"error": f"Model prediction failed: {str(e)}"}
-    
+    metrics.inc("insight_served", source="inline")
+
     # Create natural language insight
     profile = app.get("profile", {})
     applicant_name = profile.get("name", "Unknown User")
-    loan_amount = raw_data.get("loan_amount_requested", 0)
-    
-    # Build insight based on model output
-    insight = f"AI Assessment for {applicant_name}:\n\n"
-    
-    if model_result.get("final_cibil_score"):
-        score = model_result["final_cibil_score"]
-        insight += f"• Bharat Credit Score: {score}/1000 "
-        if score >= 700:
-            insight += "(Excellent creditworthiness)\n"
-        elif score >= 600:
-            insight += "(Good creditworthiness)\n"
-        elif score >= 400:
-            insight += "(Fair creditworthiness - requires careful evaluation)\n"
-        else:
-            insight += "(Poor creditworthiness - high risk)\n"
-    
-    if model_result.get("loan_approval_probability"):
-        prob = model_result["loan_approval_probability"] * 100
-        insight += f"• Approval Probability: {prob:.1f}%\n"
-    
-    if model_result.get("final_tier"):
-        tier = model_result["final_tier"]
-        insight += f"• Risk Category: {tier}\n"
-    
-    if model_result.get("recommended_interest_rate"):
-        rate = model_result["recommended_interest_rate"]
-        insight += f"• Recommended Interest Rate: {rate}% per annum\n"
-    
-    # Add key factors analysis
-    if model_result.get("top_factors"):
-        insight += "\nKey Decision Factors:\n"
-        for factor, impact in model_result["top_factors"].items():
-            factor_name = factor.replace("_", " ").title()
-            impact_text = "positively influences" if impact > 0 else "negatively impacts"
-            insight += f"• {factor_name} {impact_text} the decision\n"
-    
-    # Add recommendation based on approval probability
-    if model_result.get("loan_approval_probability"):
-        prob = model_result["loan_approval_probability"]
-        insight += "\nAI Recommendation: "
-        if prob >= 0.7:
-            insight += "APPROVE - Strong candidate with low risk profile"
-        elif prob >= 0.4:
-            insight += "REVIEW - Moderate risk, consider additional verification"
-        else:
-            insight += "HIGH RISK - Requires careful manual assessment"
-    
+    insight = build_insight(applicant_name, model_result)
+
     # Store the insight in database
-    users_coll.update_one(
-        {"clerk_user_id": req.clerk_user_id, "created": req.application_created},
-        {"$set": {
-            "ai_insight": insight,
-            "ai_insight_generated_at": datetime.utcnow(),
-            "model_output": model_result
-        }}
-    )
+    derived_writes.set(app["_id"], {
+        "ai_insight": insight,
+        "ai_insight_generated_at": datetime.utcnow(),
+        "ai_insight_version": version,
+        "model_output": model_result
+    })
+    portfolio_rollups.record(app, {**app, "model_output": model_result})
     
     return {
         "insight": insight,
@@ -661,127 +830,61 @@ async def generate_ai_insight(req: AIInsightRequest):
         "generated_at": datetime.utcnow()
     }
 
-# User notification endpoints
+# User notification endpoints (paginated, newest first; pass next_cursor back as `before`)
 @app.get("/user/notifications")
-def get_user_notifications(clerk_user_id: str):
-    """Get all notifications for a user"""
-    
-    applications = list(users_coll.find(
-        {"clerk_user_id": clerk_user_id, "user_notification": {"$exists": True}},
-        {"_id": 0, "user_notification": 1, "status": 1, "created": 1, "admin_remarks": 1}
-    ).sort("created", -1))
-    
-    notifications = []
-    for app in applications:
-        if "user_notification" in app:
-            notifications.append({
-                "message": app["user_notification"]["message"],
-                "timestamp": app["user_notification"]["timestamp"],
-                "read": app["user_notification"].get("read", False),
-                "status": app["status"],
-                "application_date": app["created"],
-                "admin_remarks": app.get("admin_remarks", "")
-            })
-    
-    return {"notifications": notifications}
+@scheduler.route("interactive")
+def get_user_notifications(clerk_user_id: str, limit: int = inbox.DEFAULT_PAGE_SIZE, before: str | None = None,
+                           unread_only: bool = False):
+    """Get a page of notifications for a user"""
+    try:
+        notifications, next_cursor = inbox.list_notifications(notifications_coll, clerk_user_id, unread_only, limit, before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"notifications": notifications, "next_cursor": next_cursor}
 
 @app.post("/user/notifications/mark-read")
-def mark_notifications_read(clerk_user_id: str):
-    """Mark all notifications as read for a user"""
-    
-    users_coll.update_many(
-        {"clerk_user_id": clerk_user_id, "user_notification.read": False},
-        {"$set": {"user_notification.read": True}}
-    )
-    
-    return {"message": "All notifications marked as read"}
+@scheduler.route("interactive")
+def mark_notifications_read(clerk_user_id: str, req: MarkReadRequest | None = None):
+    """Mark notifications as read for a user (all unread, or the given ids)"""
+    ids = req.notification_ids if req else None
+    updated = inbox.mark_read(notifications_coll, clerk_user_id, ids)
+    return {"message": "Notifications marked as read", "updated": updated}
 
 @app.get("/user/notifications/{clerk_user_id}")
-def get_user_notifications_detailed(clerk_user_id: str):
-    """Get all notifications for a user with detailed application info"""
-    
-    applications = list(users_coll.find(
-        {"clerk_user_id": clerk_user_id, "user_notification": {"$exists": True}},
-        {
-            "_id": 0, 
-            "user_notification": 1, 
-            "status": 1, 
-            "created": 1, 
-            "admin_remarks": 1,
-            "raw.loan_amount_requested": 1,
-            "raw.loan_category": 1,
-            "model_output.final_cibil_score": 1,
-            "model_output.final_tier": 1,
-            "profile.name": 1
-        }
-    ).sort("user_notification.timestamp", -1))
-    
-    notifications = []
-    for app in applications:
-        if "user_notification" in app:
-            notifications.append({
-                "id": f"{clerk_user_id}_{app['created']}",
-                "message": app["user_notification"]["message"],
-                "timestamp": app["user_notification"]["timestamp"],
-                "read": app["user_notification"].get("read", False),
-                "status": app["status"],
-                "application_date": app["created"],
-                "admin_remarks": app.get("admin_remarks", ""),
-                "loan_amount": app.get("raw", {}).get("loan_amount_requested", 0),
-                "loan_category": app.get("raw", {}).get("loan_category", ""),
-                "cibil_score": app.get("model_output", {}).get("final_cibil_score"),
-                "risk_tier": app.get("model_output", {}).get("final_tier"),
-                "applicant_name": app.get("profile", {}).get("name", "")
-            })
-    
-    return {"notifications": notifications}
+@scheduler.route("interactive")
+def get_user_notifications_detailed(clerk_user_id: str, limit: int = inbox.DEFAULT_PAGE_SIZE, before: str | None = None):
+    """Get notifications for a user with detailed application info"""
+    try:
+        notifications, next_cursor = inbox.list_notifications(notifications_coll, clerk_user_id, False, limit, before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"notifications": notifications, "next_cursor": next_cursor}
 
 @app.get("/user/notifications/count/{clerk_user_id}")
+@scheduler.route("interactive")
 def get_unread_notification_count(clerk_user_id: str):
     """Get count of unread notifications for a user"""
-    
-    count = users_coll.count_documents({
-        "clerk_user_id": clerk_user_id, 
-        "user_notification.read": False
-    })
-    
-    return {"unread_count": count}
+    return {"unread_count": inbox.unread_count(notifications_coll, clerk_user_id)}
 
 @app.patch("/user/notifications/{clerk_user_id}/mark-read")
+@scheduler.route("interactive")
 def mark_specific_notification_read(clerk_user_id: str, notification_id: str = None):
     """Mark specific notification as read"""
-    
-    if notification_id:
-        # Extract created timestamp from notification_id
-        try:
-            created_str = notification_id.split(f"{clerk_user_id}_")[1]
-            users_coll.update_one(
-                {
-                    "clerk_user_id": clerk_user_id, 
-                    "created": created_str,
-                    "user_notification.read": False
-                },
-                {"$set": {"user_notification.read": True}}
-            )
-        except IndexError:
-            pass
-    else:
-        # Mark all as read
-        users_coll.update_many(
-            {"clerk_user_id": clerk_user_id, "user_notification.read": False},
-            {"$set": {"user_notification.read": True}}
-        )
-    
+    inbox.mark_read(notifications_coll, clerk_user_id, [notification_id] if notification_id else None)
     return {"message": "Notification(s) marked as read"}
 
-@app.get("/user/applications/{clerk_user_id}")
+@app.get("/user/applications/{clerk_user_id}", response_class=FastJSONResponse)
+@scheduler.route("interactive")
 def get_user_applications_with_notifications(clerk_user_id: str):
     """Get user applications with latest notification status"""
     try:
+        fields = [
+            "created", "status", "raw", "model_output", "user_notification",
+            "admin_remarks", "admin_notes", "status_updated_at", "status_updated_by",
+        ]
         applications = list(users_coll.find(
             {"clerk_user_id": clerk_user_id},
             {
-                "_id": 0,
                 "created": 1,
                 "status": 1,
                 "raw": 1,
@@ -793,14 +896,28 @@ def get_user_applications_with_notifications(clerk_user_id: str):
                 "status_updated_by": 1
             }
         ).sort("created", -1).limit(50))
+        # Closed applications past the archive cutoff live in the Parquet tier (see archive.py)
+        archived = archive.archived_applications(clerk_user_id)
+        if archived:
+            applications = archive.merge_tiers(applications, archived)
+            applications.sort(key=lambda a: str(a.get("created")), reverse=True)
+            applications = [{k: a[k] for k in fields if k in a} for a in applications[:50]]
+        else:
+            for application in applications:
+                application.pop("_id", None)
+        latest_notifications = inbox.latest_by_application(notifications_coll, clerk_user_id)
+        for application in applications:
+            notification = latest_notifications.get(str(application.get("created")))
+            if notification:
+                application["user_notification"] = notification
         
-        return {
+        return FastJSONResponse({
             "applications": applications,
             "total_count": len(applications)
-        }
+        })
     except Exception as e:
         print(f"Error fetching applications: {e}")
-        return {"applications": [], "total_count": 0, "error": str(e)}
+        return FastJSONResponse({"applications": [], "total_count": 0, "error": str(e)})
     
     
 # RAG Endpoint
@@ -818,15 +935,25 @@ def get_user_applications_with_notifications(clerk_user_id: str):
 #         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-remark")
-def generate_remark_endpoint(data: InputData):
-    # Convert incoming JSON to DataFrame
-    df = pd.DataFrame([data.dict()])
+@scheduler.route("interactive")
+def generate_remark_endpoint(data: InputData, remark_mode: str = REMARK_MODE):
+    if remark_mode not in REMARK_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid remark_mode. Allowed: {sorted(REMARK_MODES)}")
 
     # Run model inference + SHAP explanation
-    result = infer_user(df, inference, explainer, feature_names, top_k_shap=5)
+    # The remark is for an application already scored by /predict or /onboard: not tracked again
+    result = score_applications([data.dict()], track=False)[0]
 
-    # Generate AI remark using Ollama + retrieved explanations
-    remark = generate_remark(result)
+    # Generate AI remark from the template engine or Ollama + retrieved explanations;
+    # LLM requests fall back to the template when the LLM pool is saturated
+    if remark_mode == "template":
+        remark = generate_remark(result, "template")
+    else:
+        with admission.try_admit("llm") as llm_available:
+            remark = generate_remark(result, remark_mode) if llm_available else None
+        if remark is None:
+            remark = template_remark(result, feature_kb)
+            mark_degraded(result, "template_remark")
     result["ai_remark"] = remark
 
     return result
@@ -836,7 +963,107 @@ def generate_remark_endpoint(data: InputData):
 # Health check
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "models_loaded": inference is not None, "explainer_loaded": explainer is not None}
+    return {
+        "status": "healthy" if runtime.ready else runtime.state,
+        "models_loaded": runtime.loaded,
+        "explainer_loaded": runtime.explainer is not None,
+    }
+
+@app.get("/admin/drift", response_class=FastJSONResponse)
+@scheduler.route("admin")
+def admin_drift(days: int = 1):
+    """Merged score/feature sketches for the last `days` days, with PSI against the training distribution"""
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    # Publish this worker's latest state so the merge includes it
+    snapshot(sketches_coll, monitor)
+    current, workers = load_merged(sketches_coll, days)
+    reference = reference_sketches(runtime if runtime.ready else None)
+    return FastJSONResponse({
+        "days": days,
+        "workers": workers,
+        "applications": current["pd"].count,
+        "features": drift_report(current, reference),
+    })
+
+@app.get("/admin/explanations/summary", response_class=FastJSONResponse)
+@scheduler.route("admin")
+def admin_explanation_summary(segment: str | None = None, top: int = 10):
+    """Mean |SHAP| and mean signed SHAP per feature, overall and by region / user_type / loan_category"""
+    if segment and segment not in shap_summary.SEGMENT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Invalid segment. Allowed: {shap_summary.SEGMENT_FIELDS}")
+    doc = shap_summaries_coll.find_one({"_id": shap_summary.MATERIALIZED_ID})
+    if not doc:
+        return FastJSONResponse({"segments": {}, "status": "not_computed"})
+    return FastJSONResponse({
+        "exact_as_of": doc.get("exact_as_of"),
+        "exact_applications": doc.get("exact_applications"),
+        "model_version": doc.get("model_version"),
+        "updated_at": doc.get("updated_at"),
+        "segments": shap_summary.format_summary(doc, segment, top),
+    })
+
+@app.get("/admin/portfolio", response_class=FastJSONResponse)
+@scheduler.route("admin")
+def admin_portfolio(start: str | None = None, end: str | None = None, group_by: str = "none",
+                    region: str | None = None, loan_category: str | None = None):
+    """Approval rate, exposure and tier mix for applications created between start and end (YYYY-MM-DD, inclusive)"""
+    if group_by not in rollups.GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by. Allowed: {sorted(rollups.GROUP_BY)}")
+    for value in (start, end):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date {value!r}, expected YYYY-MM-DD")
+    # Publish this worker's pending increments so the merge includes them
+    portfolio_rollups.flush()
+    regions = [r.strip() for r in region.split(",") if r.strip()] if region else None
+    categories = [c.strip() for c in loan_category.split(",") if c.strip()] if loan_category else None
+    return FastJSONResponse({
+        "start": start,
+        "end": end,
+        **rollups.query_portfolio(rollups_coll, start, end, group_by, regions, categories),
+    })
+
+@app.get("/admin/portfolio/risk", response_class=FastJSONResponse)
+@scheduler.route("admin")
+def admin_portfolio_risk():
+    """Latest Monte Carlo loss report (expected loss, VaR/ES, concentration); produced by portfolio_sim.py --store"""
+    doc = portfolio_sims_coll.find_one({}, {"_id": 0}, sort=[("created", -1)])
+    if not doc:
+        return FastJSONResponse({"status": "not_computed"})
+    return FastJSONResponse(doc)
+
+@app.get("/admin/surrogate", response_class=FastJSONResponse)
+@scheduler.route("admin")
+def admin_surrogate(reload: bool = False):
+    """Feature-phone surrogate status and its published pd error / tier agreement / fallback rate"""
+    if reload:
+        channel_scorer.reload()
+    return FastJSONResponse(channel_scorer.status(runtime.model_version))
+
+@app.get("/admin/metrics")
+def admin_metrics():
+    """Admission, scheduler, inference slot and user cache state plus in-process counters (degraded responses, rejections, queue waits)"""
+    return {
+        "admission": admission.status(),
+        "scheduler": scheduler.status(),
+        "inference_slots": inference_slots.status(),
+        "user_cache": {"profile": profile_cache.status(), "psychometric": psychometric_cache.status()},
+        **metrics.snapshot(),
+    }
+
+@app.get("/health/live")
+def liveness():
+    """The process is up and serving requests (models may still be loading)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness():
+    """Ready only once models are loaded and warm-up inference has finished"""
+    status = runtime.status()
+    return JSONResponse(status_code=200 if runtime.ready else 503, content=status)
 
 @app.get("/")
 def root():
@@ -0,0 +1,329 @@
+"""
+Cold tier for closed applications: monthly Parquet partitions on disk.
+
+Applications in a closed status (ARCHIVE_STATUSES, default approved and
+rejected) created more than ARCHIVE_AFTER_DAYS days ago are moved out of the
+hot `users` collection into zstd-compressed Parquet files under ARCHIVE_DIR,
+partitioned by creation month:
+
+    archive/month=2025-01/part-20250301T020000-3f2a9c1b.parquet
+
+Every row has the typed export columns (see export_applications.py), so the
+files can be scanned with pyarrow / DuckDB / pandas without Mongo, plus
+`document`: the whole application as Extended JSON, which is what history views
+read back. Rows are sorted by clerk_user_id, so a per-user read skips row groups
+by their statistics; files are opened memory-mapped.
+
+A run writes and fsyncs each batch's files before it deletes those applications
+from Mongo, so a crash in between leaves them in both tiers. Readers prefer the
+hot copy and compaction keeps one copy per application, so runs can simply be
+repeated. Compaction merges each month's part files into as few files as
+ARCHIVE_MAX_FILE_ROWS allows; a month is merged in memory.
+
+Archived applications are read-only: status updates only reach the hot tier.
+POST /profile and /save-psychometric upsert onto whichever of a user's
+documents matches first, which can be an application; applications carrying
+those fields are never archived, since the profile and psychometric reads only
+look at the hot tier.
+
+Usage:
+    python archive.py --run --older-than-days 180
+    python archive.py --compact
+    python archive.py --stats
+"""
+import argparse
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from bson import json_util
+
+from export_applications import EXPORT_COLUMNS, EXPORT_CHUNK_SIZE, flatten_application, parquet_schema
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_STATUSES = [s.strip() for s in os.getenv("ARCHIVE_STATUSES", "approved,rejected").split(",") if s.strip()]
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_MAX_FILE_ROWS = int(os.getenv("ARCHIVE_MAX_FILE_ROWS", "1000000"))
+ARCHIVE_ROW_GROUP_SIZE = 16384
+SORT_KEYS = [("clerk_user_id", "ascending"), ("created", "ascending")]
+
+
+# -------------------- LAYOUT --------------------
+def archive_schema():
+    import pyarrow as pa
+    return parquet_schema().append(pa.field("document", pa.string()))
+
+
+def month_of(created):
+    if isinstance(created, datetime):
+        return created.strftime("%Y-%m")
+    return str(created)[:7]
+
+
+def month_dir(root, month):
+    return os.path.join(root, f"month={month}")
+
+
+def list_parts(root=ARCHIVE_DIR):
+    """{month: [part paths, oldest first]}"""
+    parts = {}
+    if not os.path.isdir(root):
+        return parts
+    for name in sorted(os.listdir(root)):
+        if not name.startswith("month="):
+            continue
+        files = sorted(f for f in os.listdir(os.path.join(root, name)) if f.startswith("part-") and f.endswith(".parquet"))
+        if files:
+            parts[name[len("month="):]] = [os.path.join(root, name, f) for f in files]
+    return parts
+
+
+def write_part(root, month, table):
+    """Write one sorted part file atomically (dot-prefixed temp file, fsync, rename); returns its path."""
+    import pyarrow.parquet as pq
+
+    directory = month_dir(root, month)
+    os.makedirs(directory, exist_ok=True)
+    name = f"part-{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}.parquet"
+    path = os.path.join(directory, name)
+    tmp = os.path.join(directory, f".{name}.tmp")
+    pq.write_table(table.sort_by(SORT_KEYS), tmp, compression="zstd", row_group_size=ARCHIVE_ROW_GROUP_SIZE)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def rows_table(rows):
+    import pyarrow as pa
+    schema = archive_schema()
+    return pa.Table.from_pydict({f.name: [r[f.name] for r in rows] for f in schema}, schema=schema)
+
+
+# -------------------- ARCHIVING --------------------
+# Per-user fields that may have been written onto an application document
+USER_RECORD_FIELDS = ("profile", "psychometric_score")
+
+
+def archivable(statuses=ARCHIVE_STATUSES):
+    """Closed applications that do not also hold the user's profile or psychometric score."""
+    return {"status": {"$in": list(statuses)}, **{field: {"$exists": False} for field in USER_RECORD_FIELDS}}
+
+
+def archive_query(cutoff, statuses=ARCHIVE_STATUSES):
+    return {**archivable(statuses), "created": {"$lt": cutoff}}
+
+
+def archive_applications(coll, root=ARCHIVE_DIR, cutoff=None, statuses=ARCHIVE_STATUSES,
+                         batch_size=ARCHIVE_BATCH_SIZE):
+    """Move closed applications created before `cutoff` to the archive, one batch at a time."""
+    cutoff = cutoff or datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    query = archive_query(cutoff, statuses)
+    stats = {"archived": 0, "files": 0, "months": set(), "skipped": 0}
+    last_id = None
+    while True:
+        batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+        docs = list(coll.find(batch_query).sort("_id", 1).limit(batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        by_month = {}
+        for doc in docs:
+            row = flatten_application(doc)
+            row["document"] = json_util.dumps(doc)
+            by_month.setdefault(month_of(doc["created"]), []).append(row)
+        for month, rows in by_month.items():
+            write_part(root, month, rows_table(rows))
+            stats["files"] += 1
+            stats["months"].add(month)
+
+        # Only delete what is still closed and still no user record: an application reopened
+        # (or given a profile) meanwhile stays hot, and the hot copy wins on read
+        ids = [doc["_id"] for doc in docs]
+        deleted = coll.delete_many({"_id": {"$in": ids}, **archivable(statuses)}).deleted_count
+        stats["archived"] += deleted
+        stats["skipped"] += len(ids) - deleted
+        print(f"Archived {stats['archived']} applications ({stats['files']} files)")
+    stats["months"] = sorted(stats["months"])
+    return stats
+
+
+# -------------------- READING --------------------
+def _dataset(root):
+    import pyarrow.dataset as ds
+    from pyarrow.fs import LocalFileSystem
+
+    return ds.dataset(root, format="parquet", partitioning="hive", schema=_partitioned_schema(),
+                      filesystem=LocalFileSystem(use_mmap=True))
+
+
+def _partitioned_schema():
+    import pyarrow as pa
+    return archive_schema().append(pa.field("month", pa.string()))
+
+
+def _scan(root, expression, columns):
+    """Batches from the archive; restarted once if compaction swaps files before the first batch."""
+    for attempt in range(2):
+        started = False
+        try:
+            for batch in _dataset(root).to_batches(filter=expression, columns=columns):
+                started = True
+                yield batch
+            return
+        except OSError:
+            if attempt or started:
+                raise
+
+
+def archived_applications(clerk_user_id, root=ARCHIVE_DIR):
+    """All archived application documents of one user (one copy each)."""
+    import pyarrow.dataset as ds
+
+    if not list_parts(root):
+        return []
+    docs = {}
+    for batch in _scan(root, ds.field("clerk_user_id") == clerk_user_id, ["mongo_id", "document"]):
+        for mongo_id, document in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+            docs[mongo_id] = json_util.loads(document)
+    return list(docs.values())
+
+
+def merge_tiers(hot_docs, archived_docs):
+    """Hot documents plus the archived ones not also still in the hot tier (needs `_id` on both)."""
+    hot_ids = {doc.get("_id") for doc in hot_docs}
+    return list(hot_docs) + [doc for doc in archived_docs if doc.get("_id") not in hot_ids]
+
+
+def filter_expression(query):
+    """pyarrow filter for the Mongo query built by export_applications.build_export_query."""
+    import pyarrow.dataset as ds
+
+    expression = None
+
+    def both(e):
+        return e if expression is None else expression & e
+
+    created = query.get("created") or {}
+    if "$gte" in created:
+        expression = both((ds.field("created") >= created["$gte"]) & (ds.field("month") >= month_of(created["$gte"])))
+    if "$lt" in created:
+        expression = both((ds.field("created") < created["$lt"]) & (ds.field("month") <= month_of(created["$lt"])))
+    if "status" in query:
+        expression = both(ds.field("status").isin(query["status"]["$in"]))
+    if "model_output.tier" in query:
+        expression = both(ds.field("model_output.tier").isin(query["model_output.tier"]["$in"]))
+    return expression
+
+
+def iter_archived_chunks(root=ARCHIVE_DIR, query=None, chunk_size=EXPORT_CHUNK_SIZE, hot_coll=None):
+    """
+    Export rows from the archive matching `query`, chunk_size at a time. With `hot_coll`,
+    applications still present in the hot tier are skipped (they are exported from there).
+    """
+    import pyarrow.dataset as ds
+
+    parts = list_parts(root)
+    base = filter_expression(query or {})
+    # One month at a time: duplicates from an interrupted run live in the same month
+    for month in parts:
+        expression = ds.field("month") == month
+        if base is not None:
+            expression = expression & base
+        seen = set()
+        chunk = []
+        for batch in _scan(root, expression, EXPORT_COLUMNS):
+            rows = [row for row in batch.to_pylist() if row["mongo_id"] not in seen]
+            seen.update(row["mongo_id"] for row in rows)
+            if hot_coll is not None and rows:
+                hot = _hot_ids(hot_coll, [row["mongo_id"] for row in rows])
+                rows = [row for row in rows if row["mongo_id"] not in hot]
+            chunk.extend(rows)
+            while len(chunk) >= chunk_size:
+                yield chunk[:chunk_size]
+                chunk = chunk[chunk_size:]
+        if chunk:
+            yield chunk
+
+
+def _hot_ids(coll, mongo_ids):
+    from bson import ObjectId
+    from bson.errors import InvalidId
+
+    ids = []
+    for mongo_id in mongo_ids:
+        try:
+            ids.append(ObjectId(mongo_id))
+        except (InvalidId, TypeError):
+            ids.append(mongo_id)
+    return {str(doc["_id"]) for doc in coll.find({"_id": {"$in": ids}}, {"_id": 1})}
+
+
+# -------------------- COMPACTION --------------------
+def compact(root=ARCHIVE_DIR, max_file_rows=ARCHIVE_MAX_FILE_ROWS, months=None):
+    """Merge each month's part files, keeping the newest copy of every application."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    stats = {}
+    for month, paths in list_parts(root).items():
+        if (months and month not in months) or len(paths) < 2:
+            continue
+        table = pa.concat_tables([pq.read_table(p, memory_map=True, schema=archive_schema()) for p in paths])
+        # Part names sort by write time, so the last occurrence of an id is the newest copy
+        table = table.append_column("_row", pa.array(range(len(table)), pa.int64()))
+        keep = table.group_by("mongo_id").aggregate([("_row", "max")]).column("_row_max")
+        table = table.take(keep).drop_columns(["_row"]).sort_by(SORT_KEYS)
+
+        written = [write_part(root, month, table.slice(start, max_file_rows))
+                   for start in range(0, len(table), max_file_rows)]
+        for path in paths:
+            os.remove(path)
+        stats[month] = {"files_before": len(paths), "files_after": len(written), "rows": len(table)}
+        print(f"Compacted {month}: {len(paths)} -> {len(written)} files, {len(table)} rows")
+    return stats
+
+
+def archive_stats(root=ARCHIVE_DIR):
+    import pyarrow.parquet as pq
+
+    months = {}
+    for month, paths in list_parts(root).items():
+        months[month] = {
+            "files": len(paths),
+            "rows": sum(pq.ParquetFile(p).metadata.num_rows for p in paths),
+            "bytes": sum(os.path.getsize(p) for p in paths),
+        }
+    return months
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive closed applications to monthly Parquet partitions")
+    parser.add_argument("--run", action="store_true", help="move closed applications past the cutoff")
+    parser.add_argument("--compact", action="store_true", help="merge each month's part files")
+    parser.add_argument("--stats", action="store_true")
+    parser.add_argument("--root", default=ARCHIVE_DIR)
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--statuses", default=",".join(ARCHIVE_STATUSES))
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--max-file-rows", type=int, default=ARCHIVE_MAX_FILE_ROWS)
+    args = parser.parse_args()
+
+    if args.run:
+        from db import users_coll
+        cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+        statuses = [s.strip() for s in args.statuses.split(",") if s.strip()]
+        stats = archive_applications(users_coll, args.root, cutoff, statuses, args.batch_size)
+        print(f"Archived {stats['archived']} applications created before {cutoff:%Y-%m-%d} "
+              f"into {len(stats['months'])} months ({stats['skipped']} reopened meanwhile, left hot)")
+    if args.compact:
+        compact(args.root, args.max_file_rows)
+    if args.stats or not (args.run or args.compact):
+        for month, s in archive_stats(args.root).items():
+            print(f"{month}: {s['files']} files, {s['rows']} rows, {s['bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
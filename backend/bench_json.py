@@ -0,0 +1,105 @@
+"""
+Serialization benchmark: FastAPI's default JSON path vs FastJSONResponse.
+
+Builds an /admin/applications/{clerk_user_id}-shaped payload from synthetic
+applicants (datetimes, nested raw/model_output dicts, NumPy floats in the SHAP
+values) and times rendering it both ways. The default path is what FastAPI
+does for a plain dict: jsonable_encoder followed by JSONResponse.render.
+Peak allocations are measured with tracemalloc.
+
+Usage:
+    python bench_json.py --applications 2000 --repeat 5
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from data_generator import generate_applicants, to_onboard_records
+from fast_json import FastJSONResponse
+
+TIERS = ["A+", "A", "B", "C", "D", "E"]
+
+
+def build_payload(n, seed=0):
+    rng = np.random.default_rng(seed)
+    records = to_onboard_records(generate_applicants(n, seed=seed))
+    created = datetime(2025, 1, 1)
+    applications = []
+    for i, raw in enumerate(records):
+        pd_value = rng.random()
+        applications.append({
+            "_id": ObjectId(),
+            "raw": raw,
+            "model_output": {
+                "pd": np.float64(pd_value),
+                "tier": TIERS[int(pd_value * len(TIERS))],
+                "alt_cibil_score": np.float64(300 + 600 * (1 - pd_value)),
+                "eligible_amount": int(raw["loan_amount_requested"] * 0.6),
+                "decision": "Approved" if pd_value < 0.3 else "Review",
+                "top_shap": [
+                    {"feature": f"num__feature_{k}", "shap": np.float32(rng.normal())}
+                    for k in range(5)
+                ],
+            },
+            "created": created + timedelta(minutes=i),
+            "status": "pending",
+            "user_notification": {"read": False, "timestamp": created + timedelta(minutes=i, seconds=30)},
+        })
+    return {"clerk_user_id": "bench_user", "profile": {"name": "Bench"}, "applications": applications}
+
+
+# jsonable_encoder rejects np.float32 outright, so the baseline needs custom encoders to run at all
+DEFAULT_ENCODERS = {ObjectId: str, np.generic: lambda v: v.item()}
+
+
+def default_render(payload):
+    return JSONResponse(jsonable_encoder(payload, custom_encoder=DEFAULT_ENCODERS)).body
+
+
+def fast_render(payload):
+    return FastJSONResponse(payload).body
+
+
+def measure(fn, payload, repeat):
+    fn(payload)  # warm-up
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn(payload)
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    fn(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"best_s": min(times), "mean_s": sum(times) / len(times), "peak_mb": peak / 1e6, "bytes": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON serialization paths for large Mongo payloads")
+    parser.add_argument("--applications", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = build_payload(args.applications)
+    results = {
+        "jsonable_encoder + json": measure(default_render, payload, args.repeat),
+        "FastJSONResponse (orjson)": measure(fast_render, payload, args.repeat),
+    }
+
+    print(f"{args.applications} applications, best of {args.repeat}")
+    print(f"{'path':<28}{'best ms':>10}{'mean ms':>10}{'peak MB':>10}{'KB out':>10}")
+    for name, r in results.items():
+        print(f"{name:<28}{r['best_s'] * 1e3:>10.1f}{r['mean_s'] * 1e3:>10.1f}{r['peak_mb']:>10.1f}{r['bytes'] / 1e3:>10.0f}")
+    base, fast = results.values()
+    print(f"speed-up: {base['best_s'] / fast['best_s']:.1f}x, peak allocations: {base['peak_mb'] / fast['peak_mb']:.1f}x lower")
+
+
+if __name__ == "__main__":
+    main()
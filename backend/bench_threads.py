@@ -0,0 +1,113 @@
+"""
+Inference thread benchmark: slots x native threads per slot x client concurrency.
+
+Loads the bundle once, then for every (INFERENCE_SLOTS, INFERENCE_THREADS_PER_SLOT)
+configuration and every concurrency level, fires --requests single-application
+scoring calls (with SHAP) from that many client threads, the way FastAPI's
+thread pool would. "off" is the ungoverned baseline: no slots, libraries use
+their default thread counts. Prints throughput and latency percentiles per
+cell and the configuration with the best worst-case throughput.
+
+Usage:
+    python bench_threads.py --requests 400 --concurrency 1,4,16,64
+    python bench_threads.py --configs off,2x1,4x1,2x2 --batch 32 --explain-mode path
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from data_generator import generate_applicants
+from inference_slots import InferenceSlots
+from model_runtime import ModelRuntime
+from models import BUNDLE_PATH
+
+
+def default_configs(cpus):
+    """off, then slots x threads_per_slot with slots * threads between cpus / 2 and 2 * cpus."""
+    configs = ["off"]
+    for threads in (1, 2, 4):
+        for slots in sorted({1, 2, 4, cpus // 2, cpus, 2 * cpus}):
+            if slots >= 1 and max(cpus // 2, 1) <= slots * threads <= 2 * cpus:
+                configs.append(f"{slots}x{threads}")
+    return list(dict.fromkeys(configs))
+
+
+def parse_config(text):
+    if text == "off":
+        return 0, 1
+    slots, _, threads = text.partition("x")
+    return int(slots), int(threads or 1)
+
+
+def run_cell(model, records, concurrency, requests, batch, explain_mode):
+    latencies = []
+
+    def call(i):
+        t0 = time.perf_counter()
+        if batch > 1:
+            start = (i * batch) % (len(records) - batch)
+            model.infer_batch(records[start:start + batch], track=False, explain_mode=explain_mode)
+        else:
+            model.infer(records[i % len(records)], track=False, explain_mode=explain_mode)
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    # A fresh pool per cell: new threads start from the libraries' default thread counts
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - t0
+    lat = np.array(latencies) * 1e3
+    return {
+        "throughput": requests * batch / elapsed,
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p99_ms": float(np.percentile(lat, 99)),
+    }
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Benchmark inference slots / native thread limits under concurrency")
+    parser.add_argument("--bundle", default=BUNDLE_PATH)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--configs", help=f"comma-separated SLOTSxTHREADS or off (default: {','.join(default_configs(cpus))})")
+    parser.add_argument("--batch", type=int, default=1, help="applications per call")
+    parser.add_argument("--explain-mode", default="exact", choices=["exact", "path"])
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    configs = args.configs.split(",") if args.configs else default_configs(cpus)
+    slots = InferenceSlots(0, 1)
+    model = ModelRuntime(bundle_path=args.bundle, warmup_rows=16, check_mongo=False, slots=slots)
+    model.start(background=False)
+    if not model.ready:
+        raise SystemExit(f"Model failed to load: {model.error}")
+    records = generate_applicants(max(1000, args.batch * 4), seed=1).to_dict("records")
+
+    print(f"{cpus} CPUs, {args.requests} calls per cell, batch {args.batch}, explain {args.explain_mode}")
+    print(f"{'config':<8}{'conc':>6}{'apps/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    summary = {}
+    for config in configs:
+        slots.configure(*parse_config(config))
+        run_cell(model, records, 1, 20, args.batch, args.explain_mode)
+        cells = []
+        for level in levels:
+            r = run_cell(model, records, level, args.requests, args.batch, args.explain_mode)
+            cells.append(r)
+            print(f"{config:<8}{level:>6}{r['throughput']:>10.1f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+        summary[config] = min(c["throughput"] for c in cells)
+
+    best = max(summary, key=summary.get)
+    slots_n, threads = parse_config(best)
+    print(f"best worst-case throughput: {best} ({summary[best]:.1f} apps/s)")
+    if best == "off":
+        print("suggested: INFERENCE_SLOTS=0")
+    else:
+        print(f"suggested: INFERENCE_SLOTS={slots_n} INFERENCE_THREADS_PER_SLOT={threads}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Bulk onboarding ingestion for partner cooperatives and field agents.
+
+Uploads are parsed as they stream in (NDJSON one object per line, or CSV with a
+header row, where a quoted field may span lines), validated
+in column chunks against OnboardRequest and written with one unordered
+insert_many per chunk. Only one chunk is held at a time, so memory stays flat
+whatever the size of the file.
+
+Usage:
+    python bulk_ingest.py applicants.ndjson --batch-size 1000 --score --encode
+    python bulk_ingest.py applicants.csv --format csv
+"""
+import argparse
+import codecs
+import csv
+import json
+import typing
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+from pymongo.errors import BulkWriteError
+
+from feature_store import FEATURES_FIELD
+from schemas import OnboardRequest
+
+BULK_FORMATS = {"ndjson", "csv"}
+BULK_MAX_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+TRUE_STRINGS = {"true", "1", "yes", "y"}
+FALSE_STRINGS = {"false", "0", "no", "n"}
+
+
+def _schema_fields(schema):
+    """(name, base type, required, default) for every field of a pydantic model."""
+    fields = []
+    for name, field in schema.model_fields.items():
+        args = [a for a in typing.get_args(field.annotation) if a is not type(None)]
+        base = args[0] if args else field.annotation
+        fields.append((name, base, field.is_required(), field.default))
+    return fields
+
+
+ONBOARD_FIELDS = _schema_fields(OnboardRequest)
+
+
+def validate_chunk(rows, schema_fields=ONBOARD_FIELDS):
+    """
+    Validate a list of parsed rows column by column.
+
+    Returns (raws, errors): raws is a list of (position, raw dict) for the
+    valid rows, errors maps row position -> list of messages.
+    """
+    import pandas as pd
+
+    n = len(rows)
+    frame = pd.DataFrame.from_records(rows) if n else pd.DataFrame()
+    errors = {}
+    columns = {}
+
+    def flag(mask, message):
+        for i in np.flatnonzero(mask):
+            errors.setdefault(int(i), []).append(message)
+
+    for name, base, required, default in schema_fields:
+        col = frame[name] if name in frame.columns else pd.Series([None] * n, dtype=object)
+        missing = col.astype("string").str.strip().fillna("").eq("").to_numpy()
+        if required:
+            flag(missing, f"{name}: field required")
+
+        if base is float or base is int:
+            values = pd.to_numeric(col, errors="coerce")
+            invalid = ~missing & values.isna().to_numpy()
+            flag(invalid, f"{name}: not a valid number")
+            if base is int:
+                fractional = ~missing & ~invalid & (values.fillna(0) % 1 != 0).to_numpy()
+                flag(fractional, f"{name}: not a valid integer")
+                values = values.fillna(0).astype(int)
+            else:
+                # same rule as /onboard: a missing ratio is stored as 0.0
+                values = values.astype(float).fillna(0.0)
+            columns[name] = values
+        elif base is bool:
+            text = col.astype("string").str.strip().str.lower()
+            truthy = text.isin(TRUE_STRINGS).to_numpy()
+            falsy = text.isin(FALSE_STRINGS).to_numpy()
+            flag(~missing & ~truthy & ~falsy, f"{name}: not a valid boolean")
+            columns[name] = pd.Series(np.where(missing, bool(default), truthy))
+        else:
+            not_str = ~missing & ~col.map(lambda v: isinstance(v, str)).to_numpy()
+            flag(not_str, f"{name}: not a valid string")
+            columns[name] = col.astype("string").str.strip()
+
+    valid = [i for i in range(n) if i not in errors]
+    if not valid:
+        return [], errors
+    checked = pd.DataFrame(columns).iloc[valid]
+    raws = checked.astype(object).where(checked.notna(), None).to_dict("records")
+    return list(zip(valid, raws)), errors
+
+
+class _LineQueue:
+    """Iterator over lines pushed in as they arrive, for one csv.reader spanning the whole upload."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+class BulkIngestor:
+    """Buffers parsed rows and writes them out one chunk at a time."""
+
+    def __init__(self, coll, fmt="ndjson", batch_size=500, scorer=None, max_errors=MAX_REPORTED_ERRORS,
+                 on_insert=None, encoder=None):
+        if fmt not in BULK_FORMATS:
+            raise ValueError(f"Unsupported format {fmt!r}. Allowed: {sorted(BULK_FORMATS)}")
+        self.coll = coll
+        self.fmt = fmt
+        self.batch_size = max(1, min(int(batch_size), BULK_MAX_BATCH_SIZE))
+        self.scorer = scorer
+        # raws -> stored feature vectors (FeatureStore.fields), so re-scoring skips the preprocessor
+        self.encoder = encoder
+        # Called with the documents that were actually inserted (e.g. portfolio rollups)
+        self.on_insert = on_insert
+        self.max_errors = max_errors
+        self.header = None
+        self._csv_lines = _LineQueue()
+        self._csv_reader = csv.reader(self._csv_lines)
+        self._csv_open = False   # inside a quoted field that continues on the next line
+        self.row_no = 0
+        self.rows = []
+        self.row_numbers = []
+        self.summary = {
+            "received": 0,
+            "inserted": 0,
+            "failed": 0,
+            "scored": 0,
+            "chunks": 0,
+            "errors": [],
+            "errors_truncated": False,
+        }
+
+    def _error(self, row_no, messages):
+        self.summary["failed"] += 1
+        if len(self.summary["errors"]) < self.max_errors:
+            self.summary["errors"].append({"row": row_no, "errors": messages})
+        else:
+            self.summary["errors_truncated"] = True
+
+    def _csv_record(self, line):
+        """
+        Queue one physical line for the CSV reader. Returns the record's values once its
+        quoted fields are closed (quotes are balanced), None while it continues.
+        """
+        line = line.rstrip("\r\n")
+        if not self._csv_open:
+            line = line.lstrip("\ufeff")
+            if not line.strip():
+                return None
+        # "" inside a quoted field is an escaped quote, so an odd count toggles the state
+        if line.count('"') % 2:
+            self._csv_open = not self._csv_open
+        self._csv_lines.lines.append(line + "\n")
+        if self._csv_open:
+            return None
+        return next(self._csv_reader)
+
+    def add_line(self, line):
+        """Parse one line of input. Returns True once a full chunk is buffered."""
+        if self.fmt == "csv":
+            values = self._csv_record(line)
+            if values is None:
+                return False
+            if self.header is None:
+                self.header = [h.strip() for h in values]
+                return False
+            self.row_no += 1
+            self.summary["received"] += 1
+            if len(values) != len(self.header):
+                self._error(self.row_no, [f"expected {len(self.header)} columns, got {len(values)}"])
+                return False
+            row = dict(zip(self.header, values))
+        else:
+            line = line.strip().lstrip("\ufeff")
+            if not line:
+                return False
+            self.row_no += 1
+            self.summary["received"] += 1
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                self._error(self.row_no, [f"invalid JSON: {e.msg}"])
+                return False
+            if not isinstance(row, dict):
+                self._error(self.row_no, ["expected a JSON object"])
+                return False
+
+        self.rows.append(row)
+        self.row_numbers.append(self.row_no)
+        return len(self.rows) >= self.batch_size
+
+    def flush(self):
+        """Validate, optionally score, and insert the buffered chunk."""
+        if not self.rows:
+            return
+        rows, row_numbers = self.rows, self.row_numbers
+        self.rows, self.row_numbers = [], []
+        self.summary["chunks"] += 1
+
+        valid, errors = validate_chunk(rows)
+        for pos in sorted(errors):
+            self._error(row_numbers[pos], errors[pos])
+        if not valid:
+            return
+
+        now = datetime.utcnow()
+        docs, doc_rows = [], []
+        for pos, raw in valid:
+            docs.append({
+                "clerk_user_id": raw["clerk_user_id"],
+                "raw": raw,
+                "created": now,
+                "status": "received",
+            })
+            doc_rows.append(row_numbers[pos])
+
+        if self.encoder is not None:
+            try:
+                for doc, features in zip(docs, self.encoder([d["raw"] for d in docs])):
+                    doc[FEATURES_FIELD] = features
+            except Exception as e:
+                print(f"Bulk encoding failed, storing chunk without feature vectors: {e}")
+
+        if self.scorer is not None:
+            try:
+                results = self.scorer([d["raw"] for d in docs])
+                for doc, result in zip(docs, results):
+                    doc["model_output"] = result
+                self.summary["scored"] += len(docs)
+            except Exception as e:
+                print(f"Bulk scoring failed, storing chunk unscored: {e}")
+
+        failed = set()
+        try:
+            result = self.coll.insert_many(docs, ordered=False)
+            self.summary["inserted"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            self.summary["inserted"] += e.details.get("nInserted", 0)
+            for we in e.details.get("writeErrors", []):
+                failed.add(we["index"])
+                self._error(doc_rows[we["index"]], [we.get("errmsg", "write failed")])
+        if self.on_insert is not None:
+            self.on_insert([d for i, d in enumerate(docs) if i not in failed])
+
+    def finish(self):
+        if self._csv_open:
+            # The upload ended inside a quoted field
+            self.row_no += 1
+            self.summary["received"] += 1
+            self._error(self.row_no, ["unterminated quoted field"])
+            self._csv_open = False
+        self.flush()
+        return self.summary
+
+
+async def aiter_lines(byte_chunks):
+    """Turn an async stream of byte chunks into decoded text lines."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in byte_chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def ingest_file(path, coll, fmt=None, batch_size=500, scorer=None, on_insert=None, encoder=None):
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    ingestor = BulkIngestor(coll, fmt=fmt, batch_size=batch_size, scorer=scorer, on_insert=on_insert,
+                            encoder=encoder)
+    with open(path, encoding="utf-8", newline="") as f:
+        for line in f:
+            if ingestor.add_line(line):
+                ingestor.flush()
+    return ingestor.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-onboard applicants from an NDJSON or CSV file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(BULK_FORMATS), help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--score", action="store_true", help="score each chunk before inserting it")
+    parser.add_argument("--encode", action="store_true", help="store encoded feature vectors (see feature_store.py)")
+    args = parser.parse_args()
+
+    from db import rollups_coll, users_coll
+    from rollups import RollupBuffer
+
+    scorer = encoder = None
+    if args.score or args.encode:
+        from model_runtime import ModelRuntime
+        model = ModelRuntime(warmup_rows=0)
+        model.start(background=False)
+        scorer = model.infer_batch if args.score else None
+        encoder = model.feature_store.fields if args.encode else None
+
+    rollup = RollupBuffer(rollups_coll)
+    rollup.start()
+    try:
+        summary = ingest_file(args.path, users_coll, fmt=args.format, batch_size=args.batch_size, scorer=scorer,
+                              on_insert=rollup.record_many, encoder=encoder)
+    finally:
+        rollup.stop()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
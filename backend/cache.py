@@ -0,0 +1,115 @@
+"""
+In-process read-through cache for small per-user records (profile, psychometric score).
+
+Dashboard renders read the same records over and over. `get_or_load` serves
+them from memory and only goes to Mongo on a miss or once an entry is older
+than USER_CACHE_TTL seconds. At most USER_CACHE_MAX_ENTRIES records are kept
+per cache, least recently used first out.
+
+Endpoints that write a record put the new value in the cache themselves
+(`set`), so the worker that took the write never serves the old one. Other
+workers have their own caches and can serve the old value for up to the TTL.
+A load that races a write never overwrites the written value.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+USER_CACHE_TTL_S = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, name, ttl=USER_CACHE_TTL_S, max_entries=USER_CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._loading = {}              # key -> token of the load in flight
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[0] <= self.clock():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def get_or_load(self, key, loader):
+        """Cached value for `key`, else loader(key) (cached; None is a value too)."""
+        if not self.enabled:
+            return loader(key)
+        token = object()
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.hits += 1
+                metrics.inc("user_cache_hits", cache=self.name)
+                return value
+            self.misses += 1
+            self._loading[key] = token
+        metrics.inc("user_cache_misses", cache=self.name)
+        # Mongo is queried outside the lock; a set/invalidate meanwhile discards this result
+        value = loader(key)
+        with self._lock:
+            if self._loading.get(key) is token:
+                del self._loading[key]
+                self._store(key, value)
+        return value
+
+    def set(self, key, value):
+        """Write-through: `value` is what the caller just wrote to Mongo."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._loading.pop(key, None)
+            self._store(key, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._loading.pop(key, None)
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._loading.clear()
+            self._entries.clear()
+
+    def _store(self, key, value):
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def status(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
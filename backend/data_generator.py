@@ -0,0 +1,200 @@
+"""
+Synthetic applicant generator.
+
+Importable, seeded and vectorised version of the generative model in
+BharatScore_DataGeneration.ipynb. Rows come out in batches so millions of
+OnboardRequest-shaped records can be produced in bounded memory.
+
+Usage:
+    python data_generator.py 1000000 applicants.ndjson --seed 42
+    python data_generator.py 5000 training.csv --with-labels
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+TARGET_DEFAULT_RATE = 0.20
+CALIBRATION_SIZE = 100_000
+
+LOAN_CATEGORIES = ["education", "farmer", "startup", "personal"]
+USER_TYPES = (["smartphone", "feature_phone"], [0.7, 0.3])
+REGIONS = (["urban", "rural"], [0.6, 0.4])
+AGE_GROUPS = (["18-30", "31-50", "51-70"], [0.4, 0.4, 0.2])
+RECHARGE_PATTERNS = (["always_on_time", "sometimes_late", "often_late"], [0.6, 0.3, 0.1])
+
+WEIGHTS = {
+    "sms": -0.6,
+    "bill": -2.0,
+    "recharge": -1.2,
+    "sim": -0.3,
+    "loc": -1.5,
+    "income": -2.5,
+    "coop": -0.01,
+    "land": -0.8,
+    "psych": -2.8,
+}
+
+ONBOARD_COLUMNS = [
+    "user_type", "region", "sms_count", "bill_on_time_ratio", "recharge_freq", "sim_tenure",
+    "location_stability", "income_signal", "coop_score", "land_verified", "age_group",
+    "loan_amount_requested", "recharge_pattern", "loan_category", "psychometric_score",
+]
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def sample_features(n, rng):
+    """Draw n applicants' features, following the notebook's distributions."""
+    user_type = rng.choice(USER_TYPES[0], size=n, p=USER_TYPES[1])
+    region = rng.choice(REGIONS[0], size=n, p=REGIONS[1])
+    age_group = rng.choice(AGE_GROUPS[0], size=n, p=AGE_GROUPS[1])
+
+    sms_count = np.where(user_type == "smartphone", rng.poisson(30, size=n), rng.poisson(8, size=n))
+    bill_on_time_ratio = np.clip(rng.beta(5, 2, n), 0, 1)
+
+    recharge_pattern = rng.choice(RECHARGE_PATTERNS[0], size=n, p=RECHARGE_PATTERNS[1])
+    recharge_freq = np.where(
+        recharge_pattern == "always_on_time", 1.0,
+        np.where(recharge_pattern == "sometimes_late", 0.5, 0.2)
+    )
+
+    sim_tenure = rng.integers(1, 121, n)
+    location_stability = np.where(
+        region == "urban",
+        np.clip(rng.normal(0.8, 0.1, n), 0, 1),
+        np.clip(rng.normal(0.6, 0.15, n), 0, 1)
+    )
+
+    income_signal = np.clip(bill_on_time_ratio + rng.normal(0, 0.1, n), 0, 1)
+    coop_score = np.clip(rng.normal(65, 15, n), 0, 100)
+    land_verified = np.where(region == "rural", rng.binomial(1, 0.35, n), rng.binomial(1, 0.1, n))
+    psychometric_score = np.clip(rng.normal(0.6, 0.15, n), 0, 1)
+
+    loan_amount_requested = rng.integers(10000, 500000, n)
+    loan_category = rng.choice(LOAN_CATEGORIES, size=n)
+
+    return pd.DataFrame({
+        "user_type": user_type,
+        "region": region,
+        "age_group": age_group,
+        "sms_count": sms_count,
+        "bill_on_time_ratio": bill_on_time_ratio,
+        "recharge_pattern": recharge_pattern,
+        "recharge_freq": recharge_freq,
+        "sim_tenure": sim_tenure,
+        "location_stability": location_stability,
+        "income_signal": income_signal,
+        "coop_score": coop_score,
+        "land_verified": land_verified,
+        "psychometric_score": psychometric_score,
+        "loan_amount_requested": loan_amount_requested,
+        "loan_category": loan_category,
+    })
+
+
+def linear_score(df, sms_scale):
+    """Notebook risk score before the intercept (higher = riskier)."""
+    score = (
+        WEIGHTS["sms"] * (df["sms_count"].to_numpy() / sms_scale)
+        + WEIGHTS["bill"] * df["bill_on_time_ratio"].to_numpy()
+        + WEIGHTS["recharge"] * df["recharge_freq"].to_numpy()
+        + WEIGHTS["sim"] * (df["sim_tenure"].to_numpy() / 120)
+        + WEIGHTS["loc"] * df["location_stability"].to_numpy()
+        + WEIGHTS["income"] * df["income_signal"].to_numpy()
+        + WEIGHTS["coop"] * (df["coop_score"].to_numpy() / 100)
+        + WEIGHTS["land"] * df["land_verified"].to_numpy()
+        + WEIGHTS["psych"] * df["psychometric_score"].to_numpy()
+    )
+    # Recharge penalty
+    score += np.where(df["recharge_pattern"].to_numpy() == "often_late", -1.5, 0)
+    # Rural + low coop score interaction
+    score += -1.0 * ((df["region"].to_numpy() == "rural") & (df["coop_score"].to_numpy() < 50))
+    # Income threshold effect
+    score += np.where(df["income_signal"].to_numpy() < 0.3, -2, 0)
+    return score
+
+
+def calibrate(seed=42, target_rate=TARGET_DEFAULT_RATE, size=CALIBRATION_SIZE):
+    """
+    Fix the sms normaliser and intercept once from a calibration sample, so every
+    batch shares the same mapping from features to pd (the notebook derives both
+    from the full dataset).
+    """
+    from scipy.optimize import brentq
+
+    rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(1)[0])
+    sample = sample_features(size, rng)
+    sms_scale = float(sample["sms_count"].max() + 1)
+    base = linear_score(sample, sms_scale)
+    intercept = brentq(lambda b: sigmoid(base + b).mean() - target_rate, -10, 10)
+    return sms_scale, intercept
+
+
+def generate_applicants(n, seed=42, with_labels=False, calibration=None):
+    """Generate n applicants in one frame. Same seed -> same rows."""
+    return next(iter_applicant_batches(n, batch_size=max(n, 1), seed=seed,
+                                       with_labels=with_labels, calibration=calibration))
+
+
+def iter_applicant_batches(n, batch_size=100_000, seed=42, with_labels=False, calibration=None):
+    """
+    Yield DataFrames of at most batch_size applicants until n have been produced.
+    Each batch draws from its own child of SeedSequence(seed), so output is
+    reproducible for a given (seed, batch_size).
+    """
+    if with_labels and calibration is None:
+        calibration = calibrate(seed)
+    children = np.random.SeedSequence(seed).spawn(1 + (n + batch_size - 1) // batch_size)[1:]
+    produced = 0
+    for child in children:
+        size = min(batch_size, n - produced)
+        if size <= 0:
+            break
+        rng = np.random.default_rng(child)
+        df = sample_features(size, rng)
+        if with_labels:
+            sms_scale, intercept = calibration
+            pd_values = np.clip(sigmoid(linear_score(df, sms_scale) + intercept), 0.0001, 0.9999)
+            df["pd"] = pd_values
+            df["default"] = (rng.random(size) < pd_values).astype(int)
+        produced += size
+        yield df
+
+
+def to_onboard_records(df, id_prefix="synthetic_user_", start=0, extra_columns=()):
+    """OnboardRequest-shaped dicts for a generated batch."""
+    out = df[ONBOARD_COLUMNS + list(extra_columns)].to_dict("records")
+    for i, rec in enumerate(out):
+        rec["clerk_user_id"] = f"{id_prefix}{start + i:07d}"
+        rec["consent"] = True
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic BharatScore applicants")
+    parser.add_argument("n", type=int)
+    parser.add_argument("path", help=".ndjson (OnboardRequest rows) or .csv")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--with-labels", action="store_true", help="include notebook pd and default columns")
+    args = parser.parse_args()
+
+    written = 0
+    with open(args.path, "w", encoding="utf-8", newline="") as f:
+        for df in iter_applicant_batches(args.n, args.batch_size, args.seed, with_labels=args.with_labels):
+            if args.path.lower().endswith(".csv"):
+                df.to_csv(f, header=written == 0, index=False)
+            else:
+                extra = ["pd", "default"] if args.with_labels else []
+                for rec in to_onboard_records(df, start=written, extra_columns=extra):
+                    f.write(json.dumps(rec) + "\n")
+            written += len(df)
+            print(f"{written}/{args.n} applicants written")
+
+
+if __name__ == "__main__":
+    main()
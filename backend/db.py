@@ -0,0 +1,48 @@
+import os
+import threading
+import pymongo
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# MongoDB connection, shared by the API and the command-line jobs.
+# The client is only created on first use, so importing this module is cheap.
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                client = pymongo.MongoClient(os.getenv("MONGO_URI"))
+    return client
+
+def get_db():
+    return get_client()["bharatscore"]
+
+class LazyCollection:
+    """Collection handle that resolves against the current client on every use."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+users_coll = LazyCollection("users")
+sketches_coll = LazyCollection("distribution_sketches")
+shap_summaries_coll = LazyCollection("shap_summaries")
+notifications_coll = LazyCollection("notifications")
+rollups_coll = LazyCollection("portfolio_rollups")
+portfolio_sims_coll = LazyCollection("portfolio_simulations")
+# Leases for background jobs that only one worker process should run at a time
+leases_coll = LazyCollection("job_leases")
+
+def use_client(new_client):
+    """Point the shared handles at another client, e.g. mongomock.MongoClient() for in-process load tests."""
+    global client
+    client = new_client
+
+def ping():
+    get_client().admin.command("ping")
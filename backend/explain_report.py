@@ -0,0 +1,116 @@
+"""
+Offline accuracy/latency report: path attributions vs exact TreeSHAP.
+
+Scores synthetic applicants from data_generator with both explainers and
+reports, for each top-k:
+  - overlap:        share of the exact top-k features also in the path top-k
+  - top1:           same most important feature
+  - sign agreement: path value has the exact value's sign, over the exact top-k
+  - rank corr.:     Spearman correlation of |attributions| per row
+plus single-row and batch latency for both modes.
+
+Usage:
+    python explain_report.py --rows 5000 --seed 7
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from data_generator import generate_applicants
+from inference_utils import prepare_batch
+from model_runtime import ModelRuntime
+
+
+def encode(model, df):
+    return model.inference.pre.transform(prepare_batch(df))
+
+
+def exact_values(explainer, X):
+    out = explainer.shap_values(X)
+    return np.asarray(out[1] if isinstance(out, list) else out)
+
+
+def spearman_rows(a, b):
+    ra = np.argsort(np.argsort(a, axis=1), axis=1).astype(float)
+    rb = np.argsort(np.argsort(b, axis=1), axis=1).astype(float)
+    ra -= ra.mean(axis=1, keepdims=True)
+    rb -= rb.mean(axis=1, keepdims=True)
+    denom = np.sqrt((ra ** 2).sum(axis=1) * (rb ** 2).sum(axis=1))
+    return (ra * rb).sum(axis=1) / np.where(denom == 0, 1, denom)
+
+
+def agreement(exact, approx, k):
+    top_exact = np.argsort(-np.abs(exact), axis=1)[:, :k]
+    top_approx = np.argsort(-np.abs(approx), axis=1)[:, :k]
+    overlap = np.mean([len(set(e) & set(a)) / k for e, a in zip(top_exact, top_approx)])
+    rows = np.arange(len(exact))[:, None]
+    signs = np.sign(exact[rows, top_exact]) == np.sign(approx[rows, top_exact])
+    return {
+        "k": k,
+        "overlap": round(float(overlap), 4),
+        "top1": round(float(np.mean(top_exact[:, 0] == top_approx[:, 0])), 4),
+        "sign_agreement": round(float(signs.mean()), 4),
+    }
+
+
+def latency(fn, X, single_rows=200):
+    fn(X[:1])
+    t0 = time.perf_counter()
+    for i in range(min(single_rows, len(X))):
+        fn(X[i:i + 1])
+    single_ms = (time.perf_counter() - t0) / min(single_rows, len(X)) * 1e3
+    t0 = time.perf_counter()
+    fn(X)
+    batch_ms = (time.perf_counter() - t0) * 1e3
+    return {"single_row_ms": round(single_ms, 3), "batch_ms": round(batch_ms, 1)}
+
+
+def build_report(model, rows, seed, ks=(1, 3, 5)):
+    X = encode(model, generate_applicants(rows, seed=seed))
+    exact = exact_values(model.explainer, X)
+    approx = model.path_explainer.shap_values(X)
+    return {
+        "rows": rows,
+        "seed": seed,
+        "agreement": [agreement(exact, approx, k) for k in ks],
+        "rank_correlation": round(float(np.mean(spearman_rows(np.abs(exact), np.abs(approx)))), 4),
+        "latency": {
+            "exact": latency(lambda x: exact_values(model.explainer, x), X),
+            "path": latency(model.path_explainer.shap_values, X),
+        },
+    }
+
+
+def print_report(report):
+    print(f"Path attributions vs exact TreeSHAP on {report['rows']} synthetic applicants (seed {report['seed']})")
+    print(f"{'top-k':>6}{'overlap':>10}{'top1':>8}{'sign agr.':>11}")
+    for a in report["agreement"]:
+        print(f"{a['k']:>6}{a['overlap']:>10.3f}{a['top1']:>8.3f}{a['sign_agreement']:>11.3f}")
+    print(f"mean Spearman correlation of |attribution|: {report['rank_correlation']:.3f}")
+    for mode, t in report["latency"].items():
+        print(f"{mode:>6}: {t['single_row_ms']:.3f} ms/row single, {t['batch_ms']:.1f} ms for the batch")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare path attributions with exact SHAP")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    model = ModelRuntime(warmup_rows=0, check_mongo=False)
+    model.start(background=False)
+    if model.path_explainer is None:
+        raise SystemExit(f"Path explainer unavailable ({model.error or 'explainer is not LightGBM'})")
+
+    report = build_report(model, args.rows, args.seed)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
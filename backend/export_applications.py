@@ -0,0 +1,233 @@
+"""
+Streaming export of applications and model scores for analysts.
+
+Walks the users collection with a server-side cursor and a projection, flattens
+`raw` and `model_output` into fixed columns and emits CSV text chunks or Parquet
+row groups as it goes, so only one chunk of rows is ever held in memory.
+Archived applications (see archive.py) matching the same filters follow the hot
+ones unless --no-archive is given.
+
+Usage:
+    python export_applications.py applications.parquet --start 2025-01-01 --status approved,rejected
+    python export_applications.py applications.csv --tier A+,A
+"""
+import argparse
+import csv
+import io
+import json
+from datetime import datetime
+
+from schemas import OnboardRequest
+
+EXPORT_FORMATS = {"csv", "parquet"}
+EXPORT_CHUNK_SIZE = 5000
+
+RAW_FIELDS = list(OnboardRequest.model_fields)
+MODEL_FIELDS = [
+    "pd", "tier", "alt_cibil_score", "eligible_amount", "decision",
+    "final_cibil_score", "final_tier", "loan_approval_probability", "top_shap",
+]
+META_FIELDS = ["mongo_id", "clerk_user_id", "created", "status"]
+EXPORT_COLUMNS = META_FIELDS + [f"raw.{f}" for f in RAW_FIELDS] + [f"model_output.{f}" for f in MODEL_FIELDS]
+
+EXPORT_PROJECTION = {"clerk_user_id": 1, "created": 1, "status": 1, "raw": 1, "model_output": 1}
+
+
+def _column_types():
+    """Column name -> python type used to coerce values (and pick Parquet types)."""
+    types = {"mongo_id": str, "clerk_user_id": str, "created": datetime, "status": str}
+    for name, field in OnboardRequest.model_fields.items():
+        base = field.annotation
+        if base not in (str, int, float, bool):
+            base = float  # Optional[float]
+        types[f"raw.{name}"] = base
+    for name in MODEL_FIELDS:
+        types[f"model_output.{name}"] = str if name in ("tier", "decision", "final_tier", "top_shap") else float
+    types["model_output.eligible_amount"] = int
+    return types
+
+
+COLUMN_TYPES = _column_types()
+
+
+def _coerce(value, kind):
+    if value is None:
+        return None
+    try:
+        if kind is datetime:
+            return value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if kind is str:
+            return value if isinstance(value, str) else json.dumps(value, default=str)
+        if kind is bool:
+            return bool(value)
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_export_query(start=None, end=None, status=None, tier=None):
+    """Mongo filter for a date range on `created` and optional status / tier lists."""
+    query = {}
+    if start or end:
+        query["created"] = {}
+        if start:
+            query["created"]["$gte"] = start
+        if end:
+            query["created"]["$lt"] = end
+    if status:
+        query["status"] = {"$in": list(status)}
+    if tier:
+        query["model_output.tier"] = {"$in": list(tier)}
+    return query
+
+
+def flatten_application(doc):
+    """One application document -> one flat row keyed by EXPORT_COLUMNS."""
+    raw = doc.get("raw") or {}
+    model_output = doc.get("model_output") or {}
+    row = {
+        "mongo_id": str(doc["_id"]) if "_id" in doc else None,
+        "clerk_user_id": doc.get("clerk_user_id"),
+        "created": doc.get("created"),
+        "status": doc.get("status"),
+    }
+    for f in RAW_FIELDS:
+        row[f"raw.{f}"] = raw.get(f)
+    for f in MODEL_FIELDS:
+        row[f"model_output.{f}"] = model_output.get(f)
+    return {col: _coerce(row[col], COLUMN_TYPES[col]) for col in EXPORT_COLUMNS}
+
+
+def iter_application_chunks(coll, query=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of flattened rows, chunk_size at a time, from a server-side cursor."""
+    cursor = coll.find(query or {}, EXPORT_PROJECTION, batch_size=chunk_size).sort("_id", 1)
+    chunk = []
+    try:
+        for doc in cursor:
+            chunk.append(flatten_application(doc))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        cursor.close()
+
+
+def iter_csv(row_chunks):
+    """Encode row chunks as CSV, one bytes block per chunk (header first)."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buf.getvalue().encode("utf-8")
+    for chunk in row_chunks:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(
+            {k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()} for row in chunk
+        )
+        yield buf.getvalue().encode("utf-8")
+
+
+class _ByteSink:
+    """Minimal writable file object that hands written bytes back to the caller."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+    pa_types = {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_(), datetime: pa.timestamp("ms")}
+    return pa.schema([(col, pa_types[COLUMN_TYPES[col]]) for col in EXPORT_COLUMNS])
+
+
+def rows_to_table(rows, schema):
+    import pyarrow as pa
+    return pa.Table.from_pydict({col: [r[col] for r in rows] for col in EXPORT_COLUMNS}, schema=schema)
+
+
+def iter_parquet(row_chunks, compression="zstd"):
+    """Encode row chunks as a Parquet file, one row group per chunk."""
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for chunk in row_chunks:
+            writer.write_table(rows_to_table(chunk, schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(coll, fmt="csv", query=None, chunk_size=EXPORT_CHUNK_SIZE, archive_root=None):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}. Allowed: {sorted(EXPORT_FORMATS)}")
+    chunks = iter_application_chunks(coll, query, chunk_size)
+    if archive_root:
+        from itertools import chain
+        from archive import iter_archived_chunks
+        chunks = chain(chunks, iter_archived_chunks(archive_root, query, chunk_size, hot_coll=coll))
+    return iter_csv(chunks) if fmt == "csv" else iter_parquet(chunks)
+
+
+def _split(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export applications and scores to CSV or Parquet")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), help="defaults to the file extension")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="created on or after (ISO date)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="created before (ISO date)")
+    parser.add_argument("--status", help="comma-separated statuses")
+    parser.add_argument("--tier", help="comma-separated risk tiers")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--no-archive", action="store_true", help="hot applications only")
+    args = parser.parse_args()
+
+    from archive import ARCHIVE_DIR
+    from db import users_coll
+
+    fmt = args.format or ("parquet" if args.path.lower().endswith(".parquet") else "csv")
+    query = build_export_query(args.start, args.end, _split(args.status), _split(args.tier))
+    written = 0
+    with open(args.path, "wb") as f:
+        for block in iter_export(users_coll, fmt, query, args.chunk_size, None if args.no_archive else ARCHIVE_DIR):
+            f.write(block)
+            written += len(block)
+    print(f"Exported to {args.path} ({written} bytes)")
+
+
+if __name__ == "__main__":
+    main()
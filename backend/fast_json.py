@@ -0,0 +1,34 @@
+"""
+orjson-backed response class for endpoints that return large lists of Mongo
+documents.
+
+Return FastJSONResponse(content) from the endpoint itself: FastAPI only runs
+jsonable_encoder over values that are not already a Response, so the documents
+go straight to orjson, which serializes datetimes, dicts and NumPy scalars and
+arrays natively. ObjectId and other leftovers go through `_default`.
+"""
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    # NumPy scalar types orjson does not handle natively (e.g. np.bool_ on older orjson)
+    if hasattr(obj, "item"):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content):
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
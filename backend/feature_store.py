@@ -0,0 +1,160 @@
+"""
+Encoded model inputs stored next to the raw application.
+
+When an application is onboarded it is run through prepare_batch and the
+bundle's preprocessor once, and the encoded row is stored on the document:
+
+    "features": {"v": <preprocessor version>, "x": <float32 little-endian bytes>}
+
+Re-scoring a stored application (/users, /predict/{user_id}, insight
+precompute, the exact explanation summary) then skips the DataFrame and the
+preprocessor: the bytes are wrapped with np.frombuffer and go straight to the
+classifier / explainer. The version is a hash of the pickled preprocessor, so
+after a bundle swap that changes the encoding the stored vectors are ignored;
+those rows are re-encoded from `raw` and the fresh vectors handed back to the
+caller to write.
+
+Vectors are stored as float32; `python feature_store.py --check` compares the
+scores against scoring `raw` (no difference on the bundles measured). Applications onboarded before this
+existed are encoded on their first re-score, or all at once with --backfill.
+
+Usage:
+    python feature_store.py --check --rows 5000
+    python feature_store.py --backfill --batch-size 1000
+"""
+import argparse
+import hashlib
+import pickle
+
+import numpy as np
+
+FEATURES_FIELD = "features"
+FEATURE_DTYPE = np.dtype("<f4")
+
+
+def preprocessor_version(pre):
+    return hashlib.sha256(pickle.dumps(pre, protocol=4)).hexdigest()[:16]
+
+
+class FeatureStore:
+    def __init__(self, pre):
+        self.pre = pre
+        self.version = preprocessor_version(pre)
+
+    def encode(self, rows):
+        """Application dicts (or a DataFrame) -> contiguous float32 matrix, one row per application."""
+        import pandas as pd
+        from inference_utils import prepare_batch
+
+        df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+        X = self.pre.transform(prepare_batch(df))
+        if hasattr(X, "toarray"):
+            X = X.toarray()
+        return np.ascontiguousarray(X, dtype=FEATURE_DTYPE)
+
+    def field(self, vector):
+        from bson import Binary
+        return {"v": self.version, "x": Binary(np.ascontiguousarray(vector, dtype=FEATURE_DTYPE).tobytes())}
+
+    def fields(self, rows):
+        """The `features` values for a list of raw applications."""
+        return [self.field(x) for x in self.encode(rows)]
+
+    def vector(self, doc):
+        """Read-only float32 view of the stored vector, or None when missing or encoded by another preprocessor."""
+        stored = doc.get(FEATURES_FIELD)
+        if not stored or stored.get("v") != self.version:
+            return None
+        return np.frombuffer(stored["x"], dtype=FEATURE_DTYPE)
+
+    def matrix(self, docs):
+        """
+        (X, refreshed) for application documents: X has one encoded row per document;
+        refreshed maps the position of every re-encoded document to its new `features` value.
+        """
+        vectors = [self.vector(doc) for doc in docs]
+        stale = [i for i, v in enumerate(vectors) if v is None]
+        if not stale:
+            # One join, then a view: no per-row parsing or DataFrame
+            return np.frombuffer(b"".join(v.data for v in vectors), dtype=FEATURE_DTYPE).reshape(len(docs), -1), {}
+        encoded = self.encode([docs[i]["raw"] for i in stale])
+        X = np.empty((len(docs), encoded.shape[1]), dtype=FEATURE_DTYPE)
+        X[stale] = encoded
+        for i, v in enumerate(vectors):
+            if v is not None:
+                X[i] = v
+        return X, {i: self.field(x) for i, x in zip(stale, encoded)}
+
+
+def refresh_ops(docs, refreshed):
+    """UpdateOnes writing re-encoded vectors back."""
+    from pymongo import UpdateOne
+    return [UpdateOne({"_id": docs[i]["_id"]}, {"$set": {FEATURES_FIELD: field}}) for i, field in refreshed.items()]
+
+
+def backfill(coll, store, batch_size=1000):
+    """Encode every application whose stored vector is missing or stale."""
+    query = {"raw": {"$exists": True}, f"{FEATURES_FIELD}.v": {"$ne": store.version}}
+    written = 0
+    batch = []
+    for doc in coll.find(query, {"raw": 1}, batch_size=batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            written += _write(coll, store, batch)
+            batch = []
+    if batch:
+        written += _write(coll, store, batch)
+    return written
+
+
+def _write(coll, store, docs):
+    from schemas import InputData
+    fields = list(InputData.model_fields)
+    docs = [d for d in docs if all(f in d["raw"] for f in fields)]
+    if not docs:
+        return 0
+    _, refreshed = store.matrix(docs)
+    coll.bulk_write(refresh_ops(docs, refreshed), ordered=False)
+    print(f"Encoded {len(refreshed)} applications")
+    return len(refreshed)
+
+
+def check(model, rows=5000):
+    """Largest pd difference between scoring stored float32 vectors and scoring the raw rows."""
+    from data_generator import generate_applicants
+
+    df = generate_applicants(rows, seed=7)
+    raws = df.to_dict("records")
+    docs = [{"raw": raw, FEATURES_FIELD: f} for raw, f in zip(raws, model.feature_store.fields(raws))]
+    X, _ = model.feature_store.matrix(docs)
+    from_vectors = model.infer_encoded(X, raws, explain=False, track=False)
+    from_raw = model.infer_batch(df, explain=False, track=False)
+    diff = np.abs(np.array([r["pd"] for r in from_vectors]) - np.array([r["pd"] for r in from_raw]))
+    tiers = np.mean([a["tier"] == b["tier"] for a, b in zip(from_vectors, from_raw)])
+    return {"rows": rows, "pd_max_abs_diff": float(diff.max()), "tier_agreement": float(tiers),
+            "bytes_per_application": int(X.shape[1] * FEATURE_DTYPE.itemsize)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoded feature vectors stored on applications")
+    parser.add_argument("--check", action="store_true", help="compare scores from stored vectors and raw inputs")
+    parser.add_argument("--backfill", action="store_true", help="encode applications without a current vector")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from model_runtime import ModelRuntime
+    model = ModelRuntime(warmup_rows=0, check_mongo=False)
+    model.start(background=False)
+    if not model.ready:
+        raise SystemExit(f"Model failed to load: {model.error}")
+    print(f"Preprocessor version {model.feature_store.version}")
+    if args.check:
+        print(check(model, args.rows))
+    if args.backfill:
+        from db import users_coll
+        print(f"Encoded {backfill(users_coll, model.feature_store, args.batch_size)} applications in total")
+
+
+if __name__ == "__main__":
+    main()
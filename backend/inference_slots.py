@@ -0,0 +1,179 @@
+"""
+Native-thread governance for model calls.
+
+FastAPI runs sync endpoints on a thread pool, and LightGBM (OpenMP), NumPy /
+SciPy (BLAS) and SHAP may each start their own threads inside a call. With
+several requests in flight that multiplies into far more runnable threads than
+cores and throughput collapses. Instead:
+
+  - at most INFERENCE_SLOTS predict_proba / shap_values calls run at once
+    (the rest wait for a slot), and
+  - each slot runs with INFERENCE_THREADS_PER_SLOT native threads: the BLAS
+    limit is process-wide and set once when the model loads; the OpenMP limit
+    is per thread, so it is applied on each calling thread the first time it
+    takes a slot.
+
+Defaults (one thread per slot, one slot per core) come from bench_threads.py;
+INFERENCE_SLOTS=0 turns governance off.
+
+A freed slot goes to the waiting call with the most urgent scheduler priority
+(interactive, then admin, then background workers; see scheduler.py), so admin re-scoring cannot queue
+ahead of /predict. A call that has waited SLOT_PRIORITY_MAX_WAIT seconds takes
+the next free slot regardless, so admin work is slowed, never starved.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from metrics import metrics
+from scheduler import current_priority
+
+THREADS_PER_SLOT = int(os.getenv("INFERENCE_THREADS_PER_SLOT", "1"))
+SLOTS = int(os.getenv("INFERENCE_SLOTS", str(max(1, (os.cpu_count() or 1) // max(THREADS_PER_SLOT, 1)))))
+PRIORITY_MAX_WAIT_S = float(os.getenv("SLOT_PRIORITY_MAX_WAIT", "0.5"))
+
+
+class PriorityGate:
+    """Counting semaphore that hands free slots to the lowest priority number waiting."""
+
+    def __init__(self, size, max_wait=PRIORITY_MAX_WAIT_S):
+        self.size = size
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiting = Counter()   # priority -> callers waiting
+        self._cond = threading.Condition()
+
+    def _outranked(self, priority):
+        return any(n for p, n in self._waiting.items() if p < priority)
+
+    def acquire(self, priority):
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    if self.active < self.size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._outranked(priority):
+                            break
+                        # Re-check once the wait is over, even if nothing is released
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                self.active += 1
+            finally:
+                self._waiting[priority] -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def waiting(self):
+        with self._cond:
+            return {p: n for p, n in sorted(self._waiting.items()) if n}
+
+
+class InferenceSlots:
+    def __init__(self, slots=SLOTS, threads_per_slot=THREADS_PER_SLOT):
+        self._local = threading.local()
+        self._controller = None
+        self._blas_limit = None
+        self.configure(slots, threads_per_slot)
+
+    def configure(self, slots, threads_per_slot):
+        """Change the limits (startup, benchmarks). Calls already holding a slot finish unaffected."""
+        self.slots = slots
+        self.threads_per_slot = threads_per_slot
+        self._gate = PriorityGate(slots) if slots > 0 else None
+        # Bumping the generation makes every thread re-apply its OpenMP limit
+        self._generation = getattr(self, "_generation", 0) + 1
+        if self._controller is not None:
+            self._apply_blas()
+
+    @property
+    def enabled(self):
+        return self._gate is not None
+
+    def install(self):
+        """Discover the native thread pools; call once the model libraries are imported."""
+        from threadpoolctl import ThreadpoolController
+        self._controller = ThreadpoolController()
+        self._apply_blas()
+
+    def _apply_blas(self):
+        if self._blas_limit is not None:
+            self._blas_limit.restore_original_limits()
+            self._blas_limit = None
+        if self.enabled:
+            self._blas_limit = self._controller.limit(limits=self.threads_per_slot, user_api="blas")
+
+    def _apply_openmp(self):
+        if self._controller is None or getattr(self._local, "generation", None) == self._generation:
+            return
+        # omp_set_num_threads only affects the calling thread
+        self._controller.limit(limits=self.threads_per_slot, user_api="openmp")
+        self._local.generation = self._generation
+
+    @contextmanager
+    def slot(self):
+        gate = self._gate
+        if gate is None:
+            yield
+            return
+        t0 = time.perf_counter()
+        gate.acquire(current_priority())
+        metrics.observe("inference_slot_wait", time.perf_counter() - t0)
+        try:
+            self._apply_openmp()
+            yield
+        finally:
+            gate.release()
+
+    def status(self):
+        gate = self._gate
+        return {
+            "slots": self.slots,
+            "threads_per_slot": self.threads_per_slot,
+            "active": gate.active if gate else 0,
+            "waiting_by_priority": gate.waiting() if gate else {},
+        }
+
+
+class SlottedModel:
+    """InferenceModel whose predict_proba / predict_proba_encoded run inside a slot."""
+
+    def __init__(self, model, slots):
+        self.model = model
+        self.slots = slots
+
+    def predict_proba(self, X):
+        with self.slots.slot():
+            return self.model.predict_proba(X)
+
+    def predict_proba_encoded(self, X_enc):
+        with self.slots.slot():
+            return self.model.predict_proba_encoded(X_enc)
+
+    def __getattr__(self, attr):
+        return getattr(self.model, attr)
+
+
+class SlottedExplainer:
+    """Explainer whose shap_values runs inside a slot."""
+
+    def __init__(self, explainer, slots):
+        self.explainer = explainer
+        self.slots = slots
+
+    def shap_values(self, X):
+        with self.slots.slot():
+            return self.explainer.shap_values(X)
+
+    def __getattr__(self, attr):
+        return getattr(self.explainer, attr)
+
+
+inference_slots = InferenceSlots()
@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 
 # Constants from your model
 TIER_BINS = [(0.00, 0.05, "A+"), (0.05, 0.10, "A"), (0.10, 0.20, "B"), (0.20, 0.35, "C"), (0.35, 1.00, "D")]
@@ -14,6 +13,14 @@ def pd_to_alt_cibil(pd_value, scale_min=300, scale_max=900):
     score = scale_min + (scale_max - scale_min) * xnorm
     return float(score)
 
+def pd_to_alt_cibil_array(pd_values, scale_min=300, scale_max=900):
+    """Vectorised pd_to_alt_cibil for a batch of PDs."""
+    p = np.clip(np.asarray(pd_values, dtype=float), 1e-6, 1-1e-6)
+    x = -np.log(p / (1 - p))
+    xmin, xmax = -6, 6
+    xnorm = np.clip((x - xmin) / (xmax - xmin), 0, 1)
+    return scale_min + (scale_max - scale_min) * xnorm
+
 def pd_to_tier(pd_value):
     for lo, hi, tier in TIER_BINS:
         if lo <= pd_value < hi:
@@ -82,6 +89,85 @@ def infer_user(df_row, model_inference, explainer=None, feature_names=None, top_
     
     return result
 
+def prepare_batch(df):
+    """
+    feature_engineer_df for a multi-row frame. feature_engineer_df normalises
+    sms_count by the frame max; this scores each row the way infer_user would
+    see it on its own.
+    """
+    df_fe = feature_engineer_df(df)
+    if "sms_count" in df_fe.columns:
+        df_fe["sms_norm"] = df_fe["sms_count"] / (df_fe["sms_count"] + 1)
+    return df_fe
+
+def infer_batch(df, model_inference, explainer=None, feature_names=None, top_k_shap=3):
+    """
+    Batched version of infer_user: one predict_proba call (and one SHAP call)
+    for the whole frame. Returns one result dict per row, in row order.
+    """
+    df_fe = prepare_batch(df)
+
+    pd_vals = model_inference.predict_proba(df_fe)[:, 1].astype(float)
+    if "loan_amount_requested" in df_fe.columns:
+        requested = df_fe["loan_amount_requested"].to_numpy().astype(int)
+    else:
+        requested = np.zeros(len(df_fe), dtype=int)
+    results = batch_results(pd_vals, requested)
+
+    if explainer is not None and feature_names is not None and len(results):
+        try:
+            attach_top_shap(results, model_inference.pre.transform(df_fe), explainer, feature_names, top_k_shap)
+        except Exception as e:
+            print(f"SHAP calculation failed: {e}")
+
+    return results
+
+def infer_encoded(X_enc, requested, model_inference, explainer=None, feature_names=None, top_k_shap=3):
+    """infer_batch for rows already run through the preprocessor (see feature_store.py)."""
+    pd_vals = model_inference.predict_proba_encoded(X_enc)[:, 1].astype(float)
+    results = batch_results(pd_vals, np.asarray(requested).astype(int))
+
+    if explainer is not None and feature_names is not None and len(results):
+        try:
+            attach_top_shap(results, X_enc, explainer, feature_names, top_k_shap)
+        except Exception as e:
+            print(f"SHAP calculation failed: {e}")
+
+    return results
+
+def batch_results(pd_vals, requested):
+    """Result dicts (pd, tier, score, eligible amount, decision) for arrays of pds and requested amounts."""
+    alt_scores = pd_to_alt_cibil_array(pd_vals).tolist()
+    edges = [hi for _, hi, _ in TIER_BINS[:-1]]
+    tier_labels = np.array([tier for _, _, tier in TIER_BINS])
+    tiers = tier_labels[np.searchsorted(edges, pd_vals, side="right")]
+
+    pct = np.array([SANCTION_PCT.get(t, 0.0) for t in tiers])
+    eligible = np.floor(requested * pct).astype(int)
+
+    results = []
+    for i in range(len(pd_vals)):
+        tier = str(tiers[i])
+        results.append({
+            "pd": float(pd_vals[i]),
+            "tier": tier,
+            "alt_cibil_score": alt_scores[i],
+            "eligible_amount": int(eligible[i]),
+            "decision": "Approved" if tier in ["A+", "A", "B", "C"] and eligible[i] > 0 else "Rejected",
+            "top_shap": [],
+        })
+    return results
+
+def attach_top_shap(results, X_enc, explainer, feature_names, top_k_shap):
+    shap_out = explainer.shap_values(X_enc)
+    shap_vals = shap_out[1] if isinstance(shap_out, list) else shap_out
+    top_idx = np.argsort(-np.abs(shap_vals), axis=1)[:, :top_k_shap]
+    for i, idx in enumerate(top_idx):
+        results[i]["top_shap"] = [
+            {"feature": feature_names[j], "shap": float(shap_vals[i, j]), "value_enc": float(X_enc[i, j])}
+            for j in idx
+        ]
+
 def aggregate_user_scores(loans):
     """
     Aggregate multiple loan results into a final alt_cibil score and tier.
@@ -0,0 +1,286 @@
+"""
+AI insights for the admin review queue.
+
+build_insight turns a model result into the natural-language assessment shown
+to admins. precompute_insights is the batch stage that keeps those insights
+current for every received/pending application: it scores them through the
+batched model path, builds the insights in bulk and writes them back with one
+unordered bulk_write per chunk, so opening an application only reads a stored
+result.
+
+With several API workers only the one holding the lease runs a pass, and each
+write is conditional on the stored insight still being stale, so an
+application scored by an overlapping run is neither written nor counted twice.
+
+Usage:
+    python insights.py --batch-size 200 --max-per-second 50
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from feature_store import FEATURES_FIELD
+from metrics import metrics
+from schemas import InputData
+
+# Bump when build_insight changes so stored insights are regenerated
+INSIGHT_VERSION = 1
+PENDING_STATUSES = ["received", "pending"]
+SCORING_FIELDS = list(InputData.model_fields)
+
+PRECOMPUTE_INTERVAL_S = float(os.getenv("INSIGHT_PRECOMPUTE_INTERVAL", "300"))
+PRECOMPUTE_BATCH_SIZE = int(os.getenv("INSIGHT_PRECOMPUTE_BATCH_SIZE", "200"))
+PRECOMPUTE_MAX_PER_SECOND = float(os.getenv("INSIGHT_PRECOMPUTE_MAX_PER_SECOND", "50"))
+LOCK_ID = "insight_precompute"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def build_insight(applicant_name, model_result):
+    """Natural-language assessment of one model result"""
+    insight = f"AI Assessment for {applicant_name}:\n\n"
+
+    if model_result.get("final_cibil_score"):
+        score = model_result["final_cibil_score"]
+        insight += f"• Bharat Credit Score: {score}/1000 "
+        if score >= 700:
+            insight += "(Excellent creditworthiness)\n"
+        elif score >= 600:
+            insight += "(Good creditworthiness)\n"
+        elif score >= 400:
+            insight += "(Fair creditworthiness - requires careful evaluation)\n"
+        else:
+            insight += "(Poor creditworthiness - high risk)\n"
+
+    if model_result.get("loan_approval_probability"):
+        prob = model_result["loan_approval_probability"] * 100
+        insight += f"• Approval Probability: {prob:.1f}%\n"
+
+    if model_result.get("final_tier"):
+        tier = model_result["final_tier"]
+        insight += f"• Risk Category: {tier}\n"
+
+    if model_result.get("recommended_interest_rate"):
+        rate = model_result["recommended_interest_rate"]
+        insight += f"• Recommended Interest Rate: {rate}% per annum\n"
+
+    # Add key factors analysis
+    if model_result.get("top_factors"):
+        insight += "\nKey Decision Factors:\n"
+        for factor, impact in model_result["top_factors"].items():
+            factor_name = factor.replace("_", " ").title()
+            impact_text = "positively influences" if impact > 0 else "negatively impacts"
+            insight += f"• {factor_name} {impact_text} the decision\n"
+
+    # Add recommendation based on approval probability
+    if model_result.get("loan_approval_probability"):
+        prob = model_result["loan_approval_probability"]
+        insight += "\nAI Recommendation: "
+        if prob >= 0.7:
+            insight += "APPROVE - Strong candidate with low risk profile"
+        elif prob >= 0.4:
+            insight += "REVIEW - Moderate risk, consider additional verification"
+        else:
+            insight += "HIGH RISK - Requires careful manual assessment"
+
+    return insight
+
+
+def insight_version(model_version):
+    """Tag stored with each insight; an insight is current only if this matches."""
+    return f"{INSIGHT_VERSION}:{model_version}"
+
+
+def stale_insight_query(current_version):
+    return {
+        "status": {"$in": PENDING_STATUSES},
+        "raw": {"$exists": True},
+        "ai_insight_version": {"$ne": current_version},
+    }
+
+
+def claim_precompute(coll, ttl_s):
+    """Lease so only one worker runs a precompute pass per interval."""
+    now = datetime.utcnow()
+    coll.update_one({"_id": LOCK_ID}, {"$setOnInsert": {"until": datetime(1970, 1, 1)}}, upsert=True)
+    claimed = coll.update_one(
+        {"_id": LOCK_ID, "until": {"$lt": now}},
+        {"$set": {"until": now + timedelta(seconds=ttl_s), "worker": WORKER_ID}},
+    )
+    return claimed.modified_count == 1
+
+
+def precompute_insights(coll, model, batch_size=PRECOMPUTE_BATCH_SIZE, max_per_second=PRECOMPUTE_MAX_PER_SECOND,
+                        limit=None, stop_event=None, on_update=None, overlay=None):
+    """
+    Score and store insights for pending applications without a current one.
+    `model` is a ModelRuntime; `on_update(old, new)` is called for every
+    application this run actually changed: an update only applies while the
+    stored insight is still stale, so one another run wrote meanwhile is
+    skipped and not counted again. `overlay(doc)` applies writes not yet in Mongo (the
+    write-behind buffer) to `old`, so a pending model_output is not counted
+    as unscored -> scored a second time. Returns a summary of the run.
+    """
+    version = insight_version(model.model_version)
+    query = stale_insight_query(version)
+    pending = coll.count_documents(query)
+    metrics.set("insight_precompute_pending", pending)
+    summary = {"pending": pending, "processed": 0, "skipped": 0, "failed": 0, "superseded": 0,
+               "batches": 0}
+    if not pending:
+        return summary
+
+    started = time.perf_counter()
+    cursor = coll.find(query, {"_id": 1, "raw": 1, "profile.name": 1, "created": 1, "status": 1, "model_output": 1,
+                               FEATURES_FIELD: 1}, batch_size=batch_size)
+    chunk = []
+
+    def flush(docs):
+        scorable = [d for d in docs if all(f in d["raw"] for f in SCORING_FIELDS)]
+        summary["skipped"] += len(docs) - len(scorable)
+        if not scorable:
+            return
+        t0 = time.perf_counter()
+        try:
+            # Re-scoring stored applications from their encoded vectors; keep them out of the drift sketches
+            X, refreshed = model.feature_store.matrix(scorable)
+            results = model.infer_encoded(X, [d["raw"] for d in scorable], track=False)
+        except Exception as e:
+            print(f"Insight precompute batch failed: {e}")
+            summary["failed"] += len(scorable)
+            metrics.inc("insight_precompute_failed", len(scorable))
+            return
+        now = datetime.utcnow()
+        # Tags this batch's writes so the documents it changed can be told apart afterwards
+        write_id = uuid.uuid4().hex
+        ops = []
+        for i, (doc, result) in enumerate(zip(scorable, results)):
+            name = (doc.get("profile") or {}).get("name", "Unknown User")
+            fields = {
+                "ai_insight": build_insight(name, result),
+                "ai_insight_generated_at": now,
+                "ai_insight_version": version,
+                "ai_insight_write": write_id,
+                "model_output": result,
+            }
+            if i in refreshed:
+                fields[FEATURES_FIELD] = refreshed[i]
+            ops.append(UpdateOne({"_id": doc["_id"], "ai_insight_version": {"$ne": version}}, {"$set": fields}))
+        written = coll.bulk_write(ops, ordered=False).modified_count
+        if written < len(ops):
+            # Another run got to some of them first
+            changed = {d["_id"] for d in coll.find({"_id": {"$in": [d["_id"] for d in scorable]},
+                                                    "ai_insight_write": write_id}, {"_id": 1})}
+            summary["superseded"] += len(ops) - written
+        else:
+            changed = None
+        if on_update is not None:
+            for doc, result in zip(scorable, results):
+                if changed is not None and doc["_id"] not in changed:
+                    continue
+                old = overlay(doc) if overlay is not None else doc
+                on_update(old, {**old, "model_output": result})
+        summary["processed"] += written
+        summary["batches"] += 1
+        metrics.inc("insight_precompute_processed", written)
+        metrics.observe("insight_precompute_batch", time.perf_counter() - t0)
+        metrics.set("insight_precompute_pending", max(pending - summary["processed"] - summary["skipped"], 0))
+
+        # Rate limit: never go faster than max_per_second applications on average
+        if max_per_second:
+            ahead = summary["processed"] / max_per_second - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    try:
+        for doc in cursor:
+            chunk.append(doc)
+            if len(chunk) >= batch_size:
+                flush(chunk)
+                chunk = []
+                print(f"Insight precompute: {summary['processed']}/{pending} applications")
+            if (limit and summary["processed"] >= limit) or (stop_event and stop_event.is_set()):
+                chunk = []
+                break
+        if chunk:
+            flush(chunk)
+    finally:
+        cursor.close()
+
+    summary["duration_s"] = round(time.perf_counter() - started, 3)
+    metrics.observe("insight_precompute_run", summary["duration_s"])
+    return summary
+
+
+class InsightPrecomputer:
+    """
+    Runs precompute_insights every `interval` seconds in a daemon thread, on the
+    worker holding the lease in `lease_coll` (every worker if it is None).
+    """
+
+    def __init__(self, coll, model, interval=PRECOMPUTE_INTERVAL_S, on_update=None, overlay=None, lease_coll=None):
+        self.coll = coll
+        self.lease_coll = lease_coll
+        self.model = model
+        self.interval = interval
+        self.on_update = on_update
+        self.overlay = overlay
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="insight-precompute", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.model.ready:
+                try:
+                    if self.lease_coll is None or claim_precompute(self.lease_coll, self.interval):
+                        self.run_once()
+                except Exception as e:
+                    metrics.inc("insight_precompute_errors")
+                    print(f"Insight precompute failed: {e}")
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        summary = precompute_insights(self.coll, self.model, stop_event=self._stop,
+                                      on_update=self.on_update, overlay=self.overlay)
+        if summary["processed"]:
+            print(f"Insight precompute finished: {summary}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute AI insights for pending applications")
+    parser.add_argument("--batch-size", type=int, default=PRECOMPUTE_BATCH_SIZE)
+    parser.add_argument("--max-per-second", type=float, default=PRECOMPUTE_MAX_PER_SECOND)
+    parser.add_argument("--limit", type=int, help="stop after this many applications")
+    args = parser.parse_args()
+
+    from db import rollups_coll, users_coll
+    from model_runtime import ModelRuntime
+    from rollups import RollupBuffer
+
+    model = ModelRuntime(warmup_rows=0)
+    model.start(background=False)
+    rollup = RollupBuffer(rollups_coll)
+    rollup.start()
+    try:
+        print(precompute_insights(users_coll, model, args.batch_size, args.max_per_second, args.limit,
+                                  on_update=rollup.record))
+    finally:
+        rollup.stop()
+
+
+if __name__ == "__main__":
+    main()
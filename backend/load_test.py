@@ -0,0 +1,300 @@
+"""
+Async load driver for the Bharat Score API.
+
+Replays synthetic applicants from data_generator against a running server
+(--base-url) or against the app in-process on top of mongomock (--in-process),
+with a weighted mix across /onboard, /predict, /users and the admin endpoints.
+Prints throughput and latency percentiles per endpoint.
+
+--isolation runs the user-facing part of the mix twice, alone and then while
+--admin-clients clients loop over the admin endpoints, and prints both sets of
+percentiles next to the per-class scheduler utilization (scheduler.py). Compare
+with the scheduler off (SCHED_ENABLED=0 on the server, or --no-scheduler
+in-process) to see what it protects.
+
+A run whose write-behind or rollup flushes failed exits with an error instead
+of printing numbers. --in-process needs the pins in requirements-dev.txt.
+
+Usage:
+    python load_test.py --base-url http://localhost:8000 --requests 5000 --concurrency 32
+    python load_test.py --in-process --mix onboard=4,predict=3,users=2,admin=1
+    python load_test.py --in-process --isolation --mix predict=3,users=2 --admin-clients 4 \
+        --warmup-onboards 500 [--no-scheduler]
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from data_generator import generate_applicants, to_onboard_records
+
+DEFAULT_MIX = "onboard=4,predict=3,users=2,admin=1"
+WRITE_ERROR_COUNTERS = ("write_behind_errors", "write_behind_failed", "rollup_flush_errors")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {sorted(unknown)}. Allowed: {sorted(OPERATIONS)}")
+    return mix
+
+
+class Workload:
+    """Synthetic applicants plus the pool of users already onboarded."""
+
+    def __init__(self, n_applicants, seed):
+        df = generate_applicants(n_applicants, seed=seed)
+        self.records = to_onboard_records(df, id_prefix=f"loadtest_{seed}_")
+        self.onboarded = []
+        self.rng = random.Random(seed)
+
+    def record(self):
+        return self.rng.choice(self.records)
+
+    def known_user(self):
+        return self.rng.choice(self.onboarded) if self.onboarded else self.record()["clerk_user_id"]
+
+
+async def op_onboard(client, work):
+    rec = work.record()
+    resp = await client.post("/onboard", json=rec)
+    if resp.status_code == 200:
+        work.onboarded.append(rec["clerk_user_id"])
+    return resp
+
+
+async def op_predict(client, work):
+    rec = {k: v for k, v in work.record().items() if k not in ("clerk_user_id", "consent")}
+    return await client.post("/predict", json=rec)
+
+
+async def op_users(client, work):
+    return await client.get("/users", params={"clerk_user_id": work.known_user()})
+
+
+async def op_admin(client, work):
+    if work.rng.random() < 0.5:
+        return await client.get("/admin/applications-summary")
+    return await client.get(f"/admin/applications/{work.known_user()}")
+
+
+OPERATIONS = {
+    "onboard": op_onboard,
+    "predict": op_predict,
+    "users": op_users,
+    "admin": op_admin,
+}
+
+
+async def wait_until_ready(client, timeout=300):
+    """Poll /health/ready so model warm-up is not counted as request latency."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get("/health/ready")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError("API did not become ready")
+
+
+async def run_load(client, work, mix, total_requests, concurrency, warmup_onboards=20):
+    await wait_until_ready(client)
+    for _ in range(warmup_onboards):
+        await op_onboard(client, work)
+
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    plan = work.rng.choices(names, weights=weights, k=total_requests)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    queue = asyncio.Queue()
+    for name in plan:
+        queue.put_nowait(name)
+
+    async def worker():
+        while True:
+            try:
+                name = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await timed_call(client, work, name, latencies, errors)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed)
+
+
+async def timed_call(client, work, name, latencies, errors):
+    start = time.perf_counter()
+    try:
+        resp = await OPERATIONS[name](client, work)
+        ok = resp.status_code < 500
+    except Exception:
+        ok = False
+    latencies[name].append(time.perf_counter() - start)
+    if not ok:
+        errors[name] += 1
+
+
+async def run_isolation(client, work, mix, total_requests, concurrency, admin_clients, warmup_onboards=20):
+    """User-facing mix alone, then the same mix while admin_clients loop over the admin endpoints."""
+    user_mix = {name: weight for name, weight in mix.items() if name != "admin"}
+    if not user_mix:
+        raise ValueError("--isolation needs at least one user-facing operation in the mix")
+    baseline = await run_load(client, work, user_mix, total_requests, concurrency, warmup_onboards)
+
+    stop = asyncio.Event()
+    admin_latencies = defaultdict(list)
+    admin_errors = defaultdict(int)
+
+    async def admin_client():
+        while not stop.is_set():
+            await timed_call(client, work, "admin", admin_latencies, admin_errors)
+
+    started = time.perf_counter()
+    background = [asyncio.create_task(admin_client()) for _ in range(admin_clients)]
+    contended = await run_load(client, work, user_mix, total_requests, concurrency, warmup_onboards=0)
+    # Utilization covers the last SCHED_UTILIZATION_WINDOW seconds, so read it before admin load stops
+    scheduler_status = (await client.get("/admin/metrics")).json().get("scheduler")
+    stop.set()
+    await asyncio.gather(*background)
+    admin = summarize(admin_latencies, admin_errors, time.perf_counter() - started)
+    return {"baseline": baseline, "contended": contended, "admin": admin, "scheduler": scheduler_status}
+
+
+def summarize(latencies, errors, elapsed):
+    def stats(values):
+        ms = np.asarray(values) * 1000
+        return {
+            "count": int(ms.size),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p90_ms": round(float(np.percentile(ms, 90)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2),
+            "max_ms": round(float(ms.max()), 2),
+        }
+
+    report = {"elapsed_s": round(elapsed, 3), "endpoints": {}}
+    all_values = []
+    for name, values in sorted(latencies.items()):
+        report["endpoints"][name] = {**stats(values), "errors": errors.get(name, 0)}
+        all_values.extend(values)
+    report["total"] = {**stats(all_values), "errors": sum(errors.values())} if all_values else {}
+    report["throughput_rps"] = round(len(all_values) / elapsed, 1) if elapsed else 0.0
+    return report
+
+
+def print_report(report):
+    print(f"\nCompleted in {report['elapsed_s']}s — {report['throughput_rps']} req/s")
+    print(f"{'endpoint':<10}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    for name, s in list(report["endpoints"].items()) + [("total", report["total"])]:
+        print(f"{name:<10}{s['count']:>8}{s['p50_ms']:>10}{s['p90_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}{s['errors']:>8}")
+
+
+def print_isolation(report):
+    print("\nUser-facing latency, alone vs. with admin load")
+    print(f"{'endpoint':<10}{'p50 alone':>11}{'p50 admin':>11}{'p99 alone':>11}{'p99 admin':>11}{'errors':>8}")
+    rows = lambda r: {**r["endpoints"], "total": r["total"]}
+    contended = rows(report["contended"])
+    for name, alone in rows(report["baseline"]).items():
+        busy = contended[name]
+        print(f"{name:<10}{alone['p50_ms']:>11}{busy['p50_ms']:>11}{alone['p99_ms']:>11}{busy['p99_ms']:>11}{busy['errors']:>8}")
+    admin = report["admin"]["total"]
+    if admin:
+        print(f"\nAdmin: {admin['count']} requests at {report['admin']['throughput_rps']} req/s, "
+              f"p50 {admin['p50_ms']} ms, p99 {admin['p99_ms']} ms, {admin['errors']} errors (503s included)")
+    scheduler_status = report["scheduler"] or {}
+    if not scheduler_status.get("enabled"):
+        print("Scheduler disabled: every route shares one thread pool")
+        return
+    for name, cls in scheduler_status.items():
+        if isinstance(cls, dict):
+            print(f"  {name:<12} utilization {cls['utilization']:.0%} of {cls['workers']} workers, "
+                  f"{cls['completed']} completed, {cls['rejected']} rejected")
+
+
+def check_writes(counters):
+    """Fail the run when buffered writes failed: the latencies were measured without them."""
+    failed = {name: counters[name] for name in WRITE_ERROR_COUNTERS if counters.get(name)}
+    if failed:
+        raise SystemExit(f"Buffered writes failed during the run: {failed}. For --in-process, install "
+                         f"requirements-dev.txt (mongomock's bulk_write needs the pymongo pinned in requirements.txt).")
+
+
+def in_process_app():
+    """The ASGI app with Mongo replaced by mongomock."""
+    import mongomock
+    import db
+
+    db.use_client(mongomock.MongoClient())
+    from app import app
+    return app
+
+
+async def main_async(args):
+    import httpx
+
+    work = Workload(args.applicants, args.seed)
+    mix = parse_mix(args.mix)
+    if args.in_process:
+        app = in_process_app()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver", timeout=120)
+        if args.no_scheduler:
+            from scheduler import scheduler
+            scheduler.enabled = False
+        async with app.router.lifespan_context(app), client:
+            report = await run(client, work, mix, args)
+        # Shutdown flushed the buffers, so every write is accounted for now
+        from metrics import metrics
+        check_writes(metrics.snapshot()["counters"])
+    else:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=120,
+                                   limits=httpx.Limits(max_connections=args.concurrency + args.admin_clients))
+        async with client:
+            report = await run(client, work, mix, args)
+            # Only the worker that answers is checked
+            check_writes((await client.get("/admin/metrics")).json().get("counters", {}))
+    if args.isolation:
+        print_isolation(report)
+    else:
+        print_report(report)
+    return report
+
+
+async def run(client, work, mix, args):
+    if args.isolation:
+        return await run_isolation(client, work, mix, args.requests, args.concurrency, args.admin_clients,
+                                   args.warmup_onboards)
+    return await run_load(client, work, mix, args.requests, args.concurrency, args.warmup_onboards)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Bharat Score API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--in-process", action="store_true", help="run the app in-process on mongomock")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted operation mix (default {DEFAULT_MIX})")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--applicants", type=int, default=10_000, help="size of the synthetic replay pool")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--warmup-onboards", type=int, default=20,
+                        help="applications onboarded before timing (sizes the admin views)")
+    parser.add_argument("--isolation", action="store_true",
+                        help="compare user-facing latency alone and under background admin load")
+    parser.add_argument("--admin-clients", type=int, default=4, help="concurrent admin clients for --isolation")
+    parser.add_argument("--no-scheduler", action="store_true",
+                        help="in-process: run every route on the shared thread pool (SCHED_ENABLED=0)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
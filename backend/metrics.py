@@ -0,0 +1,50 @@
+"""
+In-process counters, gauges and timers, exposed at /admin/metrics.
+
+Names take optional labels, e.g. metrics.inc("degraded_responses", reason="no_shap")
+is stored under 'degraded_responses{reason=no_shap}'.
+"""
+import threading
+from collections import defaultdict
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.timers = {}
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self.counters[_key(name, labels)] += value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration; keeps count, total and max."""
+        key = _key(name, labels)
+        with self._lock:
+            t = self.timers.setdefault(key, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            t["count"] += 1
+            t["total_s"] += seconds
+            t["max_s"] = max(t["max_s"], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            timers = {
+                k: {**v, "mean_s": v["total_s"] / v["count"] if v["count"] else 0.0}
+                for k, v in self.timers.items()
+            }
+            return {"counters": dict(self.counters), "gauges": dict(self.gauges), "timers": timers}
+
+
+metrics = Metrics()
@@ -0,0 +1,249 @@
+"""
+Model lifecycle for the API.
+
+Nothing heavy happens at import time: the joblib bundle (and with it
+sklearn/LightGBM/shap/numba) is loaded in a background thread at startup,
+then warmed up with inference and SHAP on synthetic rows so JIT and first-call
+costs are paid before real traffic. Readiness is only reported once warm-up
+has finished.
+"""
+import os
+import threading
+import time
+import traceback
+
+from models import BUNDLE_PATH
+
+PROCESS_START = time.perf_counter()
+WARMUP_ROWS = int(os.getenv("WARMUP_ROWS", "64"))
+# "exact" (TreeSHAP) or "path" (tree-path attribution, see path_explainer.py)
+EXPLAIN_MODE = os.getenv("EXPLAIN_MODE", "exact")
+
+
+class ModelRuntime:
+    def __init__(self, bundle_path=BUNDLE_PATH, warmup_rows=WARMUP_ROWS, explain_mode=EXPLAIN_MODE, check_mongo=True,
+                 slots=None):
+        self.bundle_path = bundle_path
+        self.slots = slots
+        self.check_mongo = check_mongo
+        self.warmup_rows = warmup_rows
+        self.explain_mode = explain_mode
+        self.inference = None
+        self.explainer = None
+        self.path_explainer = None
+        self.feature_names = None
+        self.feature_store = None
+        self.model_version = None
+        self.state = "starting"  # starting -> loading -> warming_up -> ready | failed
+        self.error = None
+        self.mongo_connected = None
+        self.timings = {}
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self.inference is not None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self, background=True):
+        """Kick off loading and warm-up; returns immediately unless background=False."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._boot, name="model-warmup", daemon=True)
+        self._thread.start()
+        if not background:
+            self._thread.join()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def _boot(self):
+        boot_start = time.perf_counter()
+        try:
+            self.state = "loading"
+            t0 = time.perf_counter()
+            from models import load_model_bundle
+            inference, explainer, self.feature_names = load_model_bundle(self.bundle_path)
+            # Bundle mtime identifies the model; stored results from another version are stale
+            self.model_version = time.strftime("%Y%m%d%H%M%S", time.gmtime(os.path.getmtime(self.bundle_path)))
+            from feature_store import FeatureStore
+            self.feature_store = FeatureStore(inference.pre)
+            self._install(inference, explainer)
+            self.timings["load_s"] = round(time.perf_counter() - t0, 3)
+            print(f"Models loaded in {self.timings['load_s']}s")
+
+            self.state = "warming_up"
+            t0 = time.perf_counter()
+            self.warm_up()
+            self.timings["warmup_s"] = round(time.perf_counter() - t0, 3)
+
+            if self.check_mongo:
+                t0 = time.perf_counter()
+                self.mongo_connected = self._connect_mongo()
+                self.timings["mongo_connect_s"] = round(time.perf_counter() - t0, 3)
+
+            self.timings["boot_s"] = round(time.perf_counter() - boot_start, 3)
+            self.timings["cold_start_s"] = round(time.perf_counter() - PROCESS_START, 3)
+            self.state = "ready"
+            self._ready.set()
+            print(
+                f"Model runtime ready: load {self.timings['load_s']}s, warm-up {self.timings['warmup_s']}s, "
+                f"cold start {self.timings['cold_start_s']}s"
+            )
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"Error loading models: {e}")
+            traceback.print_exc()
+
+    def warm_up(self):
+        """Run the batched and single-row paths (with SHAP) on synthetic applicants."""
+        if self.warmup_rows <= 0:
+            return
+        from data_generator import generate_applicants
+
+        df = generate_applicants(self.warmup_rows, seed=0)
+        modes = ["exact", "path"] if self.path_explainer is not None else ["exact"]
+        for mode in modes:
+            self.infer_batch(df, track=False, explain_mode=mode)
+            for i in range(min(3, len(df))):
+                self.infer(df.iloc[i].to_dict(), track=False, explain_mode=mode)
+
+    def _install(self, inference, explainer):
+        """Route predict_proba / shap_values through the inference slots (see inference_slots.py)."""
+        from inference_slots import SlottedExplainer, SlottedModel, inference_slots
+        if self.slots is None:
+            self.slots = inference_slots
+        # Now that LightGBM/NumPy are imported, their thread pools can be found and limited
+        self.slots.install()
+        path_explainer = self._build_path_explainer(explainer)
+        self.inference = SlottedModel(inference, self.slots)
+        self.explainer = SlottedExplainer(explainer, self.slots) if explainer is not None else None
+        self.path_explainer = SlottedExplainer(path_explainer, self.slots) if path_explainer is not None else None
+
+    @staticmethod
+    def _build_path_explainer(explainer):
+        if explainer is None:
+            return None
+        try:
+            from path_explainer import PathExplainer
+            return PathExplainer.from_explainer(explainer)
+        except Exception as e:
+            print(f"Path explanations unavailable, using exact SHAP only: {e}")
+            return None
+
+    def _connect_mongo(self):
+        try:
+            from db import ping
+            ping()
+            return True
+        except Exception as e:
+            print(f"MongoDB not reachable during startup: {e}")
+            return False
+
+    # -------------------- INFERENCE --------------------
+    def _require_loaded(self):
+        if not self.loaded:
+            raise RuntimeError("Model not loaded")
+
+    def _explainer(self, explain, explain_mode):
+        """(explainer, mode) for a call; path mode falls back to exact when unavailable."""
+        if not explain:
+            return None, None
+        if (explain_mode or self.explain_mode) == "path" and self.path_explainer is not None:
+            return self.path_explainer, "path"
+        return self.explainer, "exact"
+
+    def infer(self, raw, top_k_shap=5, explain=True, track=True, explain_mode=None, summarize=False):
+        """
+        Score one application dict (an OnboardRequest/InputData payload or stored `raw`).
+        explain=False skips SHAP and returns an empty top_shap; explain_mode picks
+        "exact" or "path" attributions (default: EXPLAIN_MODE); track=False keeps the
+        call out of the drift sketches (warm-up, re-scoring). summarize=True also adds a
+        tracked call's attributions to the explanation summary: only for stored applications,
+        counted once (see onboard_tracking.py and shap_summary.py).
+        """
+        self._require_loaded()
+        import pandas as pd
+        from inference_utils import infer_user
+        explainer, mode = self._explainer(explain, explain_mode)
+        explainer = self._recording(explainer, track and summarize)
+        result = infer_user(pd.DataFrame([raw]), self.inference, explainer, self.feature_names, top_k_shap=top_k_shap)
+        if mode:
+            result["explain_mode"] = mode
+        if track:
+            self._observe([raw], [result], explainer)
+        return result
+
+    def infer_batch(self, rows, top_k_shap=5, explain=True, track=True, explain_mode=None, summarize=False):
+        """Score a DataFrame or a list of application dicts in one pass."""
+        self._require_loaded()
+        import pandas as pd
+        from inference_utils import infer_batch
+        df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+        explainer, mode = self._explainer(explain, explain_mode)
+        explainer = self._recording(explainer, track and summarize)
+        results = infer_batch(df, self.inference, explainer, self.feature_names, top_k_shap=top_k_shap)
+        if mode:
+            for result in results:
+                result["explain_mode"] = mode
+        if track:
+            self._observe(df, results, explainer)
+        return results
+
+    def infer_encoded(self, X, raws, top_k_shap=5, explain=True, track=True, explain_mode=None, summarize=False):
+        """
+        Score rows already encoded by the preprocessor (float32 vectors from feature_store.py).
+        `raws` are the matching application dicts: loan amounts and drift tracking come from them.
+        """
+        self._require_loaded()
+        from inference_utils import infer_encoded
+        explainer, mode = self._explainer(explain, explain_mode)
+        explainer = self._recording(explainer, track and summarize)
+        requested = [raw.get("loan_amount_requested") or 0 for raw in raws]
+        results = infer_encoded(X, requested, self.inference, explainer, self.feature_names, top_k_shap=top_k_shap)
+        if mode:
+            for result in results:
+                result["explain_mode"] = mode
+        if track:
+            self._observe(list(raws), results, explainer)
+        return results
+
+    @staticmethod
+    def _recording(explainer, summarize):
+        """Keep the full attribution matrix of summarized calls for the population summary."""
+        if explainer is None or not summarize:
+            return explainer
+        from shap_summary import RecordingExplainer
+        return RecordingExplainer(explainer)
+
+    def _observe(self, rows, results, explainer):
+        """Feed a tracked call into the drift sketches, and a summarized one into the explanation summary."""
+        from sketches import monitor
+        monitor.observe(rows, results)
+        from shap_summary import RecordingExplainer, accumulator
+        if isinstance(explainer, RecordingExplainer) and explainer.values is not None:
+            accumulator.observe(rows, explainer.values, self.feature_names)
+
+    def status(self):
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "models_loaded": self.loaded,
+            "explainer_loaded": self.explainer is not None,
+            "path_explainer_loaded": self.path_explainer is not None,
+            "explain_mode": self.explain_mode,
+            "model_version": self.model_version,
+            "preprocessor_version": self.feature_store.version if self.feature_store is not None else None,
+            "inference_slots": self.slots.status() if self.slots is not None else None,
+            "mongo_connected": self.mongo_connected,
+            "timings": self.timings,
+            "error": self.error,
+        }
+
+
+runtime = ModelRuntime()
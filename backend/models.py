@@ -1,5 +1,7 @@
 import numpy as np
 
+BUNDLE_PATH = "artifacts/bharatscore_pipeline_bundle.pkl"
+
 class InferenceModel:
     def __init__(self, preprocessor, calibrated_clf):
         self.pre = preprocessor
@@ -9,5 +11,16 @@ class InferenceModel:
         X_enc = self.pre.transform(X)
         return self.clf.predict_proba(X_enc)
 
+    def predict_proba_encoded(self, X_enc):
+        """predict_proba for rows already run through the preprocessor."""
+        return self.clf.predict_proba(X_enc)
+
     def predict(self, X, thr=0.5):
-        return (self.predict_proba(X)[:,1] >= thr).astype(int)
\ No newline at end of file
+        return (self.predict_proba(X)[:,1] >= thr).astype(int)
+
+def load_model_bundle(path=BUNDLE_PATH):
+    """Load the joblib bundle and return (inference, explainer, feature_names)."""
+    import joblib  # pulls in sklearn/lightgbm/shap while unpickling
+    bundle = joblib.load(path)
+    inference = InferenceModel(bundle["preprocessor"], bundle["calibrated_clf"])
+    return inference, bundle["explainer"], bundle["feature_names"]
@@ -0,0 +1,193 @@
+"""
+User notification inbox.
+
+Each status change appends one small document to the `notifications`
+collection instead of overwriting a `user_notification` subdocument on the
+application. Documents carry just what the notification views show (message,
+status, a few application fields), are indexed on
+(clerk_user_id, read, timestamp) and expire after NOTIFICATION_TTL_DAYS via a
+TTL index on `expires_at`.
+
+Lists are paginated newest first with a `before` cursor (the last timestamp
+and id of the previous page).
+
+Usage (copy the notifications still stored on applications into the inbox):
+    python notifications.py --backfill
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+
+NOTIFICATION_TTL_DAYS = int(os.getenv("NOTIFICATION_TTL_DAYS", "90"))
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+STATUS_MESSAGES = {
+    "approved": "Congratulations! Your loan application has been approved. Please visit the nearest branch for document verification and loan disbursement.",
+    "rejected": "Your loan application has been declined. Please contact our support team for more information.",
+    "issue": "Your application requires additional review. Our team will contact you shortly with next steps.",
+    "pending": "Your application is under review. We will update you on the progress soon."
+}
+
+
+def ensure_indexes(coll):
+    coll.create_index(
+        [("clerk_user_id", ASCENDING), ("read", ASCENDING), ("timestamp", DESCENDING)],
+        name="user_read_timestamp",
+    )
+    coll.create_index([("clerk_user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                      name="user_timestamp")
+    coll.create_index("expires_at", expireAfterSeconds=0, name="ttl")
+
+
+def status_notification(application, status, admin_remarks="", now=None):
+    """Notification document for a status change on `application`."""
+    now = now or datetime.utcnow()
+    raw = application.get("raw") or {}
+    model_output = application.get("model_output") or {}
+    return {
+        "clerk_user_id": application["clerk_user_id"],
+        "application_created": application.get("created"),
+        "message": STATUS_MESSAGES.get(status, "Your application status has been updated."),
+        "status": status,
+        "admin_remarks": admin_remarks or "",
+        "loan_amount": raw.get("loan_amount_requested", 0),
+        "loan_category": raw.get("loan_category", ""),
+        "cibil_score": model_output.get("final_cibil_score") or model_output.get("alt_cibil_score"),
+        "risk_tier": model_output.get("final_tier") or model_output.get("tier"),
+        "applicant_name": (application.get("profile") or {}).get("name", ""),
+        "timestamp": now,
+        "read": False,
+        "expires_at": now + timedelta(days=NOTIFICATION_TTL_DAYS),
+    }
+
+
+def publish(coll, notification):
+    notification["_id"] = coll.insert_one(notification).inserted_id
+    return notification
+
+
+def to_api(doc):
+    """Inbox document -> API shape (same keys the application-based notifications had)."""
+    return {
+        "id": str(doc["_id"]),
+        "message": doc["message"],
+        "timestamp": doc["timestamp"],
+        "read": doc.get("read", False),
+        "status": doc.get("status"),
+        "application_date": doc.get("application_created"),
+        "admin_remarks": doc.get("admin_remarks", ""),
+        "loan_amount": doc.get("loan_amount", 0),
+        "loan_category": doc.get("loan_category", ""),
+        "cibil_score": doc.get("cibil_score"),
+        "risk_tier": doc.get("risk_tier"),
+        "applicant_name": doc.get("applicant_name", ""),
+    }
+
+
+def encode_cursor(doc):
+    return f"{doc['timestamp'].isoformat()}_{doc['_id']}"
+
+
+def decode_cursor(cursor):
+    """(timestamp, ObjectId) from a cursor; ValueError if it is malformed."""
+    timestamp, _, oid = cursor.rpartition("_")
+    try:
+        return datetime.fromisoformat(timestamp), ObjectId(oid)
+    except InvalidId as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def list_notifications(coll, clerk_user_id, unread_only=False, limit=DEFAULT_PAGE_SIZE, before=None):
+    """One page, newest first. Returns (notifications, next cursor or None)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = {"clerk_user_id": clerk_user_id}
+    if unread_only:
+        query["read"] = False
+    if before:
+        ts, oid = decode_cursor(before)
+        query["$or"] = [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "_id": {"$lt": oid}}]
+    docs = list(coll.find(query, {"expires_at": 0}).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return [to_api(d) for d in docs[:limit]], next_cursor
+
+
+def unread_count(coll, clerk_user_id):
+    return coll.count_documents({"clerk_user_id": clerk_user_id, "read": False})
+
+
+def mark_read(coll, clerk_user_id, ids=None):
+    """Mark the given notification ids (or all unread) as read in one update_many."""
+    query = {"clerk_user_id": clerk_user_id, "read": False}
+    if ids is not None:
+        object_ids = []
+        for i in ids:
+            try:
+                object_ids.append(ObjectId(i))
+            except (InvalidId, TypeError):
+                continue
+        if not object_ids:
+            return 0
+        query["_id"] = {"$in": object_ids}
+    return coll.update_many(query, {"$set": {"read": True}}).modified_count
+
+
+def latest_by_application(coll, clerk_user_id):
+    """Most recent notification per application (keyed by application `created`)."""
+    latest = {}
+    for doc in coll.find({"clerk_user_id": clerk_user_id}, {"expires_at": 0}).sort("timestamp", -1):
+        latest.setdefault(str(doc.get("application_created")), doc)
+    return {created: {"message": d["message"], "timestamp": d["timestamp"], "read": d.get("read", False)}
+            for created, d in latest.items()}
+
+
+def backfill(apps_coll, coll, batch_size=1000):
+    """Copy `user_notification` subdocuments from applications into the inbox (idempotent)."""
+    copied = 0
+    batch = []
+    cursor = apps_coll.find(
+        {"user_notification": {"$exists": True}},
+        {"clerk_user_id": 1, "created": 1, "status": 1, "admin_remarks": 1, "user_notification": 1, "profile.name": 1,
+         "raw.loan_amount_requested": 1, "raw.loan_category": 1, "model_output": 1},
+    )
+    for app in cursor:
+        legacy = app["user_notification"]
+        doc = status_notification(app, app.get("status"), app.get("admin_remarks", ""), now=legacy["timestamp"])
+        doc["message"] = legacy["message"]
+        doc["read"] = legacy.get("read", False)
+        key = {"clerk_user_id": doc["clerk_user_id"], "application_created": doc["application_created"],
+               "timestamp": doc["timestamp"]}
+        batch.append((key, doc))
+        if len(batch) >= batch_size:
+            copied += _upsert(coll, batch)
+            batch = []
+    if batch:
+        copied += _upsert(coll, batch)
+    return copied
+
+
+def _upsert(coll, batch):
+    from pymongo import UpdateOne
+    result = coll.bulk_write([UpdateOne(key, {"$setOnInsert": doc}, upsert=True) for key, doc in batch],
+                             ordered=False)
+    return result.upserted_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification inbox maintenance")
+    parser.add_argument("--backfill", action="store_true", help="copy user_notification subdocuments into the inbox")
+    args = parser.parse_args()
+
+    from db import notifications_coll, users_coll
+    ensure_indexes(notifications_coll)
+    print("Indexes ensured")
+    if args.backfill:
+        print(f"Copied {backfill(users_coll, notifications_coll)} notifications")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Drift and explanation tracking for newly stored applications.
+
+Each application is counted once, after it is inserted: /onboard and
+/onboard/bulk hand the stored documents (raw plus encoded vector) to this
+queue, and a background thread scores them in batches of
+ONBOARD_TRACKING_BATCH_SIZE with exact attributions. The results feed the drift
+sketches (sketches.py) and the live explanation summary (shap_summary.py), so
+the live summary covers the same population, with the same attribution mode,
+as the exact recompute it is merged with. Onboarding itself runs no inference.
+
+At most ONBOARD_TRACKING_MAX_PENDING applications wait; past that new ones are
+not tracked (counted as onboard_tracking_dropped) and only reach the summary
+with the next exact pass. Monitoring never slows onboarding down.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+TRACKING_BATCH_SIZE = int(os.getenv("ONBOARD_TRACKING_BATCH_SIZE", "256"))
+TRACKING_MAX_PENDING = int(os.getenv("ONBOARD_TRACKING_MAX_PENDING", "10000"))
+TRACKING_INTERVAL_S = float(os.getenv("ONBOARD_TRACKING_INTERVAL", "1.0"))
+
+
+class OnboardingTracker:
+    def __init__(self, model, batch_size=TRACKING_BATCH_SIZE, max_pending=TRACKING_MAX_PENDING,
+                 interval=TRACKING_INTERVAL_S):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.interval = interval
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, docs):
+        """Queue stored application documents (with `raw`, ideally the encoded vector) for tracking."""
+        docs = [doc for doc in docs if doc.get("raw")]
+        with self._lock:
+            accepted = docs[:max(self.max_pending - len(self._pending), 0)]
+            self._pending.extend(accepted)
+            depth = len(self._pending)
+        if len(accepted) < len(docs):
+            metrics.inc("onboard_tracking_dropped", len(docs) - len(accepted))
+        metrics.set("onboard_tracking_depth", depth)
+        if self._thread is None:
+            # Not running in the background (CLI, scripts): track inline
+            self.flush()
+        elif depth >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Score and track everything queued, one batch at a time. Returns the number tracked."""
+        tracked = 0
+        while self.model.loaded and not self._stop.is_set():
+            with self._lock:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                depth = len(self._pending)
+            metrics.set("onboard_tracking_depth", depth)
+            if not batch:
+                break
+            t0 = time.perf_counter()
+            try:
+                X, _ = self.model.feature_store.matrix(batch)
+                self.model.infer_encoded(X, [doc["raw"] for doc in batch], explain_mode="exact", summarize=True)
+            except Exception as e:
+                metrics.inc("onboard_tracking_errors")
+                print(f"Onboarding tracking failed for {len(batch)} applications: {e}")
+                continue
+            tracked += len(batch)
+            metrics.inc("onboard_tracking_tracked", len(batch))
+            metrics.observe("onboard_tracking_batch", time.perf_counter() - t0)
+        return tracked
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="onboard-tracking", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread; applications still queued are left to the next exact summary pass."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            left, self._pending = len(self._pending), deque()
+        if left:
+            print(f"Onboarding tracking: {left} queued applications not tracked on shutdown")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self.model.ready:
+                self.flush()
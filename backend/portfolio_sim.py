@@ -0,0 +1,287 @@
+"""
+Monte Carlo credit loss simulation for the loan portfolio.
+
+Every scored, non-rejected application is a loan with exposure
+`eligible_amount`, default probability `pd` (from model_output) and a flat
+loss-given-default. Defaults are correlated with a one-factor Gaussian copula
+plus a region factor: loan i defaults in a scenario when
+
+    sqrt(rho) * Z + sqrt(rho_region) * F[region_i] + sqrt(1 - rho - rho_region) * eps_i < Phi^-1(pd_i)
+
+Scenarios are simulated in blocks of `block_scenarios`. Each block walks the
+loans in chunks of `chunk_loans` (one float32 matrix of that size at a time)
+and keeps only its per-(region, tier) losses, so memory is bounded by
+workers x block_scenarios x chunk_loans regardless of portfolio size. Blocks run
+on a process pool; each one draws from its own child of SeedSequence(seed),
+so results depend on (seed, block_scenarios, chunk_loans) but not on the
+number of workers.
+
+The report has expected loss, VaR / expected shortfall at a few levels,
+concentration by region and tier (share of expected loss and of the 99% tail),
+and convergence diagnostics: Monte Carlo standard errors (batch means for the
+quantiles), the running estimates and the simulated vs. analytic expected loss.
+
+Usage:
+    python portfolio_sim.py --scenarios 10000 --workers 4 --store
+    python portfolio_sim.py --synthetic 100000 --scenarios 10000
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+LGD = float(os.getenv("PORTFOLIO_LGD", "0.45"))
+RHO = float(os.getenv("PORTFOLIO_RHO", "0.15"))
+RHO_REGION = float(os.getenv("PORTFOLIO_RHO_REGION", "0.05"))
+DEFAULT_SCENARIOS = 10_000
+BLOCK_SCENARIOS = 250
+CHUNK_LOANS = 16_384
+QUANTILES = (0.95, 0.99, 0.999)
+TAIL_LEVEL = 0.99
+BATCHES = 10
+EXCLUDED_STATUSES = ["rejected"]
+
+# Loan arrays for the block workers (set once per process by _init_worker)
+_loans = None
+
+
+class Portfolio:
+    """Loan-level arrays: pd, exposure at default, region and tier codes."""
+
+    def __init__(self, pd, ead, regions, tiers):
+        self.pd = np.clip(np.asarray(pd, dtype=float), 1e-6, 1 - 1e-6)
+        self.ead = np.asarray(ead, dtype=float)
+        self.region_names, self.region = np.unique(np.asarray(regions, dtype=str), return_inverse=True)
+        self.tier_names, self.tier = np.unique(np.asarray(tiers, dtype=str), return_inverse=True)
+
+    def __len__(self):
+        return len(self.pd)
+
+    @property
+    def groups(self):
+        """Group index (region-major) and names."""
+        names = [f"{r}|{t}" for r in self.region_names for t in self.tier_names]
+        return self.region * len(self.tier_names) + self.tier, names
+
+
+def load_portfolio(coll, statuses=None):
+    """Scored applications with a positive sanction from the users collection."""
+    query = {"model_output.pd": {"$ne": None}, "model_output.eligible_amount": {"$gt": 0}}
+    query["status"] = {"$in": statuses} if statuses else {"$nin": EXCLUDED_STATUSES}
+    pd, ead, regions, tiers = [], [], [], []
+    fields = {"raw.region": 1, "model_output.pd": 1, "model_output.eligible_amount": 1, "model_output.tier": 1}
+    for doc in coll.find(query, fields, batch_size=10_000):
+        out = doc["model_output"]
+        pd.append(out["pd"])
+        ead.append(out["eligible_amount"])
+        regions.append((doc.get("raw") or {}).get("region") or "unknown")
+        tiers.append(out.get("tier") or "unknown")
+    return Portfolio(pd, ead, regions, tiers)
+
+
+def synthetic_portfolio(n, seed=42):
+    """n loans from the data generator's notebook pd, sanctioned by tier (benchmarks, no Mongo/model needed)."""
+    from data_generator import generate_applicants
+    from inference_utils import SANCTION_PCT, TIER_BINS
+
+    df = generate_applicants(n, seed=seed, with_labels=True)
+    pd = df["pd"].to_numpy()
+    edges = [hi for _, hi, _ in TIER_BINS[:-1]]
+    names = np.array([tier for _, _, tier in TIER_BINS])
+    tiers = names[np.searchsorted(edges, pd, side="right")]
+    pct = np.array([SANCTION_PCT.get(t, 0.0) for t in tiers])
+    ead = np.floor(df["loan_amount_requested"].to_numpy() * pct)
+    keep = ead > 0
+    return Portfolio(pd[keep], ead[keep], df["region"].to_numpy()[keep], tiers[keep])
+
+
+# -------------------- SIMULATION --------------------
+def _init_worker(loans):
+    global _loans
+    _loans = loans
+
+
+def _prepare(portfolio, lgd, rho, rho_region):
+    from scipy.stats import norm
+
+    if rho < 0 or rho_region < 0 or rho + rho_region >= 1:
+        raise ValueError("need rho >= 0, rho_region >= 0 and rho + rho_region < 1")
+    group, names = portfolio.groups
+    # Loss weights: one column per group, so defaults @ weights gives group losses
+    weights = np.zeros((len(portfolio), len(names)), dtype=np.float32)
+    weights[np.arange(len(portfolio)), group] = portfolio.ead * lgd
+    loans = {
+        "threshold": norm.ppf(portfolio.pd).astype(np.float32),
+        "region": portfolio.region,
+        "regions": len(portfolio.region_names),
+        "weights": weights,
+        "a": np.float32(np.sqrt(rho)),
+        "b": np.float32(np.sqrt(rho_region)),
+        "c": np.float32(np.sqrt(1 - rho - rho_region)),
+    }
+    return loans, names
+
+
+def simulate_block(task):
+    """(seed sequence, scenarios, chunk_loans) -> group losses, shape (scenarios, groups)."""
+    seed_seq, scenarios, chunk = task
+    loans = _loans
+    rng = np.random.default_rng(seed_seq)
+    z = rng.standard_normal(scenarios, dtype=np.float32)
+    f = rng.standard_normal((scenarios, loans["regions"]), dtype=np.float32)
+    losses = np.zeros((scenarios, loans["weights"].shape[1]), dtype=np.float64)
+    n = len(loans["threshold"])
+    for start in range(0, n, chunk):
+        sl = slice(start, min(start + chunk, n))
+        latent = rng.standard_normal((scenarios, sl.stop - start), dtype=np.float32)
+        latent *= loans["c"]
+        latent += loans["a"] * z[:, None]
+        latent += loans["b"] * f[:, loans["region"][sl]]
+        defaults = (latent < loans["threshold"][sl]).astype(np.float32)
+        losses += defaults @ loans["weights"][sl]
+    return losses
+
+
+def run_blocks(loans, scenarios, seed, block_scenarios, chunk_loans, workers):
+    sizes = [min(block_scenarios, scenarios - s) for s in range(0, scenarios, block_scenarios)]
+    tasks = [(child, size, chunk_loans) for child, size in zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes)]
+    if workers <= 1:
+        _init_worker(loans)
+        return np.vstack([simulate_block(t) for t in tasks])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(loans,)) as pool:
+        return np.vstack(list(pool.map(simulate_block, tasks)))
+
+
+# -------------------- REPORT --------------------
+def _label(level):
+    """0.999 -> 'p99_9' (Mongo-safe key)."""
+    return "p" + f"{level * 100:g}".replace(".", "_")
+
+
+def _tail(losses, level):
+    var = float(np.quantile(losses, level))
+    tail = losses[losses >= var]
+    return var, float(tail.mean()) if len(tail) else var
+
+
+def convergence(losses, analytic_el, batches=BATCHES):
+    """Standard errors (batch means for VaR/ES), running estimates and the analytic check."""
+    n = len(losses)
+    el = float(losses.mean())
+    el_se = float(losses.std(ddof=1) / np.sqrt(n)) if n > 1 else float("nan")
+    diagnostics = {
+        "scenarios": n,
+        "el_standard_error": el_se,
+        "el_relative_error": el_se / el if el else None,
+        "analytic_el": analytic_el,
+        "el_z_score": (el - analytic_el) / el_se if el_se else None,
+    }
+    if n >= batches * 100:
+        parts = np.array_split(losses, batches)
+        for level in QUANTILES:
+            stats = np.array([_tail(p, level) for p in parts])
+            se = stats.std(axis=0, ddof=1) / np.sqrt(batches)
+            diagnostics[f"var_{_label(level)}_standard_error"] = float(se[0])
+            diagnostics[f"es_{_label(level)}_standard_error"] = float(se[1])
+    checkpoints = sorted({int(n * f) for f in (0.125, 0.25, 0.5, 1.0) if int(n * f) >= 10})
+    diagnostics["running"] = [
+        {"scenarios": k, "el": float(losses[:k].mean()), "var_p99": float(np.quantile(losses[:k], TAIL_LEVEL))}
+        for k in checkpoints
+    ]
+    return diagnostics
+
+
+def concentration(group_losses, names, losses):
+    """Share of expected loss and of the tail (losses >= VaR 99%) per region and per tier."""
+    tail = losses >= np.quantile(losses, TAIL_LEVEL)
+    el = group_losses.mean(axis=0)
+    tail_el = group_losses[tail].mean(axis=0) if tail.any() else el
+    total, tail_total = el.sum() or 1.0, tail_el.sum() or 1.0
+
+    out = {}
+    for dim, pos in (("region", 0), ("tier", 1)):
+        acc = {}
+        for name, e, t in zip(names, el, tail_el):
+            key = name.split("|")[pos]
+            a = acc.setdefault(key, [0.0, 0.0])
+            a[0] += float(e)
+            a[1] += float(t)
+        out[dim] = {
+            key: {"expected_loss": e, "el_share": e / total, "tail_loss": t, "tail_share": t / tail_total}
+            for key, (e, t) in sorted(acc.items())
+        }
+    return out
+
+
+def simulate_portfolio(portfolio, scenarios=DEFAULT_SCENARIOS, seed=42, lgd=LGD, rho=RHO, rho_region=RHO_REGION,
+                       block_scenarios=BLOCK_SCENARIOS, chunk_loans=CHUNK_LOANS, workers=None):
+    """Run the simulation and return the report dict."""
+    workers = workers or os.cpu_count() or 1
+    if not len(portfolio):
+        return {"loans": 0, "scenarios": 0, "status": "empty_portfolio"}
+    t0 = time.perf_counter()
+    loans, names = _prepare(portfolio, lgd, rho, rho_region)
+    group_losses = run_blocks(loans, scenarios, seed, block_scenarios, chunk_loans, workers)
+    losses = group_losses.sum(axis=1)
+    elapsed = time.perf_counter() - t0
+
+    exposure = float(portfolio.ead.sum())
+    analytic_el = float((portfolio.pd * portfolio.ead).sum() * lgd)
+    report = {
+        "loans": len(portfolio),
+        "scenarios": scenarios,
+        "exposure": exposure,
+        "parameters": {"lgd": lgd, "rho": rho, "rho_region": rho_region, "seed": seed,
+                       "block_scenarios": block_scenarios, "chunk_loans": chunk_loans},
+        "expected_loss": float(losses.mean()),
+        "expected_loss_rate": float(losses.mean()) / exposure if exposure else None,
+        "loss_std": float(losses.std(ddof=1)) if scenarios > 1 else 0.0,
+        "quantiles": {},
+        "concentration": concentration(group_losses, names, losses),
+        "convergence": convergence(losses, analytic_el),
+        "duration_s": round(elapsed, 3),
+        "workers": workers,
+        "created": datetime.utcnow(),
+    }
+    for level in QUANTILES:
+        var, es = _tail(losses, level)
+        report["quantiles"][_label(level)] = {"var": var, "expected_shortfall": es,
+                                          "unexpected_loss": var - report["expected_loss"]}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo expected-loss simulation for the loan portfolio")
+    parser.add_argument("--scenarios", type=int, default=DEFAULT_SCENARIOS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, help="processes (default: CPU count)")
+    parser.add_argument("--lgd", type=float, default=LGD)
+    parser.add_argument("--rho", type=float, default=RHO, help="systematic factor loading (asset correlation)")
+    parser.add_argument("--rho-region", type=float, default=RHO_REGION, help="additional within-region correlation")
+    parser.add_argument("--block-scenarios", type=int, default=BLOCK_SCENARIOS)
+    parser.add_argument("--chunk-loans", type=int, default=CHUNK_LOANS)
+    parser.add_argument("--status", action="append", help="only these application statuses (repeatable)")
+    parser.add_argument("--synthetic", type=int, help="simulate this many generated loans instead of Mongo")
+    parser.add_argument("--store", action="store_true", help="save the report for /admin/portfolio/risk")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        portfolio = synthetic_portfolio(args.synthetic, args.seed)
+    else:
+        from db import users_coll
+        portfolio = load_portfolio(users_coll, args.status)
+    print(f"Simulating {len(portfolio)} loans x {args.scenarios} scenarios")
+    report = simulate_portfolio(portfolio, args.scenarios, args.seed, args.lgd, args.rho, args.rho_region,
+                                args.block_scenarios, args.chunk_loans, args.workers)
+    if args.store:
+        from db import portfolio_sims_coll
+        portfolio_sims_coll.insert_one(dict(report))
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
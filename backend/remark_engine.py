@@ -0,0 +1,98 @@
+"""
+Deterministic remark engine.
+
+Applies the rule set from the LLM prompt in generate_remark directly to
+`top_shap` and the feature_explanations.json knowledge base:
+  - sign of the SHAP value -> direction of the influence
+  - |SHAP| >= STRONG_SHAP  -> "strongly", otherwise "slightly"
+  - decision-specific phrasing for Approved / Rejected / Review
+  - the knowledge-base sentence only for drivers that help approval: every
+    entry is worded as a strength, so it would read as praise on a concern
+
+The explainer works on the probability of default, so a positive SHAP value
+raises risk (hurts approval) and a negative one lowers it (helps approval).
+"""
+STRONG_SHAP = 0.25
+MAX_DRIVERS = 2
+
+REMARK_MODES = {"template", "llm", "llm_fallback"}
+
+_label_cache = {}
+
+
+def feature_label(feature):
+    """'num__bill_on_time_ratio' -> 'bill on time ratio', 'cat__region_rural' -> 'region (rural)'."""
+    label = _label_cache.get(feature)
+    if label is None:
+        kind, _, name = feature.partition("__")
+        if not name:
+            name = kind
+        if kind == "cat":
+            for column in ("user_type", "region", "age_group", "recharge_pattern", "loan_category"):
+                if name.startswith(column + "_"):
+                    name = f"{column} ({name[len(column) + 1:]})"
+                    break
+        label = name.replace("_", " ")
+        _label_cache[feature] = label
+    return label
+
+
+def describe_driver(item, kb):
+    """One sentence for one SHAP driver: direction, magnitude and, when it helps, the KB explanation."""
+    shap_value = float(item.get("shap", 0.0))
+    strength = "strongly" if abs(shap_value) >= STRONG_SHAP else "slightly"
+    if shap_value < 0:
+        effect = f"{strength} improved approval chances"
+    else:
+        effect = f"{strength} raised concerns about repayment ability"
+    sentence = f"{feature_label(item['feature']).capitalize()} {effect} ({shap_value:+.2f})"
+    explanation = kb.get(item["feature"]) if shap_value < 0 else None
+    return f"{sentence}; {explanation[0].lower()}{explanation[1:]}" if explanation else sentence + "."
+
+
+def pick_drivers(top_shap, decision):
+    """The 1-2 drivers the remark should cite for this decision."""
+    helping = [f for f in top_shap if f.get("shap", 0) < 0]
+    hurting = [f for f in top_shap if f.get("shap", 0) > 0]
+    if decision == "Approved":
+        chosen = helping or top_shap
+    elif decision == "Rejected":
+        chosen = hurting or top_shap
+    else:
+        chosen = helping[:1] + hurting[:1] or top_shap
+    return sorted(chosen, key=lambda f: -abs(f.get("shap", 0)))[:MAX_DRIVERS]
+
+
+def template_remark(application_data, kb=None):
+    """Professional 2-3 sentence remark from the model output, without an LLM."""
+    kb = kb or {}
+    decision = application_data.get("decision") or "Review"
+    tier = application_data.get("tier") or application_data.get("final_tier") or "N/A"
+    score = application_data.get("alt_cibil_score") or application_data.get("final_cibil_score")
+    pd_value = application_data.get("pd")
+
+    facts = [f"risk tier {tier}"]
+    if isinstance(score, (int, float)):
+        facts.append(f"credit score {score:.0f}")
+    if isinstance(pd_value, (int, float)):
+        facts.append(f"{(1 - pd_value) * 100:.1f}% approval probability")
+    facts_text = ", ".join(facts)
+
+    drivers = [describe_driver(f, kb) for f in pick_drivers(application_data.get("top_shap") or [], decision)]
+    drivers_text = " ".join(drivers)
+
+    if decision == "Approved":
+        parts = [f"The application is approved ({facts_text})."]
+        if drivers_text:
+            parts.append(drivers_text)
+        parts.append("Approval is subject to document verification before disbursement.")
+    elif decision == "Rejected":
+        parts = [f"The application is rejected ({facts_text})."]
+        if drivers_text:
+            parts.append(f"Key concerns: {drivers_text}")
+    else:
+        parts = [f"The application needs further review ({facts_text})."]
+        if drivers_text:
+            parts.append(f"The assessment is mixed: {drivers_text}")
+        parts.append("Additional checks are recommended before a decision.")
+    return " ".join(parts)
@@ -0,0 +1,376 @@
+"""
+Out-of-core retraining: preprocessor, LightGBM, calibration and SHAP explainer.
+
+Training rows come from the synthetic generator (notebook pd -> sampled
+`default` label) and/or from applications in Mongo that carry an observed
+outcome at RETRAIN_LABEL_FIELD (default `outcome.defaulted`). Rows are only
+ever held one chunk at a time:
+
+  1. scan       one pass over the chunks: streaming quantile sketches for the
+                numeric medians and category counts; a clone of the notebook's
+                ColumnTransformer is then fitted on a tiny frame carrying
+                exactly those statistics (same steps, same feature names)
+  2. encode     second pass: each chunk goes through prepare_batch and the
+                preprocessor and is written as float32 into a memory-mapped
+                training matrix on disk; every row is routed at random to
+                train, calibration or holdout (the last two are capped)
+  3. train      LightGBM fitted directly on the memmap (LightGBM keeps its own
+                binned copy, about one byte per feature per row)
+  4. calibrate  calibration on the held-out calibration rows, with the
+                trained model frozen
+  5. explain    TreeExplainer over the trained model
+  6. evaluate   AUC, Brier score and log loss on the holdout rows
+  7. write      bundle + manifest under artifacts/bundles/<version>/, and
+                with --promote copied over BUNDLE_PATH for the next restart
+
+Each stage reports its wall time and the process's peak RSS so far.
+
+Usage:
+    python retrain.py --synthetic 2000000 --chunk-size 100000
+    python retrain.py --mongo --synthetic 500000 --promote
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_generator import ONBOARD_COLUMNS, iter_applicant_batches
+from inference_utils import prepare_batch
+from models import BUNDLE_PATH
+from sketches import QuantileSketch
+
+LABEL_FIELD = os.getenv("RETRAIN_LABEL_FIELD", "outcome.defaulted")
+TEMPLATE_PATH = "artifacts/preprocessor.pkl"
+BUNDLES_DIR = "artifacts/bundles"
+CHUNK_SIZE = 100_000
+CALIBRATION_FRACTION = 0.1
+HOLDOUT_FRACTION = 0.1
+MAX_CALIBRATION_ROWS = 200_000
+MAX_HOLDOUT_ROWS = 200_000
+LGBM_PARAMS = {
+    "n_estimators": 300,
+    "learning_rate": 0.05,
+    "num_leaves": 31,
+    "min_child_samples": 50,
+    "subsample": 0.8,
+    "subsample_freq": 1,
+    "colsample_bytree": 0.9,
+    "verbose": -1,
+}
+
+
+class StageTimer:
+    """Wall time and peak RSS per stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - t0
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stages[name] = {"seconds": round(elapsed, 3), "peak_rss_mb": round(peak_mb, 1)}
+        print(f"[{name}] {elapsed:.1f}s, peak RSS {peak_mb:.0f} MB")
+        return out
+
+
+# -------------------- SOURCES --------------------
+def _get(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def mongo_query(label_field=LABEL_FIELD):
+    query = {f"raw.{c}": {"$exists": True} for c in ONBOARD_COLUMNS}
+    query[label_field] = {"$in": [0, 1, True, False]}
+    return query
+
+
+def iter_mongo_chunks(coll, label_field=LABEL_FIELD, chunk_size=CHUNK_SIZE):
+    """Labelled applications as DataFrames of ONBOARD_COLUMNS + `default`, in _id order."""
+    fields = {f"raw.{c}": 1 for c in ONBOARD_COLUMNS}
+    fields[label_field] = 1
+    rows = []
+    for doc in coll.find(mongo_query(label_field), fields, batch_size=min(chunk_size, 10_000)).sort("_id", 1):
+        row = {c: doc["raw"][c] for c in ONBOARD_COLUMNS}
+        row["default"] = int(bool(_get(doc, label_field)))
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield pd.DataFrame(rows)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows)
+
+
+class TrainingSource:
+    """Re-iterable chunk stream over the configured sources (each pass yields the same rows)."""
+
+    def __init__(self, synthetic=0, seed=42, coll=None, label_field=LABEL_FIELD, chunk_size=CHUNK_SIZE):
+        self.synthetic = synthetic
+        self.seed = seed
+        self.coll = coll
+        self.label_field = label_field
+        self.chunk_size = chunk_size
+        self.mongo_rows = coll.count_documents(mongo_query(label_field)) if coll is not None else 0
+
+    @property
+    def max_rows(self):
+        return self.synthetic + self.mongo_rows
+
+    def __iter__(self):
+        if self.coll is not None and self.mongo_rows:
+            yield from iter_mongo_chunks(self.coll, self.label_field, self.chunk_size)
+        if self.synthetic:
+            for df in iter_applicant_batches(self.synthetic, self.chunk_size, self.seed, with_labels=True):
+                yield df[ONBOARD_COLUMNS + ["default"]]
+
+
+# -------------------- STAGES --------------------
+def load_template(path=TEMPLATE_PATH):
+    """Unfitted copy of the notebook preprocessor (or the same layout when the artifact is missing)."""
+    from sklearn.base import clone
+
+    if os.path.exists(path):
+        import joblib
+        return clone(joblib.load(path))
+    from sklearn.compose import ColumnTransformer
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    numeric = ["sms_count", "bill_on_time_ratio", "recharge_freq", "sim_tenure", "location_stability",
+               "income_signal", "coop_score", "land_verified", "psychometric_score", "loan_amount_requested",
+               "loan_amount_log", "sms_norm"]
+    categorical = ["user_type", "region", "age_group", "recharge_pattern", "loan_category"]
+    return ColumnTransformer([
+        ("num", Pipeline([("imputer", SimpleImputer(strategy="median"))]), numeric),
+        ("cat", Pipeline([("imputer", SimpleImputer(strategy="most_frequent")),
+                          ("ohe", OneHotEncoder(handle_unknown="ignore"))]), categorical),
+    ])
+
+
+def scan(source, template):
+    """Pass 1: streaming statistics, then fit the preprocessor on a frame that reproduces them."""
+    numeric, categorical = [], []
+    for name, _, cols in template.transformers:
+        (numeric if name == "num" else categorical).extend(cols)
+    sketches = {c: QuantileSketch() for c in numeric}
+    counts = {c: {} for c in categorical}
+    rows = positives = 0
+    for df in source:
+        fe = prepare_batch(df)
+        for c in numeric:
+            values = fe[c].to_numpy(dtype=float)
+            values = values[~np.isnan(values)]
+            if len(values):
+                sketches[c].add(values)
+        for c in categorical:
+            for value, n in fe[c].value_counts().items():
+                counts[c][value] = counts[c].get(value, 0) + int(n)
+        rows += len(df)
+        positives += int(df["default"].sum())
+    if not rows:
+        raise ValueError("No training rows: pass --synthetic N and/or --mongo with labelled applications")
+
+    # Summary frame: every category once, the most frequent one padded to stay the mode,
+    # numeric columns constant at their (sketch) median
+    size = max(len(v) for v in counts.values()) + 1
+    summary = {}
+    for c in categorical:
+        mode = max(counts[c], key=counts[c].get)
+        values = sorted(counts[c], key=str)
+        summary[c] = values + [mode] * (size - len(values))
+    for c in numeric:
+        summary[c] = [sketches[c].quantile(0.5)] * size
+    preprocessor = template.fit(pd.DataFrame(summary))
+    stats = {
+        "rows": rows,
+        "default_rate": positives / rows,
+        "medians": {c: sketches[c].quantile(0.5) for c in numeric},
+        "categories": {c: {str(k): v for k, v in counts[c].items()} for c in categorical},
+    }
+    return preprocessor, stats
+
+
+def encode(source, preprocessor, work_dir, seed=42, calibration_fraction=CALIBRATION_FRACTION,
+           holdout_fraction=HOLDOUT_FRACTION, max_calibration=MAX_CALIBRATION_ROWS, max_holdout=MAX_HOLDOUT_ROWS):
+    """Pass 2: encode chunk by chunk into a float32 memmap (train) and capped in-memory splits."""
+    n_features = len(preprocessor.get_feature_names_out())
+    capacity = max(source.max_rows, 1)
+    X_train = np.lib.format.open_memmap(os.path.join(work_dir, "X_train.npy"), mode="w+",
+                                        dtype=np.float32, shape=(capacity, n_features))
+    y_train = np.lib.format.open_memmap(os.path.join(work_dir, "y_train.npy"), mode="w+",
+                                        dtype=np.int8, shape=(capacity,))
+    held = {"calibration": ([], [], max_calibration), "holdout": ([], [], max_holdout)}
+    counts = {"train": 0, "calibration": 0, "holdout": 0}
+    rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(2)[1])
+
+    for df in source:
+        X = preprocessor.transform(prepare_batch(df))
+        X = np.asarray(X.toarray() if hasattr(X, "toarray") else X, dtype=np.float32)
+        y = df["default"].to_numpy(dtype=np.int8)
+        u = rng.random(len(df))
+        route = np.where(u < calibration_fraction, 1, np.where(u < calibration_fraction + holdout_fraction, 2, 0))
+        for code, name in ((1, "calibration"), (2, "holdout")):
+            xs, ys, cap = held[name]
+            idx = np.flatnonzero(route == code)
+            room = cap - counts[name]
+            if room <= 0 or not len(idx):
+                route[idx] = 0
+                continue
+            # Rows beyond the cap go to training instead
+            route[idx[room:]] = 0
+            idx = idx[:room]
+            xs.append(X[idx])
+            ys.append(y[idx])
+            counts[name] += len(idx)
+        idx = np.flatnonzero(route == 0)
+        start = counts["train"]
+        X_train[start:start + len(idx)] = X[idx]
+        y_train[start:start + len(idx)] = y[idx]
+        counts["train"] += len(idx)
+
+    X_train.flush()
+    y_train.flush()
+    n = counts["train"]
+    splits = {"train": (X_train[:n], y_train[:n])}
+    for name, (xs, ys, _) in held.items():
+        splits[name] = (np.vstack(xs) if xs else np.empty((0, n_features), np.float32),
+                        np.concatenate(ys) if ys else np.empty(0, np.int8))
+    return splits, counts
+
+
+def train(X, y, params):
+    from lightgbm import LGBMClassifier
+
+    if len(np.unique(y)) < 2:
+        raise ValueError("Training rows contain a single class")
+    return LGBMClassifier(**params).fit(X, y)
+
+
+def calibrate(clf, X, y):
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.frozen import FrozenEstimator
+
+    if len(y) < 100 or len(np.unique(y)) < 2:
+        raise ValueError(f"Need at least 100 calibration rows with both classes, got {len(y)}")
+    method = "isotonic" if len(y) >= 1000 else "sigmoid"
+    return CalibratedClassifierCV(FrozenEstimator(clf), method=method).fit(X, y)
+
+
+def build_explainer(clf):
+    import shap
+    return shap.TreeExplainer(clf)
+
+
+def evaluate(calibrated, X, y):
+    from sklearn.metrics import brier_score_loss, log_loss, roc_auc_score
+
+    if not len(y) or len(np.unique(y)) < 2:
+        return {"rows": int(len(y))}
+    p = calibrated.predict_proba(X)[:, 1]
+    return {
+        "rows": int(len(y)),
+        "auc": float(roc_auc_score(y, p)),
+        "brier": float(brier_score_loss(y, p)),
+        "log_loss": float(log_loss(y, p)),
+        "mean_pd": float(p.mean()),
+        "default_rate": float(y.mean()),
+    }
+
+
+def write_bundle(bundle, manifest, out_dir=BUNDLES_DIR, promote=False, bundle_path=BUNDLE_PATH):
+    import joblib
+
+    version_dir = os.path.join(out_dir, manifest["version"])
+    os.makedirs(version_dir, exist_ok=True)
+    path = os.path.join(version_dir, os.path.basename(bundle_path))
+    joblib.dump(bundle, path)
+    with open(os.path.join(version_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    if promote:
+        # Copy then rename, so a worker starting meanwhile never reads a partial file
+        tmp = f"{bundle_path}.tmp"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, bundle_path)
+    return path
+
+
+def retrain(source, params=None, seed=42, work_dir=None, out_dir=BUNDLES_DIR, promote=False,
+            template_path=TEMPLATE_PATH, calibration_fraction=CALIBRATION_FRACTION, holdout_fraction=HOLDOUT_FRACTION):
+    """Run every stage and return the manifest (version, rows, metrics, per-stage timings)."""
+    params = {**LGBM_PARAMS, "random_state": seed, **(params or {})}
+    timer = StageTimer()
+    version = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    scratch = tempfile.mkdtemp(prefix="retrain_", dir=work_dir)
+    try:
+        preprocessor, stats = timer.run("scan", scan, source, load_template(template_path))
+        splits, counts = timer.run("encode", encode, source, preprocessor, scratch, seed,
+                                   calibration_fraction, holdout_fraction)
+        clf = timer.run("train", train, *splits["train"], params)
+        calibrated = timer.run("calibrate", calibrate, clf, *splits["calibration"])
+        explainer = timer.run("explain", build_explainer, clf)
+        metrics = timer.run("evaluate", evaluate, calibrated, *splits["holdout"])
+        del splits
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    feature_names = list(preprocessor.get_feature_names_out())
+    manifest = {
+        "version": version,
+        "created": datetime.utcnow(),
+        "sources": {"synthetic": source.synthetic, "mongo": source.mongo_rows, "label_field": source.label_field},
+        "rows": counts,
+        "default_rate": stats["default_rate"],
+        "medians": stats["medians"],
+        "params": params,
+        "metrics": metrics,
+        "feature_names": feature_names,
+    }
+    bundle = {"preprocessor": preprocessor, "calibrated_clf": calibrated, "explainer": explainer,
+              "feature_names": feature_names, "manifest": manifest}
+    manifest["stages"] = timer.stages
+    path = timer.run("write", write_bundle, bundle, manifest, out_dir, promote)
+    manifest["stages"] = timer.stages
+    manifest["bundle_path"] = path
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the scoring bundle in bounded memory")
+    parser.add_argument("--synthetic", type=int, default=0, help="generated rows to train on")
+    parser.add_argument("--mongo", action="store_true", help="include labelled applications from Mongo")
+    parser.add_argument("--label-field", default=LABEL_FIELD)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--n-estimators", type=int, default=LGBM_PARAMS["n_estimators"])
+    parser.add_argument("--work-dir", help="where the memory-mapped matrix goes (default: system temp)")
+    parser.add_argument("--out-dir", default=BUNDLES_DIR)
+    parser.add_argument("--promote", action="store_true", help=f"also replace {BUNDLE_PATH}")
+    args = parser.parse_args()
+
+    coll = None
+    if args.mongo:
+        from db import users_coll
+        coll = users_coll
+    source = TrainingSource(args.synthetic, args.seed, coll, args.label_field, args.chunk_size)
+    print(f"Retraining on up to {source.max_rows} rows ({source.mongo_rows} from Mongo, {args.synthetic} synthetic)")
+    manifest = retrain(source, {"n_estimators": args.n_estimators}, args.seed, args.work_dir, args.out_dir,
+                       args.promote)
+    print(json.dumps({k: manifest[k] for k in ("version", "rows", "metrics", "stages", "bundle_path")},
+                     indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Portfolio rollups: daily buckets per (region, loan_category).
+
+Each application contributes to the bucket of the day it was created:
+applications, requested amount, status counts and, once scored, pd, tier,
+model decision and sanctioned amount (eligible_amount from sanction_amount).
+Whenever an application changes (onboarding, scoring, status update) the
+handler records (old document, new document); the difference of the two
+contributions is added to an in-process buffer and $inc'ed into the
+`portfolio_rollups` collection every ROLLUP_FLUSH_INTERVAL seconds with one
+unordered bulk_write. Re-scoring or re-reviewing an application therefore
+never double counts.
+
+/admin/portfolio merges the buckets of a date range, optionally grouped by
+region, loan_category or day. rebuild() recomputes the buckets from the
+applications in both tiers, the hot collection and the Parquet archive
+(backfill, or repair after lost increments).
+
+Usage:
+    python rollups.py --backfill
+    python rollups.py --backfill --start 2025-01-01 --end 2025-02-01
+"""
+import argparse
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from metrics import metrics
+
+FLUSH_INTERVAL_S = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "5"))
+GROUP_BY = {"none", "region", "loan_category", "day"}
+DECIDED = ("approved", "rejected")
+APPLICATION_FIELDS = {
+    "created": 1, "status": 1, "raw.region": 1, "raw.loan_category": 1, "raw.loan_amount_requested": 1,
+    "model_output.pd": 1, "model_output.tier": 1, "model_output.decision": 1, "model_output.eligible_amount": 1,
+}
+
+
+def _key(value):
+    return str(value).replace(".", "_").lstrip("$") or "unknown"
+
+
+def created_day(created):
+    """'YYYY-MM-DD' for a datetime or an ISO timestamp string."""
+    if isinstance(created, datetime):
+        return created.strftime("%Y-%m-%d")
+    if isinstance(created, str) and len(created) >= 10:
+        return created[:10]
+    return "unknown"
+
+
+def bucket_id(day, region, loan_category):
+    return f"{day}|{region}|{loan_category}"
+
+
+def contribution(doc):
+    """(bucket id, {counter: value}) for one application document, or None."""
+    if not doc:
+        return None
+    raw = doc.get("raw") or {}
+    region = _key(raw.get("region") or "unknown")
+    category = _key(raw.get("loan_category") or "unknown")
+    requested = float(raw.get("loan_amount_requested") or 0)
+    status = _key(doc.get("status") or "received")
+
+    counters = {
+        "applications": 1,
+        "requested_sum": requested,
+        f"status.{status}": 1,
+    }
+    output = doc.get("model_output") or {}
+    if output.get("pd") is not None:
+        sanctioned = float(output.get("eligible_amount") or 0)
+        counters.update({
+            "scored": 1,
+            "pd_sum": float(output["pd"]),
+            "scored_requested_sum": requested,
+            "sanctioned_sum": sanctioned,
+            f"tier.{_key(output.get('tier') or 'unknown')}": 1,
+        })
+        if output.get("decision") == "Approved":
+            counters["model_approved"] = 1
+        if status == "approved":
+            counters["approved_sanctioned_sum"] = sanctioned
+    if status == "approved":
+        counters["approved_requested_sum"] = requested
+    return bucket_id(created_day(doc.get("created")), region, category), counters
+
+
+def archived_document(row):
+    """Flat archive/export row (see export_applications.py) -> the fields contribution() reads."""
+    doc = {"created": row.get("created"), "status": row.get("status"), "raw": {}, "model_output": {}}
+    for name, value in row.items():
+        head, _, field = name.partition(".")
+        if field and head in ("raw", "model_output") and value is not None:
+            doc[head][field] = value
+    return doc
+
+
+class RollupBuffer:
+    """Coalesces contribution deltas per bucket; flushed as $inc upserts."""
+
+    def __init__(self, coll, interval=FLUSH_INTERVAL_S):
+        self.coll = coll
+        self.interval = interval
+        self._pending = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, old, new):
+        """Account for an application going from `old` to `new` (either may be None)."""
+        before, after = contribution(old), contribution(new)
+        with self._lock:
+            for sign, item in ((-1, before), (1, after)):
+                if item is None:
+                    continue
+                bucket, counters = item
+                pending = self._pending[bucket]
+                for name, value in counters.items():
+                    pending[name] += sign * value
+        if self._thread is None:
+            # Not running in the background (CLI, scripts): write through
+            self.flush()
+
+    def record_many(self, docs):
+        for doc in docs:
+            self.record(None, doc)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(lambda: defaultdict(float))
+            ops = []
+            for bucket, counters in pending.items():
+                inc = {k: v for k, v in counters.items() if v}
+                if not inc:
+                    continue
+                day, region, category = bucket.split("|")
+                ops.append(UpdateOne(
+                    {"_id": bucket},
+                    {"$inc": inc, "$setOnInsert": {"day": day, "region": region, "loan_category": category}},
+                    upsert=True,
+                ))
+            if not ops:
+                return 0
+            t0 = time.perf_counter()
+            try:
+                self.coll.bulk_write(ops, ordered=False)
+            except Exception as e:
+                # Put the deltas back; they are additive, so merging is safe
+                with self._lock:
+                    for bucket, counters in pending.items():
+                        for name, value in counters.items():
+                            self._pending[bucket][name] += value
+                metrics.inc("rollup_flush_errors")
+                print(f"Rollup flush failed, {len(ops)} buckets requeued: {e}")
+                return 0
+            metrics.observe("rollup_flush", time.perf_counter() - t0)
+            metrics.inc("rollup_buckets_flushed", len(ops))
+            return len(ops)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="rollup-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+# -------------------- QUERY --------------------
+def _merge(target, doc):
+    for name, value in doc.items():
+        if name in ("_id", "day", "region", "loan_category"):
+            continue
+        if isinstance(value, dict):
+            sub = target.setdefault(name, {})
+            for k, v in value.items():
+                sub[k] = sub.get(k, 0) + v
+        else:
+            target[name] = target.get(name, 0) + value
+
+
+def summarize(totals):
+    """Merged counters -> dashboard metrics."""
+    scored = totals.get("scored", 0)
+    statuses = {k: int(v) for k, v in totals.get("status", {}).items() if v}
+    decided = sum(statuses.get(s, 0) for s in DECIDED)
+    tiers = {k: int(v) for k, v in totals.get("tier", {}).items() if v}
+    return {
+        "applications": int(totals.get("applications", 0)),
+        "scored": int(scored),
+        "approval_rate": statuses.get("approved", 0) / decided if decided else None,
+        "model_approval_rate": totals.get("model_approved", 0) / scored if scored else None,
+        "avg_pd": totals.get("pd_sum", 0) / scored if scored else None,
+        "requested_total": totals.get("requested_sum", 0),
+        "sanctioned_total": totals.get("sanctioned_sum", 0),
+        "sanction_ratio": totals.get("sanctioned_sum", 0) / totals["scored_requested_sum"]
+        if totals.get("scored_requested_sum") else None,
+        "approved_requested_total": totals.get("approved_requested_sum", 0),
+        "approved_sanctioned_total": totals.get("approved_sanctioned_sum", 0),
+        "status_counts": statuses,
+        "tier_mix": {k: v / scored for k, v in sorted(tiers.items())} if scored else {},
+    }
+
+
+def query_portfolio(coll, start=None, end=None, group_by="none", regions=None, categories=None):
+    """Merge the buckets for [start, end] (YYYY-MM-DD, inclusive)."""
+    query = {}
+    if start or end:
+        query["day"] = {}
+        if start:
+            query["day"]["$gte"] = start
+        if end:
+            query["day"]["$lte"] = end
+    if regions:
+        query["region"] = {"$in": regions}
+    if categories:
+        query["loan_category"] = {"$in": categories}
+
+    overall = {}
+    groups = defaultdict(dict)
+    buckets = 0
+    for doc in coll.find(query):
+        buckets += 1
+        _merge(overall, doc)
+        if group_by != "none":
+            _merge(groups[doc[group_by]], doc)
+    result = {"buckets": buckets, "overall": summarize(overall)}
+    if group_by != "none":
+        result["group_by"] = group_by
+        result["groups"] = {k: summarize(v) for k, v in sorted(groups.items())}
+    return result
+
+
+# -------------------- BACKFILL --------------------
+def rebuild(apps_coll, coll, start=None, end=None, batch_size=1000, archive_root=None):
+    """
+    Recompute buckets from the applications created in [start, end) (datetimes; all when None).
+    With `archive_root`, applications moved to the Parquet archive count too; one still
+    in both tiers (interrupted archive run) is counted once, from the hot copy.
+    """
+    query = {}
+    if start or end:
+        query["created"] = {}
+        if start:
+            query["created"]["$gte"] = start
+        if end:
+            query["created"]["$lt"] = end
+    totals = defaultdict(lambda: defaultdict(float))
+    applications = 0
+    def add(doc):
+        bucket, counters = contribution(doc)
+        for name, value in counters.items():
+            totals[bucket][name] += value
+
+    for doc in apps_coll.find(query, APPLICATION_FIELDS, batch_size=batch_size):
+        add(doc)
+        applications += 1
+    archived = 0
+    if archive_root is not None:
+        from archive import iter_archived_chunks
+        for rows in iter_archived_chunks(archive_root, query, chunk_size=batch_size, hot_coll=apps_coll):
+            for row in rows:
+                add(archived_document(row))
+            archived += len(rows)
+
+    bucket_query = {}
+    if start or end:
+        bucket_query["day"] = {}
+        if start:
+            bucket_query["day"]["$gte"] = start.strftime("%Y-%m-%d")
+        if end:
+            bucket_query["day"]["$lt"] = end.strftime("%Y-%m-%d")
+    coll.delete_many(bucket_query)
+    docs = []
+    for bucket, counters in totals.items():
+        day, region, category = bucket.split("|")
+        doc = {"_id": bucket, "day": day, "region": region, "loan_category": category}
+        for name, value in counters.items():
+            head, _, sub = name.partition(".")
+            if sub:
+                doc.setdefault(head, {})[sub] = value
+            else:
+                doc[name] = value
+        docs.append(doc)
+    if docs:
+        coll.insert_many(docs, ordered=False)
+    return {"applications": applications + archived, "archived": archived, "buckets": len(docs)}
+
+
+def ensure_indexes(coll):
+    coll.create_index([("day", 1), ("region", 1), ("loan_category", 1)], name="day_region_category")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portfolio rollup maintenance")
+    parser.add_argument("--backfill", action="store_true", help="rebuild buckets from the applications")
+    parser.add_argument("--start", type=lambda s: datetime.strptime(s, "%Y-%m-%d"), help="first day (inclusive)")
+    parser.add_argument("--end", type=lambda s: datetime.strptime(s, "%Y-%m-%d"), help="last day (inclusive)")
+    parser.add_argument("--archive-dir", help="Parquet archive to include (default ARCHIVE_DIR, see archive.py)")
+    args = parser.parse_args()
+
+    from archive import ARCHIVE_DIR
+    from db import rollups_coll, users_coll
+    ensure_indexes(rollups_coll)
+    if args.backfill:
+        end = args.end + timedelta(days=1) if args.end else None
+        print(rebuild(users_coll, rollups_coll, args.start, end, archive_root=args.archive_dir or ARCHIVE_DIR))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Per-class executors for request handlers.
+
+FastAPI runs every sync endpoint on one shared thread pool, so a few heavy
+admin calls (applications summary, per-user detail with re-scoring, insight
+generation) take the threads, CPU and inference slots that /predict and /users
+need. Instead each route declares its class:
+
+    @app.get("/admin/applications-summary")
+    @scheduler.route("admin")
+    def admin_applications_summary(): ...
+
+and runs on that class's own thread pool:
+
+  - SCHED_<CLASS>_WORKERS threads run the class's calls; admin work can never
+    hold more threads than that, whatever the page load,
+  - at most SCHED_<CLASS>_QUEUE calls wait for a thread; past that, or when a
+    call waited more than SCHED_<CLASS>_TIMEOUT seconds, it answers 503 with
+    Retry-After (admission.Overloaded),
+  - the class's priority travels with the call: inference slots go to waiting
+    interactive calls before admin ones (see inference_slots.py). Threads the
+    scheduler did not start (insight precompute, exact SHAP recompute,
+    onboarding tracking) rank after every class.
+
+/admin/metrics reports per class: running and queued calls, completed and
+rejected counts, and utilization (busy worker-seconds over available
+worker-seconds in the last SCHED_UTILIZATION_WINDOW seconds). Queue wait and
+run time are in the timers as sched_queue_wait / sched_run.
+
+SCHED_ENABLED=0 runs every route on the shared pool again (load_test.py
+--isolation uses it for the comparison).
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from admission import Overloaded
+from metrics import metrics
+
+DEFAULT_CLASSES = {
+    # class: (workers, queue size, max queue wait in seconds, priority; lower goes first)
+    "interactive": (32, 256, 10.0, 0),
+    "admin": (2, 16, 5.0, 1),
+}
+SCHED_ENABLED = os.getenv("SCHED_ENABLED", "1") != "0"
+UTILIZATION_WINDOW_S = float(os.getenv("SCHED_UTILIZATION_WINDOW", "10"))
+
+_current = threading.local()
+_DONE = object()
+
+
+def current_priority():
+    """Priority of the calling thread; threads the scheduler did not start get the lowest."""
+    return getattr(_current, "priority", scheduler.background_priority)
+
+
+class WorkClass:
+    def __init__(self, name, workers, queue_size, timeout, priority):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.priority = priority
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"sched-{name}")
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self._busy_s = 0.0         # worker-seconds of finished calls
+        self._running = {}         # call token -> start time
+        self._samples = deque()    # (time, busy worker-seconds) for utilization
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on this class's workers; Overloaded if the queue is full."""
+        with self._lock:
+            if self.queued >= self.queue_size:
+                self.rejected += 1
+                metrics.inc("sched_rejected", cls=self.name)
+                raise Overloaded(self.name)
+            self.queued += 1
+        return await self._submit(fn, args, kwargs, self.timeout)
+
+    async def resume(self, fn, *args, **kwargs):
+        """
+        Like run, for more work of a call already admitted (the next chunk of a stream
+        whose response has started): never rejected by the queue limit or the timeout.
+        """
+        with self._lock:
+            self.queued += 1
+        return await self._submit(fn, args, kwargs, None)
+
+    async def _submit(self, fn, args, kwargs, timeout):
+        call = functools.partial(self._call, time.monotonic(), timeout, fn, args, kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, contextvars.copy_context().run, call)
+
+    def _call(self, submitted, timeout, fn, args, kwargs):
+        token = object()
+        start = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            if timeout is not None and start - submitted > timeout:
+                # The client has likely given up; don't spend a worker on it
+                self.rejected += 1
+                metrics.inc("sched_rejected", cls=self.name)
+                raise Overloaded(self.name)
+            self._running[token] = start
+        metrics.observe("sched_queue_wait", start - submitted, cls=self.name)
+        _current.priority = self.priority
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            del _current.priority
+            end = time.monotonic()
+            metrics.observe("sched_run", end - start, cls=self.name)
+            with self._lock:
+                del self._running[token]
+                self._busy_s += end - start
+                self.completed += 1
+                self._sample(end)
+
+    def _busy(self, now):
+        return self._busy_s + sum(now - start for start in self._running.values())
+
+    def _sample(self, now):
+        # At most one sample a second, kept for two windows
+        if not self._samples or now - self._samples[-1][0] >= 1.0:
+            self._samples.append((now, self._busy(now)))
+        while self._samples and self._samples[0][0] < now - 2 * UTILIZATION_WINDOW_S:
+            self._samples.popleft()
+
+    def utilization(self, now):
+        """Share of worker time spent running calls since the oldest sample in the window."""
+        since, busy = self._started, 0.0
+        for t, b in self._samples:
+            if t >= now - UTILIZATION_WINDOW_S:
+                since, busy = t, b
+                break
+        else:
+            if self._samples:
+                since, busy = self._samples[-1]
+        elapsed = now - since
+        return min((self._busy(now) - busy) / (elapsed * self.workers), 1.0) if elapsed > 0 else 0.0
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            utilization = self.utilization(now)
+            self._sample(now)
+            return {
+                "workers": self.workers,
+                "priority": self.priority,
+                "running": len(self._running),
+                "queued": self.queued,
+                "queue_size": self.queue_size,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "busy_s": round(self._busy(now), 3),
+                "utilization": round(utilization, 4),
+            }
+
+
+class Scheduler:
+    def __init__(self, classes=None, enabled=SCHED_ENABLED):
+        self.enabled = enabled
+        self.classes = {}
+        for name, (workers, queue_size, timeout, priority) in (classes or DEFAULT_CLASSES).items():
+            prefix = f"SCHED_{name.upper()}_"
+            self.classes[name] = WorkClass(
+                name,
+                int(os.getenv(prefix + "WORKERS", workers)),
+                int(os.getenv(prefix + "QUEUE", queue_size)),
+                float(os.getenv(prefix + "TIMEOUT", timeout)),
+                int(os.getenv(prefix + "PRIORITY", priority)),
+            )
+        # Background workers and other threads not started here rank after every class
+        self.background_priority = max(cls.priority for cls in self.classes.values()) + 1
+
+    def route(self, name):
+        """Decorator for a sync endpoint: run it on the executor of class `name`."""
+        cls = self.classes[name]
+
+        def decorate(fn):
+            # functools.wraps keeps fn's signature, so FastAPI sees the same parameters
+            @functools.wraps(fn)
+            async def endpoint(*args, **kwargs):
+                if not self.enabled:
+                    return await run_in_threadpool(fn, *args, **kwargs)
+                return await cls.run(fn, *args, **kwargs)
+            endpoint.work_class = name
+            return endpoint
+        return decorate
+
+    async def call(self, name, fn, *args, admitted=False, **kwargs):
+        """
+        Run fn(*args, **kwargs) on class `name` from an async route (e.g. a streamed
+        upload processed chunk by chunk). The request's first call is admitted and may
+        raise Overloaded; pass admitted=True for the later ones, which must not fail
+        halfway through the work.
+        """
+        if not self.enabled:
+            return await run_in_threadpool(fn, *args, **kwargs)
+        cls = self.classes[name]
+        if admitted:
+            return await cls.resume(fn, *args, **kwargs)
+        return await cls.run(fn, *args, **kwargs)
+
+    async def iterate(self, name, iterator):
+        """
+        Async iterator pulling each item of a sync iterator (e.g. a streamed export) on
+        class `name`. Return it from a route of that class: the route call is what gets
+        admitted. The pulls run after the response has started, when a 503 is no longer
+        possible, so they skip the queue limit and timeout instead of truncating the stream.
+        """
+        if not self.enabled:
+            async for item in iterate_in_threadpool(iterator):
+                yield item
+            return
+        cls = self.classes[name]
+        while True:
+            item = await cls.resume(next, iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+
+    def status(self):
+        return {"enabled": self.enabled, "background_priority": self.background_priority,
+                **{name: cls.status() for name, cls in self.classes.items()}}
+
+
+scheduler = Scheduler()
@@ -0,0 +1,73 @@
+from pydantic import BaseModel
+from typing import Optional
+
+# -------------------- REQUEST MODELS --------------------
+class ProfileRequest(BaseModel):
+    clerk_user_id: str
+    name: str
+    gender: str
+    state: str
+    occupation: str
+
+class OnboardRequest(BaseModel):
+    clerk_user_id: str
+    user_type: str
+    region: str
+    sms_count: float
+    bill_on_time_ratio: float | None = None
+    recharge_freq: float
+    sim_tenure: float
+    location_stability: float
+    income_signal: float
+    coop_score: float
+    land_verified: int
+    age_group: str
+    loan_amount_requested: float
+    recharge_pattern: str
+    loan_category: str
+    psychometric_score: float
+    consent: bool = True
+
+class InputData(BaseModel):
+    user_type: str
+    region: str
+    sms_count: float
+    bill_on_time_ratio: float
+    recharge_freq: float
+    sim_tenure: float
+    location_stability: float
+    income_signal: float
+    coop_score: float
+    land_verified: int
+    age_group: str
+    loan_amount_requested: float
+    recharge_pattern: str
+    loan_category: str
+    psychometric_score: float
+
+class PsychometricScoreRequest(BaseModel):
+    clerk_user_id: str
+    psychometric_score: float
+
+class ApplicationUpdateRequest(BaseModel):
+    status: str
+    remarks: Optional[str] = ""
+    admin_notes: Optional[str] = ""
+
+class AIInsightRequest(BaseModel):
+    clerk_user_id: str
+    application_created: str
+
+class SweepSpec(BaseModel):
+    # Either explicit values or an evenly spaced range
+    values: Optional[list[float]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    steps: int = 11
+
+class WhatIfRequest(BaseModel):
+    base: InputData
+    sweeps: dict[str, SweepSpec]
+
+class MarkReadRequest(BaseModel):
+    notification_ids: Optional[list[str]] = None
@@ -0,0 +1,335 @@
+"""
+Population-level explanation summaries for the admin dashboard.
+
+For every segment (all applications, and each region / user_type /
+loan_category) we keep the mean absolute attribution and the mean signed
+attribution per encoded feature. Two sources feed the `shap_summaries`
+collection:
+
+  - live:  every new application, once, after it is stored, is scored with
+           exact attributions by the onboarding tracker (onboard_tracking.py);
+           its attribution row goes to an in-process accumulator, which is
+           $inc'ed into a per-minute bucket document every
+           SHAP_SUMMARY_FLUSH_INTERVAL seconds.
+  - exact: every SHAP_SUMMARY_RECOMPUTE_INTERVAL seconds one worker (holding a
+           lease) runs exact TreeSHAP over all stored applications and replaces
+           the baseline; live buckets it covers are dropped.
+
+The dashboard reads a single materialized document: the exact baseline plus
+the live buckets recorded after it. Both count stored applications once with
+exact attributions, so the live buckets extend the baseline with the
+applications onboarded since. Ad-hoc /predict calls and re-scores of stored
+applications are not summarized. The view still drifts slightly until the next
+exact pass: applications deleted, archived or not tracked because the
+onboarding queue was full are only reconciled then.
+
+Usage:
+    python shap_summary.py --recompute
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from metrics import metrics
+
+SEGMENT_FIELDS = ["region", "user_type", "loan_category"]
+OVERALL = "all"
+EXACT_ID = "exact"
+MATERIALIZED_ID = "materialized"
+LOCK_ID = "recompute_lock"
+
+FLUSH_INTERVAL_S = float(os.getenv("SHAP_SUMMARY_FLUSH_INTERVAL", "60"))
+RECOMPUTE_INTERVAL_S = float(os.getenv("SHAP_SUMMARY_RECOMPUTE_INTERVAL", str(6 * 3600)))
+RECOMPUTE_BATCH_SIZE = 1000
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _key(name):
+    """Mongo-safe field name."""
+    return str(name).replace(".", "_").lstrip("$") or "unknown"
+
+
+def segment_keys(row):
+    keys = [OVERALL]
+    for field in SEGMENT_FIELDS:
+        value = row.get(field)
+        keys.append(f"{field}={_key(value if value is not None else 'missing')}")
+    return keys
+
+
+class RecordingExplainer:
+    """Passes shap_values through to the real explainer and keeps the matrix."""
+
+    def __init__(self, explainer):
+        self.explainer = explainer
+        self.values = None
+
+    def shap_values(self, X):
+        out = self.explainer.shap_values(X)
+        self.values = np.asarray(out[1] if isinstance(out, list) else out)
+        return out
+
+
+class SummaryAccumulator:
+    """Per-segment count, sum |attribution| and sum attribution."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.feature_names = None
+        self.segments = {}
+
+    def observe(self, rows, values, feature_names):
+        """rows: list of application dicts or a DataFrame, aligned with the rows of `values`."""
+        try:
+            if not isinstance(rows, list):
+                rows = rows[SEGMENT_FIELDS].to_dict("records") if set(SEGMENT_FIELDS) <= set(rows.columns) \
+                    else [{}] * len(rows)
+            values = np.asarray(values, dtype=float)
+            groups = {}
+            for i, row in enumerate(rows):
+                for key in segment_keys(row):
+                    groups.setdefault(key, []).append(i)
+            with self._lock:
+                self.feature_names = list(feature_names)
+                for key, idx in groups.items():
+                    block = values[idx]
+                    seg = self.segments.get(key)
+                    if seg is None:
+                        seg = self.segments[key] = [0, np.zeros(values.shape[1]), np.zeros(values.shape[1])]
+                    seg[0] += len(idx)
+                    seg[1] += np.abs(block).sum(axis=0)
+                    seg[2] += block.sum(axis=0)
+        except Exception as e:
+            metrics.inc("shap_summary_errors")
+            print(f"SHAP summary update failed: {e}")
+
+    def drain(self):
+        """Take the accumulated sums and start over."""
+        with self._lock:
+            segments, self.segments = self.segments, {}
+            return self.feature_names, segments
+
+    def to_summary(self):
+        """Means per segment (used by the exact recompute)."""
+        names, segments = self.drain()
+        return {key: _means(names, count, sum_abs, total) for key, (count, sum_abs, total) in segments.items()}
+
+
+def _means(names, count, sum_abs, total):
+    return {
+        "count": int(count),
+        "mean_abs": {_key(n): float(v / count) for n, v in zip(names, sum_abs)},
+        "mean": {_key(n): float(v / count) for n, v in zip(names, total)},
+    }
+
+
+# -------------------- MONGO --------------------
+def flush_live(coll, acc, now=None):
+    """$inc the accumulated sums into the current minute's bucket. Returns the segments written."""
+    names, segments = acc.drain()
+    if not segments:
+        return 0
+    now = now or datetime.utcnow()
+    minute = now.replace(second=0, microsecond=0)
+    inc = {}
+    for key, (count, sum_abs, total) in segments.items():
+        inc[f"segments.{key}.count"] = count
+        for name, a, s in zip(names, sum_abs.tolist(), total.tolist()):
+            inc[f"segments.{key}.sum_abs.{_key(name)}"] = a
+            inc[f"segments.{key}.sum.{_key(name)}"] = s
+    coll.update_one({"_id": f"live:{minute:%Y%m%d%H%M}"}, {"$inc": inc, "$set": {"minute": minute}}, upsert=True)
+    metrics.inc("shap_summary_flushes")
+    return len(segments)
+
+
+def materialize(coll):
+    """Exact baseline + live buckets recorded after it -> one document the dashboard reads."""
+    exact = coll.find_one({"_id": EXACT_ID}) or {}
+    as_of = exact.get("as_of")
+    totals = {}
+    for key, seg in (exact.get("segments") or {}).items():
+        count = seg["count"]
+        totals[key] = [count, {f: v * count for f, v in seg["mean_abs"].items()},
+                       {f: v * count for f, v in seg["mean"].items()}]
+    live_query = {"_id": {"$regex": "^live:"}}
+    if as_of:
+        live_query["minute"] = {"$gt": as_of}
+    live_buckets = 0
+    for bucket in coll.find(live_query):
+        live_buckets += 1
+        for key, seg in bucket.get("segments", {}).items():
+            t = totals.setdefault(key, [0, {}, {}])
+            t[0] += seg.get("count", 0)
+            for f, v in seg.get("sum_abs", {}).items():
+                t[1][f] = t[1].get(f, 0.0) + v
+            for f, v in seg.get("sum", {}).items():
+                t[2][f] = t[2].get(f, 0.0) + v
+
+    segments = {}
+    for key, (count, sum_abs, total) in totals.items():
+        if not count:
+            continue
+        segments[key] = {
+            "count": count,
+            "mean_abs": {f: v / count for f, v in sum_abs.items()},
+            "mean": {f: v / count for f, v in total.items()},
+        }
+    doc = {
+        "segments": segments,
+        "exact_as_of": as_of,
+        "exact_applications": (exact.get("segments") or {}).get(OVERALL, {}).get("count", 0),
+        "model_version": exact.get("model_version"),
+        "live_buckets": live_buckets,
+        "updated_at": datetime.utcnow(),
+    }
+    coll.replace_one({"_id": MATERIALIZED_ID}, doc, upsert=True)
+    return doc
+
+
+def claim_recompute(coll, ttl_s):
+    """Lease so only one worker runs the exact pass per interval."""
+    now = datetime.utcnow()
+    coll.update_one({"_id": LOCK_ID}, {"$setOnInsert": {"until": datetime(1970, 1, 1)}}, upsert=True)
+    claimed = coll.update_one(
+        {"_id": LOCK_ID, "until": {"$lt": now}},
+        {"$set": {"until": now + timedelta(seconds=ttl_s), "worker": WORKER_ID}},
+    )
+    return claimed.modified_count == 1
+
+
+def recompute_exact(coll, apps_coll, model, batch_size=RECOMPUTE_BATCH_SIZE):
+    """Exact TreeSHAP over every stored application; replaces the baseline and rematerializes."""
+    from feature_store import FEATURES_FIELD, refresh_ops
+    from schemas import InputData
+
+    fields = list(InputData.model_fields)
+    started = datetime.utcnow()
+    t0 = time.perf_counter()
+    acc = SummaryAccumulator()
+    scored = 0
+
+    def run(docs):
+        docs = [d for d in docs if all(f in d["raw"] for f in fields)]
+        if not docs:
+            return 0
+        # Stored encoded vectors (see feature_store.py); stale ones are re-encoded and written back
+        X, refreshed = model.feature_store.matrix(docs)
+        if refreshed:
+            apps_coll.bulk_write(refresh_ops(docs, refreshed), ordered=False)
+        out = model.explainer.shap_values(X)
+        acc.observe([d["raw"] for d in docs], out[1] if isinstance(out, list) else out, model.feature_names)
+        return len(docs)
+
+    batch = []
+    for doc in apps_coll.find({"raw": {"$exists": True}}, {"raw": 1, FEATURES_FIELD: 1}, batch_size=batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            scored += run(batch)
+            batch = []
+    if batch:
+        scored += run(batch)
+
+    coll.replace_one({"_id": EXACT_ID}, {
+        "as_of": started,
+        "model_version": model.model_version,
+        "segments": acc.to_summary(),
+        "duration_s": round(time.perf_counter() - t0, 3),
+    }, upsert=True)
+    # Buckets before the baseline are covered by it
+    coll.delete_many({"_id": {"$regex": "^live:"}, "minute": {"$lt": started.replace(second=0, microsecond=0)}})
+    metrics.observe("shap_summary_recompute", time.perf_counter() - t0)
+    print(f"SHAP summary recomputed over {scored} applications in {time.perf_counter() - t0:.1f}s")
+    return materialize(coll)
+
+
+def format_summary(doc, dimension=None, top=None):
+    """Materialized document -> per-segment feature rankings for the API."""
+    segments = {}
+    for key, seg in sorted((doc or {}).get("segments", {}).items()):
+        if dimension and key != OVERALL and not key.startswith(dimension + "="):
+            continue
+        ranked = sorted(seg["mean_abs"], key=lambda f: -seg["mean_abs"][f])
+        segments[key] = {
+            "count": seg["count"],
+            "features": [
+                {"feature": f, "mean_abs": seg["mean_abs"][f], "mean": seg["mean"].get(f, 0.0)}
+                for f in ranked[:top]
+            ],
+        }
+    return segments
+
+
+class SummaryWorker:
+    """Background flush/materialize loop plus the leased exact recompute."""
+
+    def __init__(self, coll, apps_coll, model, acc, flush_interval=FLUSH_INTERVAL_S,
+                 recompute_interval=RECOMPUTE_INTERVAL_S):
+        self.coll = coll
+        self.apps_coll = apps_coll
+        self.model = model
+        self.acc = acc
+        self.flush_interval = flush_interval
+        self.recompute_interval = recompute_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.flush_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="shap-summary", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            flush_live(self.coll, self.acc)
+        except Exception as e:
+            print(f"Final SHAP summary flush failed: {e}")
+
+    def run_once(self):
+        flush_live(self.coll, self.acc)
+        if (self.recompute_interval > 0 and self.model.ready
+                and claim_recompute(self.coll, self.recompute_interval)):
+            recompute_exact(self.coll, self.apps_coll, self.model)
+        else:
+            materialize(self.coll)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                metrics.inc("shap_summary_errors")
+                print(f"SHAP summary refresh failed: {e}")
+
+
+accumulator = SummaryAccumulator()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the population explanation summary")
+    parser.add_argument("--recompute", action="store_true", help="run exact SHAP over all applications")
+    args = parser.parse_args()
+
+    from db import shap_summaries_coll, users_coll
+    if args.recompute:
+        from model_runtime import ModelRuntime
+        model = ModelRuntime(warmup_rows=0)
+        model.start(background=False)
+        doc = recompute_exact(shap_summaries_coll, users_coll, model)
+    else:
+        doc = materialize(shap_summaries_coll)
+    for key, seg in format_summary(doc, top=3).items():
+        print(key, seg["count"], [f["feature"] for f in seg["features"]])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""
+Streaming distribution sketches for drift monitoring.
+
+Every tracked scoring call (each new application once, see
+onboard_tracking.py, and ad-hoc /predict calls) updates, in process:
+  - a quantile sketch per numeric input feature and for pd / alt_cibil_score
+  - a frequency count per categorical input feature and for the tier mix
+
+QuantileSketch keeps counts in logarithmic buckets (relative accuracy
+ALPHA), so its size depends on the value range, not on how many values were
+seen, and two sketches merge by adding bucket counts. Each worker snapshots
+its sketches to the `distribution_sketches` collection, one document per
+worker and UTC day; /admin/drift merges the days requested and compares them
+with the notebook's training distribution (data_generator) using the
+population stability index.
+"""
+import math
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from metrics import metrics
+
+ALPHA = 0.01
+MIN_POSITIVE = 1e-9
+MAX_CATEGORIES = 64
+OTHER = "__other__"
+
+NUMERIC_FEATURES = [
+    "sms_count", "bill_on_time_ratio", "recharge_freq", "sim_tenure", "location_stability",
+    "income_signal", "coop_score", "land_verified", "psychometric_score", "loan_amount_requested",
+]
+CATEGORICAL_FEATURES = ["user_type", "region", "age_group", "recharge_pattern", "loan_category"]
+SCORE_FIELDS = ["pd", "alt_cibil_score"]
+
+# Below this many values, plain Python beats numpy's per-call overhead
+SMALL_BATCH = 16
+
+PSI_BINS = 10
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+REFERENCE_SIZE = int(os.getenv("DRIFT_REFERENCE_SIZE", "20000"))
+REFERENCE_SEED = 42
+SNAPSHOT_INTERVAL_S = float(os.getenv("SKETCH_SNAPSHOT_INTERVAL", "60"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class QuantileSketch:
+    """Mergeable log-bucket quantile sketch (DDSketch-style) for non-negative and negative values."""
+
+    def __init__(self, alpha=ALPHA):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, values):
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    @staticmethod
+    def _bump(bins, indexes):
+        keys, counts = np.unique(indexes, return_counts=True)
+        for k, c in zip(keys.tolist(), counts.tolist()):
+            bins[k] = bins.get(k, 0) + c
+
+    def _add_small(self, values):
+        for x in values:
+            x = float(x)
+            if not math.isfinite(x):
+                continue
+            if x > MIN_POSITIVE:
+                k = math.ceil(math.log(x) / self._log_gamma)
+                self.positive[k] = self.positive.get(k, 0) + 1
+            elif x < -MIN_POSITIVE:
+                k = math.ceil(math.log(-x) / self._log_gamma)
+                self.negative[k] = self.negative.get(k, 0) + 1
+            else:
+                self.zero += 1
+            self.count += 1
+            self.total += x
+            self.min = min(self.min, x)
+            self.max = max(self.max, x)
+
+    def add(self, values):
+        if len(values) <= SMALL_BATCH:
+            self._add_small(values)
+            return
+        v = np.asarray(values, dtype=float).ravel()
+        v = v[np.isfinite(v)]
+        if not len(v):
+            return
+        pos = v > MIN_POSITIVE
+        neg = v < -MIN_POSITIVE
+        if pos.any():
+            self._bump(self.positive, self._index(v[pos]))
+        if neg.any():
+            self._bump(self.negative, self._index(-v[neg]))
+        self.zero += int(len(v) - pos.sum() - neg.sum())
+        self.count += len(v)
+        self.total += float(v.sum())
+        self.min = min(self.min, float(v.min()))
+        self.max = max(self.max, float(v.max()))
+
+    def merge(self, other):
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for k, c in theirs.items():
+                mine[k] = mine.get(k, 0) + c
+        self.zero += other.zero
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _ordered(self):
+        """(representative value, count) from smallest to largest."""
+        for k in sorted(self.negative, reverse=True):
+            yield -self._value(k), self.negative[k]
+        if self.zero:
+            yield 0.0, self.zero
+        for k in sorted(self.positive):
+            yield self._value(k), self.positive[k]
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, c in self._ordered():
+            seen += c
+            if seen > rank:
+                return float(min(max(value, self.min), self.max))
+        return self.max
+
+    def cdf(self, x):
+        """Fraction of values <= x (to the sketch's accuracy)."""
+        if not self.count:
+            return 0.0
+        if x >= MIN_POSITIVE:
+            limit = int(self._index(np.array([x]))[0])
+            below = sum(self.negative.values()) + self.zero + sum(c for k, c in self.positive.items() if k <= limit)
+        elif x > -MIN_POSITIVE:
+            below = sum(self.negative.values()) + self.zero
+        else:
+            limit = int(self._index(np.array([-x]))[0])
+            below = sum(c for k, c in self.negative.items() if k >= limit)
+        return below / self.count
+
+    def to_dict(self):
+        return {
+            "alpha": self.alpha,
+            "positive": {str(k): c for k, c in self.positive.items()},
+            "negative": {str(k): c for k, c in self.negative.items()},
+            "zero": self.zero,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(d.get("alpha", ALPHA))
+        sketch.positive = {int(k): c for k, c in d.get("positive", {}).items()}
+        sketch.negative = {int(k): c for k, c in d.get("negative", {}).items()}
+        sketch.zero = d.get("zero", 0)
+        sketch.count = d.get("count", 0)
+        sketch.total = d.get("total", 0.0)
+        sketch.min = d["min"] if d.get("min") is not None else math.inf
+        sketch.max = d["max"] if d.get("max") is not None else -math.inf
+        return sketch
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "p10": self.quantile(0.1),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max if self.count else None,
+        }
+
+
+class FrequencySketch:
+    """Category counts; categories beyond MAX_CATEGORIES are folded into OTHER."""
+
+    def __init__(self, max_categories=MAX_CATEGORIES):
+        self.max_categories = max_categories
+        self.counts = {}
+
+    def add(self, values):
+        if len(values) <= SMALL_BATCH:
+            items = [(str(k), 1) for k in values]
+        else:
+            keys, counts = np.unique(np.asarray(values, dtype=str), return_counts=True)
+            items = zip(keys.tolist(), counts.tolist())
+        for k, c in items:
+            k = k.replace(".", "_").lstrip("$") or "unknown"  # valid Mongo field names
+            if k not in self.counts and len(self.counts) >= self.max_categories:
+                k = OTHER
+            self.counts[k] = self.counts.get(k, 0) + c
+
+    def merge(self, other):
+        for k, c in other.counts.items():
+            if k not in self.counts and len(self.counts) >= self.max_categories:
+                k = OTHER
+            self.counts[k] = self.counts.get(k, 0) + c
+        return self
+
+    @property
+    def count(self):
+        return sum(self.counts.values())
+
+    def frequencies(self):
+        total = self.count
+        return {k: c / total for k, c in sorted(self.counts.items())} if total else {}
+
+    def to_dict(self):
+        return {"counts": dict(self.counts)}
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls()
+        sketch.counts = dict(d.get("counts", {}))
+        return sketch
+
+
+def new_sketches():
+    sketches = {name: QuantileSketch() for name in NUMERIC_FEATURES + SCORE_FIELDS}
+    sketches.update({name: FrequencySketch() for name in CATEGORICAL_FEATURES + ["tier"]})
+    return sketches
+
+
+def sketches_to_dict(sketches):
+    return {name: s.to_dict() for name, s in sketches.items()}
+
+
+def sketches_from_dict(d):
+    sketches = new_sketches()
+    for name, data in d.items():
+        if name in sketches:
+            sketches[name] = type(sketches[name]).from_dict(data)
+    return sketches
+
+
+def merge_sketches(target, other):
+    for name, sketch in other.items():
+        if name in target:
+            target[name].merge(sketch)
+    return target
+
+
+def _is_missing(value):
+    return value is None or value != value  # None or NaN
+
+
+def _columns(rows):
+    """Column lists from a list of application dicts or a small DataFrame."""
+    if isinstance(rows, list):
+        return {name: [row.get(name) for row in rows] for name in NUMERIC_FEATURES + CATEGORICAL_FEATURES}
+    return rows.to_dict("list")
+
+
+def update_sketches(sketches, rows, results):
+    """
+    Add a scored batch: `rows` holds the inputs (a DataFrame or a list of
+    application dicts), `results` the infer_user/infer_batch outputs.
+    """
+    if isinstance(rows, list) or len(rows) <= SMALL_BATCH:
+        columns = _columns(rows)
+        for name in NUMERIC_FEATURES:
+            if name in columns:
+                sketches[name].add([math.nan if _is_missing(v) else v for v in columns[name]])
+        for name in CATEGORICAL_FEATURES:
+            if name in columns:
+                sketches[name].add(["missing" if _is_missing(v) else v for v in columns[name]])
+    else:
+        for name in NUMERIC_FEATURES:
+            if name in rows.columns:
+                sketches[name].add(rows[name].to_numpy(dtype=float, na_value=np.nan))
+        for name in CATEGORICAL_FEATURES:
+            if name in rows.columns:
+                sketches[name].add(rows[name].fillna("missing").to_numpy())
+    for name in SCORE_FIELDS:
+        sketches[name].add([r[name] for r in results if r.get(name) is not None])
+    sketches["tier"].add([r["tier"] for r in results if r.get("tier")])
+
+
+# -------------------- POPULATION STABILITY --------------------
+def psi(expected, actual, eps=1e-4):
+    e = np.clip(np.asarray(expected, dtype=float), eps, None)
+    a = np.clip(np.asarray(actual, dtype=float), eps, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def psi_status(value):
+    if value is None:
+        return "no_data"
+    if value < PSI_MODERATE:
+        return "stable"
+    if value < PSI_SIGNIFICANT:
+        return "moderate_shift"
+    return "significant_shift"
+
+
+def _bin_fractions(sketch, edges):
+    cdf = [sketch.cdf(e) for e in edges]
+    return np.diff([0.0] + cdf + [1.0])
+
+
+def compare_quantiles(reference, current):
+    """PSI over the reference deciles (collapsed where the reference has point masses)."""
+    if not current.count or not reference.count:
+        return None
+    edges = sorted({reference.quantile(q / PSI_BINS) for q in range(1, PSI_BINS)})
+    return psi(_bin_fractions(reference, edges), _bin_fractions(current, edges))
+
+
+def compare_frequencies(reference, current):
+    if not current.count or not reference.count:
+        return None
+    ref, cur = reference.frequencies(), current.frequencies()
+    keys = sorted(set(ref) | set(cur))
+    return psi([ref.get(k, 0.0) for k in keys], [cur.get(k, 0.0) for k in keys])
+
+
+def drift_report(current, reference):
+    """Per-feature summary of the current sketches with PSI against the reference."""
+    report = {}
+    for name, sketch in current.items():
+        ref = reference.get(name)
+        if isinstance(sketch, QuantileSketch):
+            entry = sketch.summary()
+            value = compare_quantiles(ref, sketch) if ref else None
+        else:
+            entry = {"count": sketch.count, "frequencies": sketch.frequencies()}
+            if ref:
+                entry["reference_frequencies"] = ref.frequencies()
+            value = compare_frequencies(ref, sketch) if ref else None
+        entry["psi"] = round(value, 4) if value is not None else None
+        entry["status"] = psi_status(value) if ref else "no_reference"
+        report[name] = entry
+    return report
+
+
+_reference_cache = {}
+
+
+def reference_sketches(model=None):
+    """
+    Sketches of the notebook's synthetic training distribution. Score fields are
+    included when a loaded ModelRuntime is passed (cached per model version).
+    """
+    key = getattr(model, "model_version", None) if model is not None and model.loaded else None
+    if key not in _reference_cache:
+        from data_generator import generate_applicants
+
+        df = generate_applicants(REFERENCE_SIZE, seed=REFERENCE_SEED)
+        results = model.infer_batch(df, explain=False, track=False) if key is not None else []
+        sketches = new_sketches()
+        update_sketches(sketches, df, results)
+        if key is None:
+            for name in SCORE_FIELDS + ["tier"]:
+                sketches.pop(name)
+        _reference_cache[key] = sketches
+    return _reference_cache[key]
+
+
+# -------------------- PROCESS STATE --------------------
+class DistributionMonitor:
+    """This worker's sketches for the current UTC day."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.window = self._today()
+        self.sketches = new_sketches()
+
+    @staticmethod
+    def _today():
+        return datetime.utcnow().strftime("%Y-%m-%d")
+
+    def observe(self, rows, results):
+        try:
+            with self._lock:
+                update_sketches(self.sketches, rows, results)
+        except Exception as e:
+            # Monitoring must never break scoring
+            metrics.inc("sketch_update_errors")
+            print(f"Sketch update failed: {e}")
+
+    def state(self):
+        with self._lock:
+            return self.window, sketches_to_dict(self.sketches)
+
+    def rotate(self):
+        """Start a new window at the UTC day boundary; returns the finished (window, state) or None."""
+        today = self._today()
+        with self._lock:
+            if today == self.window:
+                return None
+            finished = (self.window, sketches_to_dict(self.sketches))
+            self.window = today
+            self.sketches = new_sketches()
+        return finished
+
+
+def snapshot(coll, monitor, worker=WORKER_ID):
+    """Upsert this worker's sketches (and the previous day's, after a rollover) to Mongo."""
+    windows = [monitor.rotate(), monitor.state()]
+    now = datetime.utcnow()
+    for item in windows:
+        if item is None:
+            continue
+        window, state = item
+        coll.replace_one(
+            {"_id": f"{worker}:{window}"},
+            {"worker": worker, "window": window, "updated_at": now, "sketches": state},
+            upsert=True,
+        )
+    metrics.inc("sketch_snapshots")
+
+
+def load_merged(coll, days=1):
+    """Merge every worker's sketches for the last `days` UTC days."""
+    since = (datetime.utcnow() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    merged = new_sketches()
+    workers = set()
+    for doc in coll.find({"window": {"$gte": since}}):
+        merge_sketches(merged, sketches_from_dict(doc.get("sketches", {})))
+        workers.add(doc.get("worker"))
+    return merged, sorted(workers)
+
+
+class SketchSnapshotter:
+    """Snapshots the monitor every `interval` seconds in a daemon thread."""
+
+    def __init__(self, coll, monitor, interval=SNAPSHOT_INTERVAL_S):
+        self.coll = coll
+        self.monitor = monitor
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="sketch-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and take a last snapshot."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            snapshot(self.coll, self.monitor)
+        except Exception as e:
+            print(f"Final sketch snapshot failed: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                snapshot(self.coll, self.monitor)
+            except Exception as e:
+                metrics.inc("sketch_snapshot_errors")
+                print(f"Sketch snapshot failed: {e}")
+
+
+monitor = DistributionMonitor()
@@ -0,0 +1,464 @@
+"""
+Distilled surrogate scorer for the USSD/SMS feature-phone channel.
+
+The surrogate is a lookup table on the logit of the calibrated model's pd:
+each numeric input is cut into quantile bins, each bin and each category has a
+learned offset, and a few feature pairs get a joint table on coarser bins:
+
+    logit(pd) = intercept + offsets of the row's bins / categories
+                          + offsets of the row's cells in the pair tables
+
+The pairs are not fixed: after a purely additive fit, the pairs whose joint
+bins explain the most residual variance are added and everything is refitted
+(ridge least squares, accumulated chunk by chunk) against the full model on
+generated feature-phone applicants. The result is stored as JSON, so serving
+needs neither pandas nor sklearn nor LightGBM: a single row is a few bisects
+and additions, a batch is a handful of NumPy searchsorted calls.
+
+Rows whose surrogate pd lands within `margin` (in logit units) of a tier
+boundary are handed to the full model instead. The margin is the smallest one
+for which the served tier (surrogate away from the boundaries, full model near
+them) matches the full model's on SURROGATE_TARGET_AGREEMENT of the validation
+rows; a tighter target buys agreement with fallbacks. The fit publishes
+max / mean / p99 pd error, raw tier agreement, fallback rate and the tier
+agreement of what is actually served, measured on a separate holdout.
+
+Usage:
+    python surrogate.py --fit --rows 200000
+    python surrogate.py --fit --bins 32 --pairs 8
+    python surrogate.py --report
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+from itertools import combinations
+
+import numpy as np
+
+from inference_utils import TIER_BINS, pd_to_alt_cibil
+
+SURROGATE_PATH = os.getenv("SURROGATE_PATH", "artifacts/surrogate.json")
+TARGET_AGREEMENT = float(os.getenv("SURROGATE_TARGET_AGREEMENT", "0.99"))
+CHANNEL_USER_TYPE = "feature_phone"
+NUMERIC = ["sms_count", "bill_on_time_ratio", "recharge_freq", "sim_tenure", "location_stability", "income_signal",
+           "coop_score", "land_verified", "psychometric_score", "loan_amount_requested"]
+CATEGORICAL = ["region", "age_group", "recharge_pattern", "loan_category"]
+MAX_BINS = 32
+PAIR_BINS = 8
+MAX_PAIRS = 6
+RIDGE = 1.0
+PD_CLIP = 1e-3
+BOUNDARIES = [hi for _, hi, _ in TIER_BINS[:-1]]
+TIERS = [tier for _, _, tier in TIER_BINS]
+LOGIT_BOUNDARIES = [math.log(b / (1 - b)) for b in BOUNDARIES]
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def _quantile_edges(values, bins):
+    return np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])).tolist()
+
+
+class _Coder:
+    """Maps one input to a cell index: a bin for numeric inputs, a level for categorical ones (-1 = unknown)."""
+
+    def __init__(self, feature, edges=None, categories=None, median=0.0):
+        self.feature = feature
+        self.edges = edges
+        self.categories = categories
+        self.median = median
+        self.size = len(edges) + 1 if edges is not None else len(categories)
+        self._index = {c: i for i, c in enumerate(categories or [])}
+        self._np_edges = np.asarray(edges) if edges is not None else None
+
+    def code(self, raw):
+        x = raw.get(self.feature)
+        if self.edges is None:
+            return self._index.get(x, -1)
+        if x is None or x != x:
+            x = self.median
+        return bisect_right(self.edges, x)
+
+    def codes(self, column):
+        if self.edges is None:
+            return np.array([self._index.get(v, -1) for v in column], dtype=np.int64)
+        x = np.asarray(column, dtype=float)
+        x = np.where(np.isnan(x), self.median, x)
+        return np.searchsorted(self._np_edges, x, side="right")
+
+
+class Surrogate:
+    def __init__(self, edges, numeric_tables, categorical_tables, intercept, medians, pairs=None, margin=0.0,
+                 model_version=None, metrics=None):
+        self.edges = edges                          # feature -> sorted inner bin edges
+        self.numeric_tables = numeric_tables        # feature -> offsets, len(edges) + 1
+        self.categorical_tables = categorical_tables  # feature -> {category: offset}
+        self.intercept = intercept
+        self.medians = medians                      # imputation for missing numeric inputs
+        # [{"features": [a, b], "edges" / "categories": {feature: ...}, "table": rows x cols offsets}]
+        self.pairs = pairs or []
+        self.margin = margin
+        self.model_version = model_version
+        self.metrics = metrics or {}
+        self._np_edges = {f: np.asarray(e) for f, e in edges.items()}
+        self._np_tables = {f: np.asarray(t) for f, t in numeric_tables.items()}
+        self._pair_coders = [
+            tuple(_Coder(f, p.get("edges", {}).get(f), p.get("categories", {}).get(f), medians.get(f, 0.0))
+                  for f in p["features"])
+            for p in self.pairs
+        ]
+        self._np_pair_tables = [np.asarray(p["table"]) for p in self.pairs]
+
+    # -------------------- SCORING --------------------
+    def logit(self, raw):
+        """Surrogate logit(pd) for one application dict."""
+        z = self.intercept
+        for f in NUMERIC:
+            x = raw.get(f)
+            if x is None or x != x:
+                x = self.medians[f]
+            z += self.numeric_tables[f][bisect_right(self.edges[f], x)]
+        for f in CATEGORICAL:
+            z += self.categorical_tables[f].get(raw.get(f), 0.0)
+        for (a, b), pair in zip(self._pair_coders, self.pairs):
+            i, j = a.code(raw), b.code(raw)
+            if i >= 0 and j >= 0:
+                z += pair["table"][i][j]
+        return z
+
+    def logit_batch(self, columns):
+        """Vectorised logit for a dict of column arrays (or a DataFrame)."""
+        n = len(columns[NUMERIC[0]])
+        z = np.full(n, self.intercept)
+        for f in NUMERIC:
+            x = np.asarray(columns[f], dtype=float)
+            x = np.where(np.isnan(x), self.medians[f], x)
+            z += self._np_tables[f][np.searchsorted(self._np_edges[f], x, side="right")]
+        for f in CATEGORICAL:
+            table = self.categorical_tables[f]
+            z += np.array([table.get(v, 0.0) for v in columns[f]])
+        for (a, b), table in zip(self._pair_coders, self._np_pair_tables):
+            i, j = a.codes(columns[a.feature]), b.codes(columns[b.feature])
+            known = (i >= 0) & (j >= 0)
+            z[known] += table[i[known], j[known]]
+        return z
+
+    def near_boundary(self, z):
+        return any(abs(z - b) < self.margin for b in LOGIT_BOUNDARIES)
+
+    def score(self, raw):
+        """(result, near_boundary). result has the channel's fields only: pd, alt_cibil_score, tier."""
+        z = self.logit(raw)
+        pd_value = _sigmoid(z)
+        return {
+            "pd": pd_value,
+            "alt_cibil_score": pd_to_alt_cibil(pd_value),
+            "tier": TIERS[bisect_right(BOUNDARIES, pd_value)],
+        }, self.near_boundary(z)
+
+    # -------------------- PERSISTENCE --------------------
+    def to_dict(self):
+        return {
+            "edges": self.edges,
+            "numeric_tables": self.numeric_tables,
+            "categorical_tables": self.categorical_tables,
+            "intercept": self.intercept,
+            "medians": self.medians,
+            "pairs": self.pairs,
+            "margin": self.margin,
+            "model_version": self.model_version,
+            "metrics": self.metrics,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["edges"], d["numeric_tables"], d["categorical_tables"], d["intercept"], d["medians"],
+                   d.get("pairs"), d.get("margin", 0.0), d.get("model_version"), d.get("metrics"))
+
+    def save(self, path=SURROGATE_PATH):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(tmp, path)
+
+
+def load_surrogate(path=SURROGATE_PATH):
+    """The stored surrogate, or None when it has not been fitted."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return Surrogate.from_dict(json.load(f))
+
+
+class ChannelScorer:
+    """The surrogate the API serves: loaded on first use, and only used while it matches the loaded model."""
+
+    def __init__(self, path=SURROGATE_PATH):
+        self.path = path
+        self._surrogate = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if not self._loaded:
+                try:
+                    self._surrogate = load_surrogate(self.path)
+                except Exception as e:
+                    print(f"Could not load surrogate from {self.path}: {e}")
+                self._loaded = True
+        return self._surrogate
+
+    def current(self, model_version):
+        """The surrogate, or None when there is none or it was fitted against another bundle."""
+        surrogate = self._surrogate if self._loaded else self._load()
+        if surrogate is None or surrogate.model_version != model_version:
+            return None
+        return surrogate
+
+    def reload(self):
+        with self._lock:
+            self._loaded = False
+        return self._load()
+
+    def status(self, model_version):
+        surrogate = self._surrogate if self._loaded else self._load()
+        if surrogate is None:
+            return {"status": "not_fitted", "path": self.path}
+        return {
+            "status": "active" if surrogate.model_version == model_version else "stale",
+            "path": self.path,
+            "model_version": surrogate.model_version,
+            "serving_model_version": model_version,
+            "margin": surrogate.margin,
+            "pairs": [p["features"] for p in surrogate.pairs],
+            "metrics": surrogate.metrics,
+        }
+
+
+# -------------------- FITTING --------------------
+def channel_applicants(n, seed):
+    """n generated feature-phone applicants (the generator draws both user types)."""
+    from data_generator import iter_applicant_batches
+
+    parts, have = [], 0
+    for df in iter_applicant_batches(n * 4, batch_size=max(n, 10_000), seed=seed):
+        df = df[df["user_type"] == CHANNEL_USER_TYPE]
+        parts.append(df)
+        have += len(df)
+        if have >= n:
+            break
+    import pandas as pd
+    return pd.concat(parts, ignore_index=True).iloc[:n]
+
+
+def full_model_logits(model, df, chunk=20_000):
+    pds = []
+    for start in range(0, len(df), chunk):
+        results = model.infer_batch(df.iloc[start:start + chunk], explain=False, track=False)
+        pds.extend(r["pd"] for r in results)
+    # Isotonic calibration returns exact 0/1 for some rows; unclipped, their logits would dominate the fit
+    p = np.clip(np.asarray(pds), PD_CLIP, 1 - PD_CLIP)
+    return np.log(p / (1 - p))
+
+
+class _Design:
+    """Column layout of the one-hot design matrix: intercept, main-effect cells, pair cells."""
+
+    def __init__(self, main, pairs=()):
+        self.main = main                    # [(feature, codes, size)]
+        self.pairs = pairs                  # [(codes_a, size_a, codes_b, size_b)]
+        self.offsets = []
+        col = 1
+        for _, codes, size in main:
+            self.offsets.append(col)
+            col += size
+        for _, size_a, _, size_b in pairs:
+            self.offsets.append(col)
+            col += size_a * size_b
+        self.width = col
+
+    def matrix(self, rows):
+        X = np.zeros((rows.stop - rows.start, self.width))
+        X[:, 0] = 1.0
+        index = np.arange(len(X))
+        blocks = [(codes[rows], None, None) for _, codes, _ in self.main]
+        blocks += [(a[rows], b[rows], size_b) for a, _, b, size_b in self.pairs]
+        for offset, (a, b, size_b) in zip(self.offsets, blocks):
+            known = a >= 0 if b is None else (a >= 0) & (b >= 0)
+            cell = a if b is None else a * size_b + b
+            X[index[known], offset + cell[known]] = 1.0
+        return X
+
+    def solve(self, y, ridge, chunk):
+        # Normal equations accumulated per chunk: memory is chunk x width, not rows x width
+        xtx = np.zeros((self.width, self.width))
+        xty = np.zeros(self.width)
+        for start in range(0, len(y), chunk):
+            rows = slice(start, min(start + chunk, len(y)))
+            X = self.matrix(rows)
+            xtx += X.T @ X
+            xty += X.T @ y[rows]
+        penalty = ridge * np.eye(self.width)
+        penalty[0, 0] = 0.0
+        return np.linalg.solve(xtx + penalty, xty)
+
+    def predict(self, coef, n, chunk):
+        return np.concatenate([self.matrix(slice(s, min(s + chunk, n))) @ coef for s in range(0, n, chunk)])
+
+
+def screen_pairs(coarse, residual, max_pairs):
+    """Feature pairs whose joint cells explain the most residual variance, best first."""
+    gains = []
+    for (fa, (a, size_a)), (fb, (b, size_b)) in combinations(coarse.items(), 2):
+        known = (a >= 0) & (b >= 0)
+        cell = a[known] * size_b + b[known]
+        sums = np.bincount(cell, weights=residual[known], minlength=size_a * size_b)
+        counts = np.bincount(cell, minlength=size_a * size_b)
+        gain = float(np.sum(sums[counts > 0] ** 2 / counts[counts > 0]))
+        gains.append((gain, fa, fb))
+    gains.sort(reverse=True)
+    return [(fa, fb) for _, fa, fb in gains[:max_pairs]]
+
+
+def choose_margin(z_surrogate, z_full, target=TARGET_AGREEMENT):
+    """Smallest logit margin around the tier boundaries for which the served tiers agree on >= target of rows."""
+    tiers_s = np.searchsorted(LOGIT_BOUNDARIES, z_surrogate, side="right")
+    tiers_f = np.searchsorted(LOGIT_BOUNDARIES, z_full, side="right")
+    distance = np.min(np.abs(z_surrogate[:, None] - np.asarray(LOGIT_BOUNDARIES)[None, :]), axis=1)
+    for margin in np.linspace(0.0, 2.0, 201):
+        # Rows inside the margin go to the full model, so only the rest can disagree
+        if 1.0 - np.mean((distance >= margin) & (tiers_s != tiers_f)) >= target:
+            return float(margin)
+    return 2.0
+
+
+def evaluate(surrogate, df, z_full):
+    """Accuracy and latency of the surrogate against the full model on `df`."""
+    z = surrogate.logit_batch({c: df[c].to_numpy() for c in NUMERIC + CATEGORICAL})
+    pd_s, pd_f = 1 / (1 + np.exp(-z)), 1 / (1 + np.exp(-z_full))
+    err = np.abs(pd_s - pd_f)
+    tiers_s = np.searchsorted(BOUNDARIES, pd_s, side="right")
+    tiers_f = np.searchsorted(BOUNDARIES, pd_f, side="right")
+    fallback = np.min(np.abs(z[:, None] - np.asarray(LOGIT_BOUNDARIES)[None, :]), axis=1) < surrogate.margin
+    served = np.where(fallback, tiers_f, tiers_s)
+
+    records = df[NUMERIC + CATEGORICAL].head(2000).to_dict("records")
+    t0 = time.perf_counter()
+    for rec in records:
+        surrogate.score(rec)
+    per_row_us = (time.perf_counter() - t0) / len(records) * 1e6
+    return {
+        "rows": int(len(df)),
+        "pd_max_error": float(err.max()),
+        "pd_mean_error": float(err.mean()),
+        "pd_p99_error": float(np.quantile(err, 0.99)),
+        "tier_agreement": float((tiers_s == tiers_f).mean()),
+        "fallback_rate": float(fallback.mean()),
+        "served_tier_agreement": float((served == tiers_f).mean()),
+        "served_pd_max_error": float(err[~fallback].max()) if (~fallback).any() else 0.0,
+        "mean_latency_us": per_row_us,
+    }
+
+
+def fit(model, rows=200_000, seed=42, max_bins=MAX_BINS, max_pairs=MAX_PAIRS, ridge=RIDGE, chunk=20_000,
+        target=TARGET_AGREEMENT):
+    """Distil `model` (a ready ModelRuntime) into a Surrogate with published error metrics."""
+    t0 = time.perf_counter()
+    train = channel_applicants(rows, seed)
+    holdout = channel_applicants(max(rows // 4, 10_000), seed + 1)
+    validation, test = holdout.iloc[: len(holdout) // 2], holdout.iloc[len(holdout) // 2:]
+    y = full_model_logits(model, train, chunk)
+
+    medians = {f: float(train[f].median()) for f in NUMERIC}
+    edges = {f: _quantile_edges(train[f].fillna(medians[f]).to_numpy(dtype=float), max_bins) for f in NUMERIC}
+    categories = {f: sorted(train[f].dropna().unique().tolist()) for f in CATEGORICAL}
+    fine = {f: _Coder(f, edges=edges[f], median=medians[f]) for f in NUMERIC}
+    fine.update({f: _Coder(f, categories=categories[f]) for f in CATEGORICAL})
+    coarse = {f: _Coder(f, edges=_quantile_edges(train[f].fillna(medians[f]).to_numpy(dtype=float), PAIR_BINS),
+                        median=medians[f]) for f in NUMERIC}
+    coarse.update({f: fine[f] for f in CATEGORICAL})
+    main = [(f, fine[f].codes(train[f]), fine[f].size) for f in NUMERIC + CATEGORICAL]
+
+    # Additive fit first; its residuals pick the pairs worth a joint table
+    chosen = []
+    if max_pairs > 0:
+        additive = _Design(main)
+        residual = y - additive.predict(additive.solve(y, ridge, chunk), len(y), chunk)
+        coarse_codes = {f: (c.codes(train[f]), c.size) for f, c in coarse.items()}
+        chosen = screen_pairs(coarse_codes, residual, max_pairs)
+    pair_codes = [(coarse[a].codes(train[a]), coarse[a].size, coarse[b].codes(train[b]), coarse[b].size)
+                  for a, b in chosen]
+    design = _Design(main, pair_codes)
+    coef = design.solve(y, ridge, chunk)
+
+    tables = {f: coef[o:o + size] for (f, _, size), o in zip(main, design.offsets)}
+    pairs = []
+    for (a, b), o in zip(chosen, design.offsets[len(main):]):
+        size_a, size_b = coarse[a].size, coarse[b].size
+        pairs.append({
+            "features": [a, b],
+            "edges": {f: coarse[f].edges for f in (a, b) if f in NUMERIC},
+            "categories": {f: coarse[f].categories for f in (a, b) if f in CATEGORICAL},
+            "table": coef[o:o + size_a * size_b].reshape(size_a, size_b).tolist(),
+        })
+    surrogate = Surrogate(
+        edges=edges,
+        numeric_tables={f: tables[f].tolist() for f in NUMERIC},
+        categorical_tables={f: {c: float(tables[f][i]) for i, c in enumerate(categories[f])} for f in CATEGORICAL},
+        intercept=float(coef[0]),
+        medians=medians,
+        pairs=pairs,
+        model_version=model.model_version,
+    )
+    z_val = surrogate.logit_batch({c: validation[c].to_numpy() for c in NUMERIC + CATEGORICAL})
+    surrogate.margin = choose_margin(z_val, full_model_logits(model, validation, chunk), target)
+    surrogate.metrics = {
+        **evaluate(surrogate, test, full_model_logits(model, test, chunk)),
+        "margin": surrogate.margin,
+        "target_agreement": target,
+        "pairs": [f"{a}x{b}" for a, b in chosen],
+        "train_rows": int(len(train)),
+        "fitted_at": datetime.utcnow().isoformat(),
+        "fit_s": round(time.perf_counter() - t0, 3),
+    }
+    return surrogate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit or inspect the feature-phone surrogate scorer")
+    parser.add_argument("--fit", action="store_true")
+    parser.add_argument("--report", action="store_true", help="print the stored surrogate's metrics")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bins", type=int, default=MAX_BINS)
+    parser.add_argument("--pairs", type=int, default=MAX_PAIRS, help="joint tables for the strongest feature pairs")
+    parser.add_argument("--target-agreement", type=float, default=TARGET_AGREEMENT)
+    parser.add_argument("--path", default=SURROGATE_PATH)
+    args = parser.parse_args()
+
+    if args.fit:
+        from model_runtime import ModelRuntime
+        model = ModelRuntime(warmup_rows=0, check_mongo=False)
+        model.start(background=False)
+        if not model.ready:
+            raise SystemExit(f"Model failed to load: {model.error}")
+        surrogate = fit(model, args.rows, args.seed, args.bins, args.pairs, target=args.target_agreement)
+        surrogate.save(args.path)
+        print(f"Surrogate written to {args.path}")
+    else:
+        surrogate = load_surrogate(args.path)
+        if surrogate is None:
+            raise SystemExit(f"No surrogate at {args.path}; run with --fit")
+    print(json.dumps(surrogate.metrics, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import mongomock
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mongo():
+    return mongomock.MongoClient()["bharatscore"]
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from archive import archive_applications, archived_applications, compact, iter_archived_chunks, list_parts, merge_tiers
+
+CUTOFF = datetime(2025, 3, 1)
+
+
+def application(user, status="approved", month=1, **extra):
+    return {"clerk_user_id": user, "created": datetime(2025, month, 10), "status": status,
+            "raw": {"region": "urban", "loan_amount_requested": 1000.0}, **extra}
+
+
+def test_closed_applications_move_to_the_archive(mongo, tmp_path):
+    mongo.users.insert_many([
+        application("u1"),
+        application("u1", status="rejected", month=2),
+        application("u1", status="pending"),
+        application("u1", month=4),
+        application("u2", profile={"name": "Asha"}),
+        application("u3", psychometric_score=72),
+    ])
+    stats = archive_applications(mongo.users, root=str(tmp_path), cutoff=CUTOFF)
+    assert stats["archived"] == 2 and stats["months"] == ["2025-01", "2025-02"]
+    # Open, recent, and profile / psychometric holders stay hot
+    assert sorted(d["clerk_user_id"] for d in mongo.users.find()) == ["u1", "u1", "u2", "u3"]
+
+    archived = archived_applications("u1", root=str(tmp_path))
+    assert sorted(d["status"] for d in archived) == ["approved", "rejected"]
+    assert archived[0]["created"].year == 2025
+
+
+def test_hot_copy_wins_and_each_application_is_read_once(mongo, tmp_path):
+    doc = application("u1")
+    mongo.users.insert_one(doc)
+    archive_applications(mongo.users, root=str(tmp_path), cutoff=CUTOFF)
+    # An interrupted run: the same application archived again and still in the hot tier
+    mongo.users.insert_one(doc)
+    archive_applications(mongo.users, root=str(tmp_path), cutoff=CUTOFF)
+    mongo.users.insert_one({**doc, "status": "approved", "admin_remarks": "hot copy"})
+    assert len(list_parts(str(tmp_path))["2025-01"]) == 2
+
+    hot = list(mongo.users.find({"clerk_user_id": "u1"}))
+    merged = merge_tiers(hot, archived_applications("u1", root=str(tmp_path)))
+    assert [d.get("admin_remarks") for d in merged] == ["hot copy"]
+
+    assert sum(len(c) for c in iter_archived_chunks(str(tmp_path))) == 1
+    assert sum(len(c) for c in iter_archived_chunks(str(tmp_path), hot_coll=mongo.users)) == 0
+
+    compact(str(tmp_path))
+    assert len(list_parts(str(tmp_path))["2025-01"]) == 1
+    assert len(archived_applications("u1", root=str(tmp_path))) == 1
+
+
+def test_export_query_filters_archived_rows(mongo, tmp_path):
+    mongo.users.insert_many([application("u1"), application("u2", status="rejected", month=2)])
+    archive_applications(mongo.users, root=str(tmp_path), cutoff=CUTOFF)
+    rows = [row for chunk in iter_archived_chunks(str(tmp_path), {"status": {"$in": ["rejected"]}}) for row in chunk]
+    assert [row["clerk_user_id"] for row in rows] == ["u2"]
+    rows = [row for chunk in iter_archived_chunks(str(tmp_path), {"created": {"$lt": datetime(2025, 2, 1)}})
+            for row in chunk]
+    assert [row["clerk_user_id"] for row in rows] == ["u1"]
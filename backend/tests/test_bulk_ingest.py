@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+
+from bulk_ingest import BulkIngestor
+from feature_store import FEATURES_FIELD
+
+ROW = {
+    "clerk_user_id": "user-1", "user_type": "smartphone", "region": "urban", "sms_count": 25,
+    "bill_on_time_ratio": 0.9, "recharge_freq": 3, "sim_tenure": 12, "location_stability": 0.8,
+    "income_signal": 0.7, "coop_score": 0.6, "land_verified": 1, "age_group": "25-35",
+    "loan_amount_requested": 50000, "recharge_pattern": "monthly", "loan_category": "personal",
+    "psychometric_score": 70,
+}
+
+
+def ingest(coll, lines, **kwargs):
+    ingestor = BulkIngestor(coll, **kwargs)
+    for line in lines:
+        if ingestor.add_line(line):
+            ingestor.flush()
+    return ingestor.finish()
+
+
+def csv_lines(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(ROW), lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue().splitlines(keepends=True)
+
+
+def test_invalid_rows_are_reported_and_the_rest_inserted(mongo):
+    rows = [
+        ROW,
+        {**ROW, "clerk_user_id": "user-2", "sms_count": "many"},
+        {**ROW, "clerk_user_id": "user-3", "land_verified": 1.5},
+        {k: v for k, v in ROW.items() if k != "region"},
+        {**ROW, "clerk_user_id": "user-5", "bill_on_time_ratio": None, "consent": "maybe"},
+    ]
+    lines = [json.dumps(r) + "\n" for r in rows] + ["not json\n", "[1, 2]\n", "\n"]
+    summary = ingest(mongo.users, lines, batch_size=2)
+
+    assert summary["received"] == 7 and summary["inserted"] == 1 and summary["failed"] == 6
+    errors = {e["row"]: e["errors"] for e in summary["errors"]}
+    assert errors[2] == ["sms_count: not a valid number"]
+    assert errors[3] == ["land_verified: not a valid integer"]
+    assert errors[4] == ["region: field required"]
+    assert errors[5] == ["consent: not a valid boolean"]
+    assert errors[6][0].startswith("invalid JSON") and errors[7] == ["expected a JSON object"]
+    doc = mongo.users.find_one()
+    assert doc["status"] == "received" and doc["raw"]["sms_count"] == 25.0 and doc["raw"]["consent"] is True
+
+
+def test_csv_quoted_fields_may_span_lines(mongo):
+    lines = csv_lines([{**ROW, "region": "rural,\nnorth \"east\""}, {**ROW, "clerk_user_id": "user-2"}])
+    assert len(lines) == 4
+    summary = ingest(mongo.users, lines, fmt="csv")
+    assert summary["inserted"] == 2 and summary["failed"] == 0
+    assert mongo.users.find_one({"clerk_user_id": "user-1"})["raw"]["region"] == "rural,\nnorth \"east\""
+
+
+def test_csv_unterminated_quote_is_an_error(mongo):
+    lines = csv_lines([ROW]) + ['user-2,"smartphone\n']
+    summary = ingest(mongo.users, lines, fmt="csv")
+    assert summary["inserted"] == 1
+    assert summary["errors"] == [{"row": 2, "errors": ["unterminated quoted field"]}]
+
+
+def test_encoded_vectors_and_inserted_documents(mongo):
+    inserted = []
+    summary = ingest(mongo.users, [json.dumps(ROW)], encoder=lambda raws: [b"vector"] * len(raws),
+                     on_insert=inserted.extend)
+    assert summary["inserted"] == 1
+    assert mongo.users.find_one()[FEATURES_FIELD] == b"vector"
+    assert [d["clerk_user_id"] for d in inserted] == ["user-1"]
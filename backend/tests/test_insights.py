@@ -0,0 +1,88 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from insights import claim_precompute, insight_version, precompute_insights
+from rollups import RollupBuffer, query_portfolio
+from schemas import InputData
+
+
+class FakeStore:
+    def matrix(self, docs):
+        return np.zeros((len(docs), 1), dtype=np.float32), {}
+
+
+class FakeModel:
+    """Scores every application the same; `gate` holds infer_encoded until released."""
+
+    def __init__(self, model_version="m1", gate=None):
+        self.model_version = model_version
+        self.feature_store = FakeStore()
+        self.gate = gate
+        self.calls = 0
+        self.inferring = threading.Event()
+
+    def infer_encoded(self, X, raws, track=True, **kwargs):
+        self.calls += 1
+        self.inferring.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        return [{"pd": 0.2, "tier": "Low", "decision": "Approved", "eligible_amount": 5000} for _ in raws]
+
+
+def pending_application(i):
+    raw = {field: 1 for field in InputData.model_fields}
+    raw.update({"region": "urban", "loan_category": "personal", "loan_amount_requested": 1000.0})
+    return {"clerk_user_id": f"user-{i}", "created": datetime(2025, 1, 1), "status": "received", "raw": raw}
+
+
+def seeded(mongo, n=5):
+    rollup = RollupBuffer(mongo.portfolio_rollups)
+    docs = [pending_application(i) for i in range(n)]
+    mongo.users.insert_many(docs)
+    rollup.record_many(docs)
+    return rollup
+
+
+def test_current_insights_are_skipped(mongo):
+    rollup = seeded(mongo)
+    model = FakeModel()
+    first = precompute_insights(mongo.users, model, max_per_second=0, on_update=rollup.record)
+    assert first["processed"] == 5
+    assert mongo.users.count_documents({"ai_insight_version": insight_version("m1")}) == 5
+
+    second = precompute_insights(mongo.users, model, max_per_second=0, on_update=rollup.record)
+    assert second["pending"] == 0 and model.calls == 1
+    assert query_portfolio(mongo.portfolio_rollups)["overall"]["scored"] == 5
+
+    # A new model version makes every stored insight stale again, without counting them twice
+    third = precompute_insights(mongo.users, FakeModel("m2"), max_per_second=0, on_update=rollup.record)
+    assert third["processed"] == 5
+    assert query_portfolio(mongo.portfolio_rollups)["overall"]["scored"] == 5
+
+
+def test_overlapping_runs_count_each_application_once(mongo):
+    rollup = seeded(mongo)
+    gate = threading.Event()
+    slow = FakeModel(gate=gate)
+    summaries = []
+    run = threading.Thread(target=lambda: summaries.append(
+        precompute_insights(mongo.users, slow, max_per_second=0, on_update=rollup.record)))
+    run.start()
+    assert slow.inferring.wait(5)
+    # A second worker scores the same applications while the first is still inferring
+    fast = precompute_insights(mongo.users, FakeModel(), max_per_second=0, on_update=rollup.record)
+    gate.set()
+    run.join(5)
+
+    assert fast["processed"] == 5
+    assert summaries[0]["processed"] == 0 and summaries[0]["superseded"] == 5
+    assert query_portfolio(mongo.portfolio_rollups)["overall"]["scored"] == 5
+
+
+def test_only_one_worker_holds_the_lease(mongo):
+    assert claim_precompute(mongo.job_leases, 60)
+    assert not claim_precompute(mongo.job_leases, 60)
+    mongo.job_leases.update_one({"_id": "insight_precompute"}, {"$set": {"until": datetime(2000, 1, 1)}})
+    assert claim_precompute(mongo.job_leases, 60)
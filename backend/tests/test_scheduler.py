@@ -0,0 +1,28 @@
+import asyncio
+import threading
+
+from scheduler import Scheduler, current_priority, scheduler
+
+
+def test_threads_not_started_by_the_scheduler_rank_last():
+    seen = []
+    worker = threading.Thread(target=lambda: seen.append(current_priority()))
+    worker.start()
+    worker.join()
+    assert seen == [scheduler.background_priority]
+    assert scheduler.background_priority > max(cls.priority for cls in scheduler.classes.values())
+
+
+def test_calls_run_with_their_class_priority_and_reset_after():
+    sched = Scheduler({"interactive": (1, 4, 5.0, 0), "admin": (1, 4, 5.0, 3)}, enabled=True)
+
+    async def run():
+        admin = await sched.call("admin", current_priority)
+        resumed = await sched.call("admin", current_priority, admitted=True)
+        interactive = await sched.classes["interactive"].run(current_priority)
+        return admin, resumed, interactive
+
+    assert asyncio.run(run()) == (3, 3, 0)
+    assert sched.background_priority == 4
+    # The worker thread is back to background priority outside of a call
+    assert sched.classes["admin"].executor.submit(current_priority).result() == scheduler.background_priority
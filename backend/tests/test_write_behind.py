@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from write_behind import WriteBehindBuffer
+
+
+class BlockingColl:
+    """Collection whose bulk_write waits until released, to look at the buffer mid-flush."""
+
+    def __init__(self, coll, fail=False):
+        self.coll = coll
+        self.fail = fail
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def bulk_write(self, ops, ordered=True):
+        self.writing.set()
+        self.release.wait(5)
+        if self.fail:
+            raise AutoReconnect("mongo unavailable")
+        return self.coll.bulk_write(ops, ordered=ordered)
+
+
+@pytest.fixture
+def users(mongo):
+    mongo.users.insert_one({"_id": 1, "status": "received"})
+    return mongo.users
+
+
+def started(buffer):
+    # A non-None thread keeps set() from writing through; flushes are driven by the test
+    buffer._thread = threading.current_thread()
+    return buffer
+
+
+def test_writes_to_the_same_document_are_merged(users):
+    buffer = started(WriteBehindBuffer(users))
+    buffer.set(1, {"model_output": {"score": 1}})
+    buffer.set(1, {"prediction": 0})
+    assert buffer.overlay({"_id": 1, "status": "received"}) == {
+        "_id": 1, "status": "received", "model_output": {"score": 1}, "prediction": 0}
+    assert buffer.flush() == 1
+    assert users.find_one({"_id": 1}) == {"_id": 1, "status": "received", "model_output": {"score": 1}, "prediction": 0}
+    assert buffer.overlay({"_id": 1}) == {"_id": 1}
+
+
+def test_write_through_without_a_flusher_thread(users):
+    WriteBehindBuffer(users).set(1, {"prediction": 1})
+    assert users.find_one({"_id": 1})["prediction"] == 1
+
+
+def test_batch_stays_visible_while_it_is_written(users):
+    coll = BlockingColl(users)
+    buffer = started(WriteBehindBuffer(coll))
+    buffer.set(1, {"model_output": {"score": 1}})
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert coll.writing.wait(5)
+    # Mongo still has the old document; the in-flight batch must still be applied
+    stored = users.find_one({"_id": 1})
+    assert "model_output" not in stored
+    assert buffer.overlay(stored)["model_output"] == {"score": 1}
+    # A write made during the flush wins over the in-flight value
+    buffer.set(1, {"model_output": {"score": 2}})
+    assert buffer.overlay(stored)["model_output"] == {"score": 2}
+    coll.release.set()
+    flusher.join(5)
+    assert buffer.overlay({"_id": 1}) == {"_id": 1, "model_output": {"score": 2}}
+    assert users.find_one({"_id": 1})["model_output"] == {"score": 1}
+
+
+def test_failed_flush_requeues_without_overwriting_newer_writes(users):
+    coll = BlockingColl(users, fail=True)
+    buffer = started(WriteBehindBuffer(coll))
+    buffer.set(1, {"model_output": {"score": 1}, "prediction": 0})
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert coll.writing.wait(5)
+    buffer.set(1, {"prediction": 1})
+    coll.release.set()
+    flusher.join(5)
+    assert buffer.overlay({"_id": 1}) == {"_id": 1, "model_output": {"score": 1}, "prediction": 1}
+
+    coll.fail = False
+    assert buffer.flush() == 1
+    assert users.find_one({"_id": 1}) == {"_id": 1, "status": "received", "model_output": {"score": 1}, "prediction": 1}
+    assert buffer.overlay({"_id": 1}) == {"_id": 1}
@@ -0,0 +1,112 @@
+"""
+"What-if" score simulation for one applicant.
+
+A sweep spec gives values for a few adjustable inputs (bill_on_time_ratio,
+psychometric_score, coop_score, loan_amount_requested). The variants are built
+as one DataFrame and scored in a single infer_batch pass without SHAP:
+  - curves: one feature varied at a time, everything else at the base values
+  - grid:   the full cartesian product, when more than one feature is swept
+Grids are capped at WHATIF_MAX_POINTS rows.
+"""
+import os
+
+import numpy as np
+
+# feature: (min, max) allowed in a sweep
+SWEEPABLE = {
+    "bill_on_time_ratio": (0.0, 1.0),
+    "psychometric_score": (0.0, 1.0),
+    "coop_score": (0.0, 100.0),
+    "loan_amount_requested": (1000.0, 5_000_000.0),
+}
+MAX_STEPS = 101
+MAX_POINTS = int(os.getenv("WHATIF_MAX_POINTS", "1000"))
+OUTPUTS = ("pd", "alt_cibil_score", "tier", "eligible_amount", "decision")
+
+
+class SweepError(ValueError):
+    pass
+
+
+def sweep_values(feature, spec):
+    """Values to try for one feature, validated against SWEEPABLE."""
+    if feature not in SWEEPABLE:
+        raise SweepError(f"Cannot sweep '{feature}'. Allowed: {sorted(SWEEPABLE)}")
+    lo, hi = SWEEPABLE[feature]
+    if spec.values is not None:
+        values = np.asarray(spec.values, dtype=float)
+    else:
+        start = lo if spec.start is None else spec.start
+        stop = hi if spec.stop is None else spec.stop
+        if not 2 <= spec.steps <= MAX_STEPS:
+            raise SweepError(f"steps for '{feature}' must be between 2 and {MAX_STEPS}")
+        values = np.linspace(start, stop, spec.steps)
+    if not 1 <= len(values) <= MAX_STEPS:
+        raise SweepError(f"'{feature}' needs between 1 and {MAX_STEPS} values")
+    if values.min() < lo or values.max() > hi:
+        raise SweepError(f"'{feature}' values must be within [{lo}, {hi}]")
+    return values
+
+
+def build_variants(base, axes):
+    """
+    One DataFrame holding the base row, the one-at-a-time curves and (for 2+
+    features) the full grid. Returns (frame, curve slices, grid slice).
+    """
+    import pandas as pd
+
+    features = list(axes)
+    curve_rows = sum(len(v) for v in axes.values())
+    grid_shape = [len(axes[f]) for f in features]
+    grid_rows = int(np.prod(grid_shape)) if len(features) > 1 else 0
+    total = 1 + curve_rows + grid_rows
+    if total > MAX_POINTS:
+        raise SweepError(f"Sweep needs {total} points; the limit is {MAX_POINTS}")
+
+    columns = {k: np.full(total, v, dtype=object if isinstance(v, str) else float) for k, v in base.items()}
+    curves = {}
+    row = 1
+    for feature in features:
+        n = len(axes[feature])
+        columns[feature][row:row + n] = axes[feature]
+        curves[feature] = slice(row, row + n)
+        row += n
+    grid = None
+    if grid_rows:
+        mesh = np.meshgrid(*[axes[f] for f in features], indexing="ij")
+        for feature, values in zip(features, mesh):
+            columns[feature][row:row + grid_rows] = values.ravel()
+        grid = slice(row, row + grid_rows)
+    return pd.DataFrame(columns), curves, grid
+
+
+def _columns(results):
+    return {key: [r[key] for r in results] for key in OUTPUTS}
+
+
+def simulate(model, base, sweeps):
+    """Score the base application and every variant in one batched pass."""
+    axes = {feature: sweep_values(feature, spec) for feature, spec in sweeps.items()}
+    if not axes:
+        raise SweepError("At least one sweep is required")
+    df, curves, grid = build_variants(base, axes)
+    # Simulated variants are not real traffic: no SHAP, no drift sketches
+    results = model.infer_batch(df, explain=False, track=False)
+
+    base_result = {key: results[0][key] for key in OUTPUTS}
+    response = {
+        "base": base_result,
+        "points": len(results),
+        "curves": {
+            feature: {"values": axes[feature].tolist(), **_columns(results[curves[feature]])}
+            for feature in axes
+        },
+    }
+    if grid is not None:
+        response["grid"] = {
+            "features": list(axes),
+            "shape": [len(axes[f]) for f in axes],
+            "axes": {f: axes[f].tolist() for f in axes},
+            **_columns(results[grid]),
+        }
+    return response
@@ -0,0 +1,121 @@
+"""
+Write-behind buffer for derived fields (model_output, prediction, ai_insight).
+
+Request handlers call `buffer.set(_id, fields)` instead of update_one. Repeated
+writes to the same document are merged into one $set, and the buffer is
+flushed as a single unordered bulk_write every WRITE_BEHIND_INTERVAL seconds
+or as soon as WRITE_BEHIND_MAX_PENDING documents are waiting. stop() flushes
+whatever is left, so nothing buffered is lost on a clean shutdown. A batch
+being written stays visible to overlay() until the write commits or the batch
+is requeued, so reads never fall back to the values Mongo is replacing.
+
+Only use it for values that can be recomputed: a crash loses at most one
+interval of writes.
+"""
+import os
+import threading
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from metrics import metrics
+
+WRITE_BEHIND_INTERVAL_S = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "500"))
+
+
+class WriteBehindBuffer:
+    def __init__(self, coll, interval=WRITE_BEHIND_INTERVAL_S, max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.coll = coll
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._inflight = {}   # batch of the flush in progress, until it commits or is requeued
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set(self, _id, fields):
+        """Queue a $set of `fields` on document `_id`, merged with any pending write."""
+        with self._lock:
+            self._pending.setdefault(_id, {}).update(fields)
+            depth = len(self._pending)
+        metrics.inc("write_behind_writes")
+        metrics.set("write_behind_depth", depth)
+        if self._thread is None:
+            # Not running in the background (CLI, scripts): write through
+            self.flush()
+        elif depth >= self.max_pending:
+            self._wake.set()
+
+    def overlay(self, doc):
+        """Apply writes still waiting in the buffer, or being flushed, to a document read from Mongo."""
+        _id = doc.get("_id")
+        with self._lock:
+            for batch in (self._inflight, self._pending):
+                fields = batch.get(_id)
+                if fields:
+                    doc = {**doc, **fields}
+        return doc
+
+    def flush(self):
+        """Write everything pending as one unordered bulk_write. Returns the number of documents."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            metrics.set("write_behind_depth", 0)
+            if not batch:
+                return 0
+            ops = [UpdateOne({"_id": _id}, {"$set": fields}) for _id, fields in batch.items()]
+            t0 = time.perf_counter()
+            try:
+                self.coll.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                with self._lock:
+                    self._inflight = {}
+                failed = len(e.details.get("writeErrors", []))
+                metrics.inc("write_behind_failed", failed)
+                print(f"Write-behind flush: {failed}/{len(ops)} updates failed")
+            except Exception as e:
+                # Mongo unavailable: put the batch back without overwriting newer writes
+                with self._lock:
+                    for _id, fields in batch.items():
+                        self._pending[_id] = {**fields, **self._pending.get(_id, {})}
+                    self._inflight = {}
+                    depth = len(self._pending)
+                metrics.inc("write_behind_errors")
+                metrics.set("write_behind_depth", depth)
+                print(f"Write-behind flush failed, {len(batch)} updates requeued: {e}")
+                return 0
+            with self._lock:
+                self._inflight = {}
+            metrics.observe("write_behind_flush", time.perf_counter() - t0)
+            metrics.inc("write_behind_flushed", len(ops))
+            return len(ops)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write out everything still buffered."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        flushed = self.flush()
+        if flushed:
+            print(f"Write-behind: flushed {flushed} pending updates on shutdown")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { useUser, UserButton } from "@clerk/clerk-react";
 import { useNavigate } from "react-router-dom";
 import { Bell, CheckCircle, XCircle, AlertTriangle, Clock, RefreshCw } from "lucide-react";
@@ -29,6 +29,7 @@ interface PsychometricStatus {
 }
 
 interface Notification {
+  id: string;
   message: string;
   timestamp: string;
   read: boolean;
@@ -37,6 +38,13 @@ interface Notification {
   admin_remarks: string;
 }
 
+interface NotificationPage {
+  notifications: Notification[];
+  next_cursor: string | null;
+}
+
+const NOTIFICATION_PAGE_SIZE = 20;
+
 const Dashboard = () => {
   const { user } = useUser();
   const navigate = useNavigate();
@@ -48,6 +56,10 @@ const Dashboard = () => {
   });
   const [notifications, setNotifications] = useState<Notification[]>([]);
   const [unreadCount, setUnreadCount] = useState(0);
+  // Cursor of the next older page; older pages are only loaded when the user asks
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const olderLoaded = useRef(false);
   const [showNotifications, setShowNotifications] = useState(false);
   const [lastFetchTime, setLastFetchTime] = useState<number>(Date.now());
 
@@ -62,58 +74,77 @@ const Dashboard = () => {
   const [finalTier, setFinalTier] = useState<string | null>(null);
   const [loanCount, setLoanCount] = useState<number | null>(null);
 
+  const fetchNotificationPage = async (before: string | null): Promise<NotificationPage> => {
+    const params = new URLSearchParams({
+      clerk_user_id: user!.id,
+      limit: String(NOTIFICATION_PAGE_SIZE),
+    });
+    if (before) params.set("before", before);
+    const res = await fetch(
+      `http://127.0.0.1:8000/user/notifications?${params}`,
+      {
+        method: 'GET',
+        headers: {
+          'Content-Type': 'application/json',
+        }
+      }
+    );
+
+    if (!res.ok) {
+      throw new Error(`HTTP ${res.status}: ${res.statusText}`);
+    }
+
+    const page = await res.json();
+    if (page.error) {
+      console.error("API Error:", page.error);
+      throw new Error(page.error);
+    }
+    return { notifications: page.notifications || [], next_cursor: page.next_cursor };
+  };
+
   // FIXED: Improved error handling for notifications
   const fetchNotifications = async () => {
     if (!user) return;
     
     try {
       setError(""); // Clear previous errors
-      const res = await fetch(
-        `http://127.0.0.1:8000/user/notifications?clerk_user_id=${user.id}`,
-        {
-          method: 'GET',
-          headers: {
-            'Content-Type': 'application/json',
-          }
-        }
+      // Polls only fetch the newest page; older pages are loaded on request
+      const page = await fetchNotificationPage(null);
+
+      // Badge count comes from the server, not from the loaded list
+      const countRes = await fetch(
+        `http://127.0.0.1:8000/user/notifications/count/${user.id}`
       );
-      
-      if (!res.ok) {
-        throw new Error(`HTTP ${res.status}: ${res.statusText}`);
+      if (!countRes.ok) {
+        throw new Error(`HTTP ${countRes.status}: ${countRes.statusText}`);
       }
+      const { unread_count } = await countRes.json();
+
+      // Check if there are new notifications
+      const newNotifications = page.notifications.filter((n: Notification) => 
+        !notifications.some(existing => existing.id === n.id)
+      );
       
-      const data = await res.json();
-      
-      if (data.error) {
-        console.error("API Error:", data.error);
-        setError(`Failed to load notifications: ${data.error}`);
-        return;
+      // Show browser notification for new updates
+      if (newNotifications.length > 0 && 'Notification' in window && notifications.length > 0) {
+        newNotifications.forEach((notification: Notification) => {
+          if (Notification.permission === 'granted') {
+            new Notification('Application Update', {
+              body: notification.message,
+              icon: '/favicon.ico'
+            });
+          }
+        });
       }
       
-      if (data.notifications) {
-        // Check if there are new notifications
-        const newNotifications = data.notifications.filter((n: Notification) => 
-          !notifications.some(existing => 
-            existing.timestamp === n.timestamp && existing.message === n.message
-          )
-        );
-        
-        // Show browser notification for new updates
-        if (newNotifications.length > 0 && 'Notification' in window && notifications.length > 0) {
-          newNotifications.forEach((notification: Notification) => {
-            if (Notification.permission === 'granted') {
-              new Notification('Application Update', {
-                body: notification.message,
-                icon: '/favicon.ico'
-              });
-            }
-          });
-        }
-        
-        setNotifications(data.notifications);
-        const unread = data.notifications.filter((n: Notification) => !n.read).length;
-        setUnreadCount(unread);
-      }
+      setNotifications(prev => {
+        if (!olderLoaded.current) return page.notifications;
+        // Keep the older pages already loaded below the refreshed first page
+        const ids = new Set(page.notifications.map(n => n.id));
+        return [...page.notifications, ...prev.filter(n => !ids.has(n.id))];
+      });
+      if (!olderLoaded.current) setOlderCursor(page.next_cursor);
+      setUnreadCount(unread_count);
     } catch (err) {
       console.error("Error fetching notifications:", err);
       setError(`Failed to load notifications: ${err.message}`);
@@ -122,6 +153,25 @@ const Dashboard = () => {
     }
   };
 
+  const loadOlderNotifications = async () => {
+    if (!user || !olderCursor) return;
+    setLoadingOlder(true);
+    try {
+      const page = await fetchNotificationPage(olderCursor);
+      olderLoaded.current = true;
+      setNotifications(prev => {
+        const ids = new Set(prev.map(n => n.id));
+        return [...prev, ...page.notifications.filter(n => !ids.has(n.id))];
+      });
+      setOlderCursor(page.next_cursor);
+    } catch (err) {
+      console.error("Error loading older notifications:", err);
+      setError(`Failed to load older notifications: ${err.message}`);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   // Request notification permission on component mount
   useEffect(() => {
     if ('Notification' in window && Notification.permission === 'default') {
@@ -413,9 +463,9 @@ const Dashboard = () => {
                     </div>
                   ) : (
                     <div className="max-h-80 overflow-y-auto">
-                      {notifications.map((notification, index) => (
+                      {notifications.map((notification) => (
                         <div
-                          key={index}
+                          key={notification.id}
                           className={`p-4 border-b last:border-b-0 ${
                             !notification.read ? 'bg-blue-50 border-blue-100' : 'bg-white'
                           }`}
@@ -454,6 +504,15 @@ const Dashboard = () => {
                           </div>
                         </div>
                       ))}
+                      {olderCursor && (
+                        <button
+                          onClick={loadOlderNotifications}
+                          disabled={loadingOlder}
+                          className="w-full p-3 text-sm text-blue-600 hover:bg-gray-50 disabled:text-gray-400"
+                        >
+                          {loadingOlder ? "Loading..." : "Load older notifications"}
+                        </button>
+                      )}
                     </div>
                   )}
                 </div>